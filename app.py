@@ -1,9 +1,29 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response, stream_with_context
 from flask_cors import CORS
+import json
+import time
 import pandas as pd
 
 # Importar el orquestador principal
-from orchestrator import run_all_scrapers
+from orchestrator import run_all_scrapers, stream_all_scrapers, SOURCE_TIMEOUT
+
+# Salud de cada fuente (circuit breaker)
+from health import get_source_health
+
+# Registro de distritos (nombre canónico de la zona pedida)
+from scrapers.zones import canonical_zone
+
+# Cache de resultados delante de los scrapers
+from cache import get_result_cache
+
+# Store persistente de anuncios
+from store import get_store, save_scraped
+
+# Jobs de scraping en segundo plano
+from jobs import get_job_manager, QueueFullError
+
+# Scheduler que precalienta las zonas populares
+from scheduler import record_zone_request, start_scheduler
 
 # Importar también los scrapers individuales por si quieres llamarlos por separado
 from scrapers.nestoria import scrape_nestoria
@@ -12,10 +32,22 @@ from scrapers.urbania import scrape_urbania
 from scrapers.properati import scrape_properati
 from scrapers.doomos import scrape_doomos
 
+# Pool de drivers de Chrome compartido por los scrapers de Selenium
+from scrapers.driver_pool import get_driver_pool
+from scrapers.images import get_image_cache
+from scrapers.common import ResultsBuffer, bind_results_buffer
+from scrapers.listing import public_frame
+
 # --- Inicialización de Flask ---
 app = Flask(__name__)
 CORS(app)  # Permite que React (desde otro puerto) llame a esta API
 
+# Precalentar drivers en segundo plano para sacar el arranque de Chromium del request
+get_driver_pool().warm_async()
+
+# Re-crawl periódico de todas las zonas (solo si SCHEDULER_ENABLED=1)
+start_scheduler()
+
 # Mapeo de strings a funciones de scraper
 SCRAPER_MAP = {
     "nestoria": scrape_nestoria,
@@ -27,7 +59,8 @@ SCRAPER_MAP = {
 
 def _get_params_from_request(req):
     """Función auxiliar para extraer parámetros de la URL."""
-    zona = req.args.get('zona', '')
+    # distrito canónico (sin acento, alias o con error de tipeo también): misma clave de cache y store
+    zona = canonical_zone(req.args.get('zona', ''))
     dormitorios = req.args.get('dormitorios', '0')
     banos = req.args.get('banos', '0')
     palabras_clave = req.args.get('palabras_clave', '')
@@ -47,6 +80,17 @@ def _get_params_from_request(req):
         "price_max": price_max
     }
 
+def _wants_refresh(req) -> bool:
+    """?refresh=1 fuerza un scrape en vivo ignorando la cache."""
+    return req.args.get('refresh', '').lower() in ('1', 'true', 'si', 'sí')
+
+def _add_metrics_headers(resp, metrics: dict):
+    """Métricas del scrape en vivo (engine por fuente, duración...). Vacío si se sirvió desde la cache."""
+    if metrics:
+        resp.headers["X-Scrape-Engines"] = ", ".join(f"{k}={v.get('engine', '?')}" for k, v in metrics.items())
+        resp.headers["X-Scrape-Metrics"] = json.dumps(metrics, separators=(",", ":"))
+    return resp
+
 # -------------------- API Endpoints --------------------
 
 @app.route('/scrape-all', methods=['GET'])
@@ -57,19 +101,77 @@ def handle_scrape_all():
     """
     params = _get_params_from_request(request)
     print(f"Recibida petición para /scrape-all con params: {params}")
+    record_zone_request(params["zona"])
 
     try:
-        # Ejecutar el orquestador
-        df = run_all_scrapers(**params)
-        
-        # Convertir el DataFrame a JSON
-        json_results = df.to_dict('records')
-        return jsonify(json_results)
+        # Ejecutar el orquestador (o servir desde la cache si la misma búsqueda ya se hizo)
+        metrics = {}
+        json_results, estado = get_result_cache().get_or_compute(
+            "all", params, lambda: run_all_scrapers(**params, metrics=metrics).to_dict('records'),
+            refresh=_wants_refresh(request)
+        )
+        resp = jsonify(json_results)
+        resp.headers["X-Cache"] = estado
+        return _add_metrics_headers(resp, metrics)
 
     except Exception as e:
         print(f"Error en el endpoint /scrape-all: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/scrape-all/stream', methods=['GET'])
+def handle_scrape_all_stream():
+    """
+    Igual que /scrape-all pero en NDJSON: los anuncios se envían por lotes a medida que
+    cada fuente los parsea (ya filtrados y sin duplicados), y al final una línea 'done'.
+    Ej: GET http://127.0.0.1:5001/scrape-all/stream?zona=miraflores
+    """
+    params = _get_params_from_request(request)
+    print(f"Recibida petición para /scrape-all/stream con params: {params}")
+    record_zone_request(params["zona"])
+    cache = get_result_cache()
+    cached = None if _wants_refresh(request) else cache.peek("all", params)
+
+    def _events():
+        if cached is not None:
+            for name in SCRAPER_MAP:
+                rows = [r for r in cached if r.get("fuente") == name]
+                if rows:
+                    yield {"event": "rows", "fuente": name, "resultados": rows}
+            yield {"event": "done", "total": len(cached), "cache": True}
+            return
+        records = []
+        by_link = {}
+        for ev in stream_all_scrapers(**params):
+            if ev["event"] == "rows":
+                for r in ev["resultados"]:
+                    r["links_alternativos"] = []
+                    by_link[r["link"]] = r
+                records.extend(ev["resultados"])
+                # igual que /scrape-all: el anuncio canónico lleva los links de las otras fuentes
+                for d in ev.get("duplicados", ()):
+                    if d["link"] in by_link:
+                        by_link[d["link"]]["links_alternativos"].append({"fuente": d["fuente"], "link": d["alternativo"]})
+            elif ev["event"] == "source":
+                # reflejar en lo cacheado las imágenes resueltas después de enviar
+                for r in records:
+                    if r["link"] in ev["imagenes"]:
+                        r["imagen_url"] = ev["imagenes"][r["link"]]
+            elif ev["event"] == "done":
+                cache.put("all", params, records)
+            yield ev
+
+    def _ndjson():
+        try:
+            for ev in _events():
+                yield json.dumps(ev, ensure_ascii=False, default=str) + "\n"
+        except Exception as e:
+            print(f"Error en el endpoint /scrape-all/stream: {e}")
+            yield json.dumps({"event": "error", "error": str(e)}) + "\n"
+
+    resp = Response(stream_with_context(_ndjson()), mimetype="application/x-ndjson")
+    resp.headers["X-Cache"] = "hit" if cached is not None else "miss"
+    return resp
+
 @app.route('/scrape/<source>', methods=['GET'])
 def handle_scrape_single(source: str):
     """
@@ -79,6 +181,7 @@ def handle_scrape_single(source: str):
     """
     params = _get_params_from_request(request)
     print(f"Recibida petición para /scrape/{source} con params: {params}")
+    record_zone_request(params["zona"])
     
     # Buscar la función de scraper en el mapeo
     scraper_function = SCRAPER_MAP.get(source.lower())
@@ -87,17 +190,103 @@ def handle_scrape_single(source: str):
         return jsonify({"error": f"Fuente '{source}' no encontrada. Fuentes válidas: {list(SCRAPER_MAP.keys())}"}), 404
 
     try:
-        # Ejecutar el scraper individual
-        df = scraper_function(**params)
-        
-        # Convertir el DataFrame a JSON
-        json_results = df.to_dict('records')
-        return jsonify(json_results)
+        # Ejecutar el scraper individual (o servir desde la cache)
+        metrics = {}
+        def _scrape():
+            buf = ResultsBuffer()
+            t0 = time.monotonic()
+            with bind_results_buffer(buf):
+                df = scraper_function(**params)
+            metrics[source.lower()] = dict(buf.metrics, status="ok", seconds=round(time.monotonic() - t0, 2), raw=len(df))
+            save_scraped(df, fuente=source.lower(), zona=params["zona"])
+            return public_frame(df).to_dict('records')
+
+        json_results, estado = get_result_cache().get_or_compute(
+            source.lower(), params, _scrape, refresh=_wants_refresh(request)
+        )
+        resp = jsonify(json_results)
+        resp.headers["X-Cache"] = estado
+        return _add_metrics_headers(resp, metrics)
 
     except Exception as e:
         print(f"Error en el endpoint /scrape/{source}: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/listings', methods=['GET'])
+def handle_listings():
+    """
+    Busca directamente en el store local de anuncios ya scrapeados (sin scrape en vivo).
+    Ej: GET http://127.0.0.1:5001/listings?zona=miraflores&dormitorios=2&price_max=3000
+    """
+    params = _get_params_from_request(request)
+    fuente = request.args.get('fuente', '').lower()
+    limit = request.args.get('limit', '500')
+    limit = int(limit) if limit.isdigit() else 500
+    try:
+        return jsonify(get_store().search(**params, fuente=fuente, limit=limit))
+    except Exception as e:
+        print(f"Error en el endpoint /listings: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/jobs', methods=['POST'])
+def handle_job_submit():
+    """
+    Lanza /scrape-all en segundo plano y devuelve el id del job al instante.
+    Ej: POST http://127.0.0.1:5001/jobs?zona=miraflores&dormitorios=2
+    """
+    params = _get_params_from_request(request)
+    print(f"Recibida petición para /jobs con params: {params}")
+    record_zone_request(params["zona"])
+    try:
+        job = get_job_manager().submit(params)
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify({
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "stream_url": f"/jobs/{job.id}/stream"
+    }), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def handle_job_status(job_id: str):
+    """Estado del job, estado por fuente y resultados parciales/finales."""
+    job = get_job_manager().get(job_id)
+    if not job:
+        return jsonify({"error": f"Job '{job_id}' no encontrado o expirado"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/stream', methods=['GET'])
+def handle_job_stream(job_id: str):
+    """Stream NDJSON: una línea por fuente en cuanto termina, y una línea final 'done'."""
+    job = get_job_manager().get(job_id)
+    if not job:
+        return jsonify({"error": f"Job '{job_id}' no encontrado o expirado"}), 404
+    return Response(stream_with_context(job.iter_ndjson()), mimetype="application/x-ndjson")
+
+@app.route('/health/sources', methods=['GET'])
+def handle_health_sources():
+    """
+    Salud de cada fuente: estado del circuito, tasa de éxito, latencias p50/p95 y el
+    timeout adaptativo que se le está aplicando.
+    """
+    return jsonify(get_source_health().snapshot(names=SCRAPER_MAP, default_timeout=SOURCE_TIMEOUT))
+
+@app.route('/imagenes', methods=['GET'])
+def handle_imagenes():
+    """
+    Devuelve las imágenes de detalle ya resueltas (para anuncios de Nestoria en modo "defer").
+    Ej: GET http://127.0.0.1:5001/imagenes?link=https://...&link=https://...
+    """
+    links = request.args.getlist('link')
+    if not links:
+        return jsonify({"error": "Falta el parámetro 'link'"}), 400
+    try:
+        return jsonify(get_image_cache().get_many(links))
+    except Exception as e:
+        print(f"Error en el endpoint /imagenes: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/', methods=['GET'])
 def index():
     """Endpoint de bienvenida para saber que la API está funcionando."""
@@ -105,9 +294,16 @@ def index():
         "message": "API de Scrapers está en funcionamiento.",
         "endpoints": {
             "/scrape-all": "Ejecuta todos los scrapers y combina resultados.",
-            "/scrape/<fuente>": "Ejecuta un scraper individual. Fuentes: [nestoria, infocasas, urbania, properati, doomos]"
+            "/scrape-all/stream": "Igual que /scrape-all, en NDJSON a medida que se parsea cada anuncio.",
+            "/scrape/<fuente>": "Ejecuta un scraper individual. Fuentes: [nestoria, infocasas, urbania, properati, doomos]",
+            "/imagenes?link=...": "Imágenes de detalle ya resueltas en segundo plano.",
+            "/health/sources": "Estado de cada fuente (circuit breaker, tasa de éxito, latencias).",
+            "/listings": "Busca en el store local de anuncios ya scrapeados (milisegundos).",
+            "POST /jobs": "Lanza una búsqueda en segundo plano y devuelve su job_id.",
+            "/jobs/<job_id>": "Estado y resultados parciales de un job.",
+            "/jobs/<job_id>/stream": "Resultados de cada fuente en NDJSON a medida que terminan."
         },
-        "query_params_opcionales": "?zona=...&dormitorios=...&banos=...&price_min=...&price_max=...&palabras_clave=..."
+        "query_params_opcionales": "?zona=...&dormitorios=...&banos=...&price_min=...&price_max=...&palabras_clave=...&refresh=1"
     })
 
 # --- Iniciar el servidor ---
@@ -0,0 +1,87 @@
+"""
+Chequeo offline de que la resolución de imágenes de Nestoria en modo "sync" entra en el
+timeout de la fuente con el rate limit de los detalles.
+
+    python -m benchmarks.bench_images                       # 200 anuncios, 0.3 s por detalle
+    python -m benchmarks.bench_images --links 400 --latency 1.0
+
+Simula los detalles con una sesión HTTP falsa (latencia fija, sin red) y usa el limiter real
+sobre un SQLite temporal. Sale con código 1 si resolve_images tarda más que IMAGE_SYNC_BUDGET
+(más un margen) o que SCRAPE_SOURCE_TIMEOUT.
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+
+# limiter y cache de imágenes en un directorio temporal (antes de importar los módulos)
+_TMP = tempfile.mkdtemp(prefix="bench_images_")
+os.environ.setdefault("RATE_LIMIT_PATH", os.path.join(_TMP, "ratelimit.sqlite"))
+os.environ.setdefault("IMAGE_CACHE_PATH", os.path.join(_TMP, "imagenes.sqlite"))
+
+from orchestrator import SOURCE_TIMEOUT
+from scrapers import images
+from scrapers.images import IMAGE_SYNC_BUDGET, IMAGE_FETCH_WORKERS, ImageCache, resolve_images
+from scrapers.ratelimit import RATE_LIMIT_DETAIL_RPS, RATE_LIMIT_DETAIL_BURST
+
+DETAIL_HTML = "<html><body><img data-element='main-swiper-slide' src='//img.nestoria.pe/{n}.jpg'></body></html>"
+SLACK = 5.0  # segundos sobre el presupuesto: la última tanda de requests en vuelo
+
+class _Response:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def raise_for_status(self):
+        pass
+
+class _FakeSession:
+    """session.get con latencia fija y el HTML de un detalle con imagen."""
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def get(self, url, timeout=None, **kwargs):
+        time.sleep(min(self.latency, timeout or self.latency))
+        return _Response(DETAIL_HTML.format(n=url.rsplit("/", 1)[-1]))
+
+def run(n_links: int = 200, latency: float = 0.3, budget: float = IMAGE_SYNC_BUDGET) -> dict:
+    session = _FakeSession(latency)
+    images._get_session = lambda: session
+    images._cache = ImageCache(os.path.join(_TMP, f"imagenes_{time.time_ns()}.sqlite"))
+    images.resolve_images_background = lambda links: None  # sin hilos sueltos en el chequeo
+    links = [f"https://www.nestoria.pe/detalle/{i}" for i in range(n_links)]
+    t0 = time.monotonic()
+    resolved = resolve_images(links, budget=budget)
+    elapsed = time.monotonic() - t0
+    return {
+        "links": n_links,
+        "latency": latency,
+        "budget": budget,
+        "source_timeout": SOURCE_TIMEOUT,
+        "rps": RATE_LIMIT_DETAIL_RPS,
+        "burst": RATE_LIMIT_DETAIL_BURST,
+        "workers": IMAGE_FETCH_WORKERS,
+        "resolved": sum(1 for v in resolved.values() if v),
+        "seconds": round(elapsed, 1),
+        "fits": elapsed <= min(budget + SLACK, SOURCE_TIMEOUT),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="¿Entra la resolución sync de imágenes en el timeout de la fuente?")
+    parser.add_argument("--links", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.3, help="segundos por detalle")
+    parser.add_argument("--budget", type=float, default=IMAGE_SYNC_BUDGET)
+    args = parser.parse_args(argv)
+
+    r = run(args.links, args.latency, args.budget)
+    print(f"{r['links']} detalles a {r['rps']:g} req/s (ráfaga {r['burst']:g}, {r['workers']} hilos, "
+          f"{r['latency']:g}s c/u): {r['resolved']} imágenes en {r['seconds']}s "
+          f"(presupuesto {r['budget']:g}s, timeout de la fuente {r['source_timeout']:g}s)")
+    print("🟢 entra en el timeout" if r["fits"] else "🔴 se pasa del presupuesto / timeout")
+    return 0 if r["fits"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+Benchmark offline del parseo de cada fuente contra snapshots HTML guardados.
+
+    python -m benchmarks.bench_parsing                      # todas las fuentes, imprime resumen
+    python -m benchmarks.bench_parsing --out antes.json     # guarda el resultado en JSON
+    python -m benchmarks.bench_parsing --compare antes.json # compara contra un JSON anterior
+
+Por cada fixture (benchmarks/fixtures/<fuente>*.html) mide anuncios/segundo, memoria pico
+(tracemalloc) y el tiempo total por selector CSS (select / select_one de BeautifulSoup).
+No abre navegador ni hace requests.
+"""
+import os
+import sys
+import json
+import glob
+import time
+import platform
+import argparse
+import statistics
+import subprocess
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+import bs4
+from bs4.element import Tag
+
+from scrapers.common import HTML_PARSER
+from scrapers.nestoria import parse_nestoria_html
+from scrapers.infocasas import parse_infocasas_html
+from scrapers.urbania import parse_urbania_html
+from scrapers.properati import parse_properati_html
+from scrapers.doomos import parse_doomos_html
+
+from benchmarks.fixtures import FIXTURES_DIR
+
+PARSERS = {
+    "nestoria": parse_nestoria_html,
+    "infocasas": parse_infocasas_html,
+    "urbania": parse_urbania_html,
+    "properati": parse_properati_html,
+    "doomos": parse_doomos_html,
+}
+
+@contextmanager
+def _quiet():
+    """Silencia los print de los parsers (p.ej. Doomos) mientras se mide."""
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+@contextmanager
+def _selector_timer(stats):
+    """Envuelve Tag.select / Tag.select_one y acumula llamadas y segundos por selector."""
+    orig_select, orig_select_one = Tag.select, Tag.select_one
+
+    def _wrap(orig, kind):
+        def timed(self, selector, *args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return orig(self, selector, *args, **kwargs)
+            finally:
+                s = stats[f"{kind} {selector}"]
+                s["calls"] += 1
+                s["seconds"] += time.perf_counter() - t0
+        return timed
+
+    Tag.select = _wrap(orig_select, "select")
+    Tag.select_one = _wrap(orig_select_one, "select_one")
+    try:
+        yield stats
+    finally:
+        Tag.select, Tag.select_one = orig_select, orig_select_one
+
+def bench_fixture(source: str, path: str, runs: int = 5) -> dict:
+    parse = PARSERS[source]
+    with open(path, encoding="utf-8") as f:
+        html = f.read()
+
+    with _quiet():
+        # calentamiento (imports perezosos de soupsieve, caches de regex)
+        count = len(parse(html))
+        # throughput
+        times = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            parse(html)
+            times.append(time.perf_counter() - t0)
+        # memoria pico (pasada aparte: tracemalloc enlentece mucho)
+        tracemalloc.start()
+        parse(html)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # tiempo por selector (pasada aparte: el wrapper agrega overhead)
+        stats = defaultdict(lambda: {"calls": 0, "seconds": 0.0})
+        with _selector_timer(stats):
+            parse(html)
+
+    median = statistics.median(times)
+    selectors = {
+        sel: {"calls": s["calls"], "ms": round(s["seconds"] * 1000, 3)}
+        for sel, s in sorted(stats.items(), key=lambda kv: -kv[1]["seconds"])
+    }
+    return {
+        "source": source,
+        "fixture": os.path.basename(path),
+        "bytes": len(html.encode("utf-8")),
+        "listings": count,
+        "runs": runs,
+        "median_ms": round(median * 1000, 3),
+        "min_ms": round(min(times) * 1000, 3),
+        "listings_per_sec": round(count / median, 1) if median > 0 else None,
+        "peak_memory_kb": round(peak / 1024, 1),
+        "selectors": selectors,
+    }
+
+def _git_commit():
+    try:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=root,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+def run(sources=None, runs: int = 5, fixtures_dir: str = FIXTURES_DIR) -> dict:
+    results = []
+    for source in sources or PARSERS:
+        if source not in PARSERS:
+            print(f"⚠️ Fuente desconocida: {source}")
+            continue
+        paths = sorted(glob.glob(os.path.join(fixtures_dir, f"{source}*.html")))
+        if not paths:
+            print(f"⚠️ Sin fixtures para {source} en {fixtures_dir}")
+            continue
+        for path in paths:
+            results.append(bench_fixture(source, path, runs=runs))
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "bs4": bs4.__version__,
+            "parser": HTML_PARSER,
+            "runs": runs,
+        },
+        "results": results,
+    }
+
+def _print_summary(report: dict, top: int = 3):
+    print(f"{'fixture':<28}{'anuncios':>9}{'ms (med)':>11}{'anuncios/s':>12}{'pico KB':>10}")
+    for r in report["results"]:
+        print(f"{r['fixture']:<28}{r['listings']:>9}{r['median_ms']:>11.2f}{r['listings_per_sec'] or 0:>12.1f}{r['peak_memory_kb']:>10.1f}")
+        for sel, s in list(r["selectors"].items())[:top]:
+            print(f"    {s['ms']:>9.2f} ms  {s['calls']:>5}x  {sel}")
+
+def _print_compare(report: dict, baseline: dict):
+    base = {r["fixture"]: r for r in baseline.get("results", [])}
+    print(f"\nComparación contra {baseline.get('meta', {}).get('commit') or 'baseline'}:")
+    for r in report["results"]:
+        b = base.get(r["fixture"])
+        if not b or not b.get("median_ms"):
+            continue
+        delta = (r["median_ms"] - b["median_ms"]) / b["median_ms"] * 100
+        mem = r["peak_memory_kb"] - b["peak_memory_kb"]
+        flag = "🔴" if delta > 10 else ("🟢" if delta < -10 else "⚪")
+        count = "" if r["listings"] == b["listings"] else f"  (anuncios {b['listings']} -> {r['listings']})"
+        print(f"{flag} {r['fixture']:<28}{b['median_ms']:>9.2f} -> {r['median_ms']:>9.2f} ms ({delta:+.1f}%)  memoria {mem:+.1f} KB{count}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline del parseo de cada fuente")
+    parser.add_argument("sources", nargs="*", help=f"fuentes a medir (por defecto todas: {', '.join(PARSERS)})")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--out", default=None, help="archivo JSON de salida")
+    parser.add_argument("--compare", default=None, help="JSON de una corrida anterior para comparar")
+    args = parser.parse_args(argv)
+
+    report = run(args.sources or None, runs=args.runs, fixtures_dir=args.fixtures)
+    _print_summary(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 {args.out}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            _print_compare(report, json.load(f))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""
+Fixtures HTML para el benchmark de parseo.
+
+    python -m benchmarks.fixtures generate            # snapshots sintéticos (deterministas)
+    python -m benchmarks.fixtures record urbania --zona miraflores   # snapshot real con Selenium
+
+Los snapshots sintéticos imitan la estructura que esperan los parse_*_html de cada fuente.
+Los grabados con `record` se guardan con otro nombre y el benchmark los toma igual
+(todo archivo fixtures/<fuente>*.html).
+"""
+import os
+import sys
+import random
+import argparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+ZONAS = ["Miraflores", "San Isidro", "Barranco", "Surquillo", "Jesús María", "Lince", "San Borja", "Magdalena del Mar"]
+TIPOS = ["Departamento", "Casa", "Dúplex", "Flat", "Mini departamento"]
+EXTRAS = ["con vista al mar", "amoblado", "cerca al parque", "con cochera", "pet friendly", "estreno", "con terraza"]
+
+def _anuncio(rnd: random.Random, i: int) -> dict:
+    usd = rnd.random() < 0.2
+    return {
+        "id": 10000 + i,
+        "titulo": f"{rnd.choice(TIPOS)} en {rnd.choice(ZONAS)} {rnd.choice(EXTRAS)}",
+        "precio": f"US$ {rnd.randint(4, 30) * 100:,}" if usd else f"S/ {rnd.randint(8, 90) * 100:,}".replace(",", "."),
+        "dorms": rnd.randint(1, 4),
+        "banos": rnd.randint(1, 3),
+        "m2": rnd.randint(35, 250),
+        "zona": rnd.choice(ZONAS),
+        "descripcion": " ".join(rnd.choice(EXTRAS) for _ in range(12)).capitalize() + ".",
+    }
+
+def _page(body: str, title: str) -> str:
+    # relleno típico de una página real (header, scripts, footer) para que el parseo no sea trivial
+    scripts = "\n".join(f"<script>window.__d{i} = {{'k': {i}, 'v': '{'x' * 200}'}};</script>" for i in range(20))
+    nav = "".join(f"<li><a href='/menu/{i}'>Menú {i}</a></li>" for i in range(40))
+    return (f"<!DOCTYPE html><html lang='es'><head><meta charset='utf-8'><title>{title}</title>{scripts}</head>"
+            f"<body><header><nav><ul>{nav}</ul></nav></header><main>{body}</main>"
+            f"<footer><p>Términos y condiciones</p></footer></body></html>")
+
+def nestoria_html(rnd, n):
+    items = []
+    for i in range(n):
+        a = _anuncio(rnd, i)
+        items.append(f"""
+<li class="rating__new">
+  <a class="results__link" data-href="/detalle/{a['id']}" href="#">
+    <div class="listing__title"><span class="listing__title__text">{a['titulo']}</span></div>
+    <div class="result__details__price"><span>{a['precio']}</span></div>
+    <ul class="result__summary__list"><li>{a['dorms']} dormitorios</li><li>{a['banos']} baños</li><li>{a['m2']} m²</li></ul>
+    <p class="listing__description">{a['descripcion']}</p>
+  </a>
+</li>""")
+    body = f"<div class='listing__header'><h1>{n} resultados</h1></div><ul id='main__listing_res'>{''.join(items)}</ul>"
+    return _page(body, "Nestoria - Alquiler")
+
+def infocasas_html(rnd, n):
+    items = []
+    for i in range(n):
+        a = _anuncio(rnd, i)
+        items.append(f"""
+<div class="listingCard">
+  <a href="/inmueble/{a['id']}">
+    <div class="cardImageGallery"><div class="gallery-image"><img src="//cdn.infocasas.com.pe/{a['id']}.jpg"></div></div>
+    <h2 class="lc-title">{a['titulo']}</h2>
+  </a>
+  <div class="lc-price"><p class="main-price">{a['precio']}</p></div>
+  <strong class="lc-location">{a['zona']}, Lima</strong>
+  <div class="lc-typologyTag">
+    <span class="lc-typologyTag__item"><strong>{a['dorms']} Dorm.</strong></span>
+    <span class="lc-typologyTag__item"><strong>{a['banos']} Baños</strong></span>
+    <span class="lc-typologyTag__item"><strong>{a['m2']} m²</strong></span>
+  </div>
+  <p class="lc-description">{a['descripcion']}</p>
+</div>""")
+    return _page(f"<section class='listings'>{''.join(items)}</section>", "InfoCasas - Alquiler")
+
+def urbania_html(rnd, n):
+    span = "postingMainFeatures-module__posting-main-features-span"
+    items = []
+    for i in range(n):
+        a = _anuncio(rnd, i)
+        items.append(f"""
+<div data-qa="posting PROPERTY" class="postingCard-module__posting">
+  <img src="https://imgar.zonapropcdn.com/avisos/{a['id']}.jpg">
+  <div class="postingPrices-module__price">{a['precio']}</div>
+  <h3><a href="/propiedades/{a['id']}.html">{a['titulo']}</a></h3>
+  <div class="postingMainFeatures-module__posting-main-features">
+    <span class="{span}">{a['m2']} m² tot.</span>
+    <span class="{span}">{a['dorms']} dorm.</span>
+    <span class="{span}">{a['banos']} baños</span>
+  </div>
+  <p>{a['zona']}, Lima. {a['descripcion']}</p>
+</div>""")
+    return _page(f"<div class='postings-container'>{''.join(items)}</div>", "Urbania - Alquiler")
+
+def properati_html(rnd, n):
+    items = []
+    for i in range(n):
+        a = _anuncio(rnd, i)
+        items.append(f"""
+<article class="snippet">
+  <a class="title" href="/detalle/{a['id']}">{a['titulo']}</a>
+  <img src="https://img.properati.com/{a['id']}.jpg">
+  <div class="price">{a['precio']}</div>
+  <div class="properties">
+    <span class="properties__bedrooms">{a['dorms']} dormitorios</span>
+    <span class="properties__bathrooms">{a['banos']} baños</span>
+    <span class="properties__area">{a['m2']} m²</span>
+  </div>
+  <div class="location">{a['zona']}, Lima</div>
+</article>""")
+    return _page(f"<div class='results'>{''.join(items)}</div>", "Properati - Alquiler")
+
+def doomos_html(rnd, n):
+    items = []
+    for i in range(n):
+        a = _anuncio(rnd, i)
+        items.append(f"""
+<div class="content_result">
+  <img class="content_result_image" src="//img.doomos.com.pe/{a['id']}.jpg">
+  <div class="content_result_titulo"><a href="/de/{a['id']}">{a['titulo']}</a></div>
+  <div class="content_result_precio">{a['precio']} · {a['dorms']} hab. · {a['banos']} baños · {a['m2']} m2</div>
+  <div class="content_result_descripcion">{a['descripcion']}</div>
+</div>""")
+    return _page(f"<div id='results'>{''.join(items)}</div>", "Doomos - Alquiler")
+
+GENERATORS = {
+    "nestoria": nestoria_html,
+    "infocasas": infocasas_html,
+    "urbania": urbania_html,
+    "properati": properati_html,
+    "doomos": doomos_html,
+}
+
+def generate(n: int = 40, seed: int = 1234):
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for name, gen in GENERATORS.items():
+        path = os.path.join(FIXTURES_DIR, f"{name}.html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(gen(random.Random(f"{seed}-{name}"), n))
+        print(f"📝 {path}")
+
+def record(source: str, zona: str = "", out: str = None):
+    """Graba el HTML real de la primera página de una fuente (requiere Chrome)."""
+    from scrapers.common import Readiness, wait_until_ready
+    from scrapers.driver_pool import acquire_driver, release_driver
+    from scrapers.nestoria import build_nestoria_url, NESTORIA_READY
+    from scrapers.infocasas import build_infocasas_url, INFOCASAS_CARDS
+    from scrapers.urbania import build_urbania_url, URBANIA_CARDS
+    from scrapers.properati import build_properati_url
+    from scrapers.doomos import build_doomos_url, DOOMOS_READY
+
+    if source == "properati":
+        # Properati se scrapea por HTTP, no hace falta navegador
+        import requests
+        html = requests.get(build_properati_url(zona=zona), headers={"User-Agent": "Mozilla/5.0"}, timeout=20).text
+    else:
+        url, readiness = {
+            "nestoria": (build_nestoria_url(zona=zona), NESTORIA_READY),
+            "infocasas": (build_infocasas_url(zona=zona), Readiness(INFOCASAS_CARDS, timeout=8, max_scrolls=8, settle=0.6)),
+            "urbania": (build_urbania_url(zona=zona), Readiness(URBANIA_CARDS, timeout=12, max_scrolls=8, settle=1.5)),
+            "doomos": (build_doomos_url(zona=zona), DOOMOS_READY),
+        }[source]
+        driver = acquire_driver()
+        try:
+            driver.get(url)
+            wait_until_ready(driver, readiness)
+            html = driver.page_source
+        finally:
+            release_driver(driver)
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    out = out or os.path.join(FIXTURES_DIR, f"{source}_recorded.html")
+    with open(out, "w", encoding="utf-8") as f:
+        f.write(html)
+    print(f"📝 {out} ({len(html)} bytes)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera o graba fixtures HTML para el benchmark de parseo")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    g = sub.add_parser("generate")
+    g.add_argument("--n", type=int, default=40, help="anuncios por página")
+    g.add_argument("--seed", type=int, default=1234)
+    r = sub.add_parser("record")
+    r.add_argument("source", choices=sorted(GENERATORS))
+    r.add_argument("--zona", default="")
+    r.add_argument("--out", default=None)
+    args = parser.parse_args(argv)
+    if args.cmd == "generate":
+        generate(args.n, args.seed)
+    else:
+        record(args.source, args.zona, args.out)
+
+if __name__ == "__main__":
+    sys.exit(main())
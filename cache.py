@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from scrapers.common import normalize_text, DATA_DIR
+
+# -------------------- Cache de resultados --------------------
+# Configuración (se puede sobreescribir por variables de entorno)
+CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "memory")        # "memory" o "sqlite" (compartido entre workers)
+CACHE_PATH = os.getenv("RESULT_CACHE_PATH", os.path.join(DATA_DIR, "resultados.sqlite"))
+CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_DEFAULT_TTL = int(os.getenv("RESULT_CACHE_TTL", "900"))      # segundos "frescos"
+CACHE_STALE_TTL = int(os.getenv("RESULT_CACHE_STALE_TTL", "3600"))  # segundos extra sirviendo stale mientras se revalida
+CACHE_EMPTY_TTL = int(os.getenv("RESULT_CACHE_EMPTY_TTL", "60"))    # resultados vacíos (posible fallo de la fuente)
+
+# TTL por fuente; "all" es /scrape-all (usa el menor de todas las fuentes)
+SOURCE_TTL = {
+    "nestoria": 1800,
+    "infocasas": CACHE_DEFAULT_TTL,
+    "urbania": CACHE_DEFAULT_TTL,
+    "properati": CACHE_DEFAULT_TTL,
+    "doomos": 1800,
+}
+
+def ttl_for(source: str) -> int:
+    if source == "all":
+        return min(SOURCE_TTL.values())
+    return SOURCE_TTL.get(source, CACHE_DEFAULT_TTL)
+
+def normalize_query(params: dict) -> dict:
+    """Normaliza los parámetros de _get_params_from_request para usarlos como clave."""
+    def _int_str(v):
+        v = str(v or "").strip()
+        return v if v.isdigit() and v != "0" else "0"
+    zona = " ".join(normalize_text(params.get("zona") or "").split())
+    palabras = " ".join(normalize_text(params.get("palabras_clave") or "").split())
+    return {
+        "zona": zona,
+        "dormitorios": _int_str(params.get("dormitorios")),
+        "banos": _int_str(params.get("banos")),
+        "palabras_clave": palabras,
+        "price_min": params.get("price_min"),
+        "price_max": params.get("price_max"),
+    }
+
+def make_key(namespace: str, params: dict) -> str:
+    return namespace + ":" + json.dumps(normalize_query(params), sort_keys=True)
+
+class MemoryBackend:
+    """LRU en memoria con presupuesto en bytes (uno por proceso)."""
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # key -> (payload, fresh_until, stale_until)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, payload: bytes, fresh_until: float, stale_until: float):
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+            self._data[key] = (payload, fresh_until, stale_until)
+            self._bytes += len(payload)
+            while self._bytes > self.max_bytes and self._data:
+                _, (p, _, _) = self._data.popitem(last=False)
+                self._bytes -= len(p)
+
+class SQLiteBackend:
+    """Cache en disco compartida por los workers de gunicorn, con LRU por último acceso."""
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS resultados (
+                key TEXT PRIMARY KEY, payload BLOB, size INTEGER,
+                fresh_until REAL, stale_until REAL, last_access REAL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_resultados_access ON resultados(last_access)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute("SELECT payload, fresh_until, stale_until FROM resultados WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE resultados SET last_access = ? WHERE key = ?", (time.time(), key))
+            return (bytes(row[0]), row[1], row[2])
+
+    def set(self, key, payload: bytes, fresh_until: float, stale_until: float):
+        if len(payload) > self.max_bytes:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM resultados WHERE stale_until < ?", (now,))
+            conn.execute("INSERT OR REPLACE INTO resultados VALUES (?, ?, ?, ?, ?, ?)",
+                         (key, payload, len(payload), fresh_until, stale_until, now))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM resultados").fetchone()[0]
+            if total > self.max_bytes:
+                # borrar los menos usados hasta quedar dentro del presupuesto
+                excess = total - self.max_bytes
+                for k, size in conn.execute("SELECT key, size FROM resultados ORDER BY last_access ASC").fetchall():
+                    if excess <= 0:
+                        break
+                    if k == key:
+                        continue
+                    conn.execute("DELETE FROM resultados WHERE key = ?", (k,))
+                    excess -= size
+
+class ResultCache:
+    """
+    Cache de resultados delante de run_all_scrapers / SCRAPER_MAP.
+    - TTL por fuente y stale-while-revalidate (sirve lo viejo y refresca en segundo plano)
+    - coalescing: peticiones idénticas concurrentes comparten un solo scrape en curso
+    """
+    def __init__(self, backend=None, stale_ttl: int = CACHE_STALE_TTL, empty_ttl: int = CACHE_EMPTY_TTL):
+        self.backend = backend or MemoryBackend()
+        self.stale_ttl = stale_ttl
+        self.empty_ttl = empty_ttl
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _store(self, key, records, ttl):
+        if not records:
+            ttl = min(ttl, self.empty_ttl)
+        now = time.time()
+        try:
+            payload = json.dumps(records, ensure_ascii=False, default=str).encode("utf-8")
+            self.backend.set(key, payload, now + ttl, now + ttl + self.stale_ttl)
+        except Exception as e:
+            print(f"Error guardando en cache: {e}")
+
+    def _compute_shared(self, key, compute, ttl):
+        """Ejecuta compute() una sola vez por clave aunque lleguen varias peticiones a la vez."""
+        with self._lock:
+            fut = self._inflight.get(key)
+            owner = fut is None
+            if owner:
+                fut = Future()
+                self._inflight[key] = fut
+        if not owner:
+            return fut.result(), "coalesced"
+        try:
+            records = compute()
+            self._store(key, records, ttl)
+            fut.set_result(records)
+            return records, "miss"
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _revalidate_async(self, key, compute, ttl):
+        with self._lock:
+            if key in self._inflight:
+                return
+        def _run():
+            try:
+                self._compute_shared(key, compute, ttl)
+            except Exception as e:
+                print(f"Error revalidando cache ({key}): {e}")
+        threading.Thread(target=_run, daemon=True, name="cache-revalidate").start()
+
+    def peek(self, namespace: str, params: dict, fresh_only: bool = False):
+        """Devuelve los records en cache (frescos o stale, salvo `fresh_only`) sin disparar un scrape, o None."""
+        try:
+            entry = self.backend.get(make_key(namespace, params))
+        except Exception as e:
+            print(f"Error leyendo cache: {e}")
+            return None
+        if entry is None or time.time() > entry[1 if fresh_only else 2]:
+            return None
+        return json.loads(entry[0])
+
+    def put(self, namespace: str, params: dict, records, ttl: int = None):
+        self._store(make_key(namespace, params), records, ttl_for(namespace) if ttl is None else ttl)
+
+    def get_or_compute(self, namespace: str, params: dict, compute, ttl: int = None, refresh: bool = False):
+        """Devuelve (records, estado) con estado en hit / stale / miss / coalesced."""
+        key = make_key(namespace, params)
+        ttl = ttl_for(namespace) if ttl is None else ttl
+        if not refresh:
+            try:
+                entry = self.backend.get(key)
+            except Exception as e:
+                print(f"Error leyendo cache: {e}")
+                entry = None
+            if entry is not None:
+                payload, fresh_until, stale_until = entry
+                now = time.time()
+                if now <= fresh_until:
+                    return json.loads(payload), "hit"
+                if now <= stale_until:
+                    self._revalidate_async(key, compute, ttl)
+                    return json.loads(payload), "stale"
+        return self._compute_shared(key, compute, ttl)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_result_cache() -> ResultCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            backend = SQLiteBackend() if CACHE_BACKEND == "sqlite" else MemoryBackend()
+            _cache = ResultCache(backend=backend)
+        return _cache
@@ -0,0 +1,246 @@
+import os
+import re
+import zlib
+import threading
+from io import BytesIO
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+from scrapers.common import normalize_text, parse_precio_con_moneda, _extract_int_from_text
+from scrapers.fetch import get_http_session
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow es opcional: sin él no se usan hashes de imagen
+    Image = None
+
+# -------------------- Duplicados entre fuentes --------------------
+# El mismo departamento publicado en varias fuentes (link distinto, título parecido, mismos números).
+# Cada anuncio se resume en una huella (precio, m², dormitorios, baños, zona, MinHash del texto y,
+# opcionalmente, dHash de la imagen); los candidatos salen de buckets LSH, así que el costo es
+# ~lineal en el número de anuncios y nunca se comparan todos contra todos.
+# Configuración (se puede sobreescribir por variables de entorno)
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") not in ("0", "false", "False")
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.5"))        # similitud de texto (Jaccard estimada) mínima
+DEDUP_WEAK_THRESHOLD = float(os.getenv("DEDUP_WEAK_THRESHOLD", "0.2"))  # mínima cuando además coinciden precio, m² y dormitorios
+DEDUP_PRICE_TOL = float(os.getenv("DEDUP_PRICE_TOL", "0.05"))       # diferencia relativa de precio tolerada
+DEDUP_M2_TOL = float(os.getenv("DEDUP_M2_TOL", "0.10"))             # diferencia relativa de m² tolerada
+DEDUP_MAX_BUCKET = int(os.getenv("DEDUP_MAX_BUCKET", "50"))         # buckets más grandes no generan candidatos nuevos
+DEDUP_IMAGE_HASH = os.getenv("DEDUP_IMAGE_HASH", "0") in ("1", "true", "True")  # descarga las imágenes (requiere Pillow)
+DEDUP_IMAGE_MAX = int(os.getenv("DEDUP_IMAGE_MAX", "300"))          # imágenes a hashear como máximo por llamada
+DEDUP_IMAGE_TIMEOUT = float(os.getenv("DEDUP_IMAGE_TIMEOUT", "5"))
+DEDUP_IMAGE_MAX_DIST = 6                                            # bits distintos (de 64) para "misma foto"
+
+_NUM_PERM = 32        # funciones de hash del MinHash
+_BANDS = 8            # bandas LSH (4 filas cada una): ~50% de Jaccard ya cae en un bucket común con alta probabilidad
+_ROWS = _NUM_PERM // _BANDS
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240611)
+_A = _rng.integers(1, _PRIME, size=(_NUM_PERM, 1), dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, size=(_NUM_PERM, 1), dtype=np.uint64)
+_RE_NON_WORD = re.compile(r"[^a-z0-9]+")
+_SHINGLE = 5
+
+def text_signature(text: str) -> np.ndarray:
+    """MinHash (32 enteros) de los 5-gramas de caracteres del texto normalizado."""
+    text = _RE_NON_WORD.sub(" ", normalize_text(text or "")).strip()
+    if len(text) <= _SHINGLE:
+        shingles = {text}
+    else:
+        shingles = {text[i:i + _SHINGLE] for i in range(len(text) - _SHINGLE + 1)}
+    x = np.fromiter((zlib.crc32(s.encode()) % _PRIME for s in shingles), dtype=np.uint64, count=len(shingles))
+    return ((_A * x + _B) % _PRIME).min(axis=1).astype(np.uint32)
+
+def _num(v) -> Optional[int]:
+    if v is None or v != v or v == "":
+        return None
+    if isinstance(v, (int, float)):
+        return int(v)
+    return _extract_int_from_text(v)
+
+def _close(a, b, tol) -> bool:
+    return abs(a - b) <= tol * max(a, b, 1)
+
+class Fingerprint:
+    """Lo que se compara de un anuncio: números normalizados, zona, firma del texto y hash de imagen."""
+    __slots__ = ("fuente", "moneda", "precio", "m2", "dormitorios", "banos", "zona", "sig", "img")
+
+    def __init__(self, row, image_hash: Optional[int] = None):
+        get = row.get
+        self.fuente = get("fuente") or ""
+        self.moneda, self.precio = parse_precio_con_moneda(get("precio"))
+        self.m2 = _num(get("m2"))
+        self.dormitorios = _num(get("dormitorios"))
+        self.banos = _num(get("baños"))
+        self.zona = " ".join(normalize_text(get("zona") or "").split())
+        self.sig = text_signature(f"{get('titulo') or ''} {(get('descripcion') or '')[:300]}")
+        self.img = image_hash
+
+    def bucket_keys(self):
+        """Claves LSH: una por banda del MinHash, los números exactos y las 4 partes del dHash."""
+        keys = [(b, self.sig[b * _ROWS:(b + 1) * _ROWS].tobytes()) for b in range(_BANDS)]
+        if self.precio is not None and self.m2 is not None:
+            keys.append(("num", self.zona, self.moneda, self.precio, self.m2, self.dormitorios, self.banos))
+        if self.img is not None:
+            keys += [("img", i, (self.img >> (16 * i)) & 0xFFFF) for i in range(4)]
+        return keys
+
+    def same_listing(self, other: "Fingerprint") -> bool:
+        """
+        Números compatibles y (texto parecido, misma foto o mismos precio, m² y dormitorios
+        con al menos algo de texto en común: "S/ 2 500, 80 m²" solo no alcanza).
+        """
+        if self.fuente and self.fuente == other.fuente:
+            return False  # solo duplicados entre fuentes distintas
+        if self.zona and other.zona and self.zona != other.zona:
+            return False
+        for a, b in ((self.dormitorios, other.dormitorios), (self.banos, other.banos)):
+            if a is not None and b is not None and a != b:
+                return False
+        same_price = None
+        if self.precio is not None and other.precio is not None:
+            if self.moneda != other.moneda:
+                return False
+            same_price = _close(self.precio, other.precio, DEDUP_PRICE_TOL)
+            if not same_price:
+                return False
+        if self.m2 is not None and other.m2 is not None and not _close(self.m2, other.m2, DEDUP_M2_TOL):
+            return False
+        if self.img is not None and other.img is not None and bin(self.img ^ other.img).count("1") <= DEDUP_IMAGE_MAX_DIST:
+            return True
+        similarity = float(np.mean(self.sig == other.sig))
+        if similarity >= DEDUP_THRESHOLD:
+            return True
+        return (bool(same_price) and self.m2 is not None and self.m2 == other.m2
+                and self.dormitorios is not None and self.dormitorios == other.dormitorios
+                and similarity >= DEDUP_WEAK_THRESHOLD)
+
+class DedupIndex:
+    """
+    Índice incremental de duplicados: add(row) devuelve la posición del anuncio canónico
+    (el primero agregado de su grupo) si el nuevo es un duplicado, o None si es nuevo.
+    """
+    def __init__(self, max_bucket: int = DEDUP_MAX_BUCKET):
+        self.max_bucket = max_bucket
+        self._fps = []
+        self._parent = []
+        self._sources = {}  # canónico -> fuentes del grupo (un anuncio por fuente en cada grupo)
+        self._buckets = defaultdict(list)
+
+    def __len__(self):
+        return len(self._fps)
+
+    def find(self, i: int) -> int:
+        parent = self._parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def _union(self, i: int, j: int):
+        ri, rj = self.find(i), self.find(j)
+        if ri == rj or self._sources[ri] & self._sources[rj]:
+            return
+        # el canónico es siempre el más antiguo
+        root, child = min(ri, rj), max(ri, rj)
+        self._parent[child] = root
+        self._sources[root] |= self._sources.pop(child)
+
+    def add(self, row, image_hash: Optional[int] = None) -> Optional[int]:
+        fp = Fingerprint(row, image_hash)
+        i = len(self._fps)
+        self._fps.append(fp)
+        self._parent.append(i)
+        self._sources[i] = {fp.fuente}
+        candidates = set()
+        for key in fp.bucket_keys():
+            bucket = self._buckets[key]
+            candidates.update(bucket)
+            if len(bucket) < self.max_bucket:
+                bucket.append(i)
+        for j in sorted(candidates):
+            if self.find(j) != self.find(i) and fp.same_listing(self._fps[j]):
+                self._union(i, j)
+        root = self.find(i)
+        return root if root != i else None
+
+    def groups(self) -> dict:
+        """{canónico: [posiciones de sus duplicados]} solo para los grupos con más de un anuncio."""
+        out = defaultdict(list)
+        for i in range(len(self._fps)):
+            root = self.find(i)
+            if root != i:
+                out[root].append(i)
+        return dict(out)
+
+# -------------------- Hash perceptual de imágenes (opcional) --------------------
+_image_hashes = {}
+_image_lock = threading.Lock()
+
+def _dhash(data: bytes) -> Optional[int]:
+    """dHash de 64 bits: gradiente horizontal de la imagen en gris reducida a 9x8."""
+    try:
+        img = Image.open(BytesIO(data)).convert("L").resize((9, 8))
+    except Exception:
+        return None
+    px = list(img.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return bits
+
+def _fetch_hash(url: str) -> Optional[int]:
+    try:
+        r = get_http_session().get(url, timeout=DEDUP_IMAGE_TIMEOUT)
+        return _dhash(r.content) if r.status_code == 200 else None
+    except Exception:
+        return None
+
+def image_hashes(urls, max_workers: int = 8) -> dict:
+    """{url: dHash} de las imágenes (en paralelo, con cache en memoria). Vacío si está desactivado."""
+    if not DEDUP_IMAGE_HASH or Image is None:
+        return {}
+    urls = [u for u in dict.fromkeys(urls) if u and u.startswith("http")]
+    with _image_lock:
+        known = {u: _image_hashes[u] for u in urls if u in _image_hashes}
+    missing = [u for u in urls if u not in known][:DEDUP_IMAGE_MAX]
+    if missing:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dhash") as ex:
+            fetched = dict(zip(missing, ex.map(_fetch_hash, missing)))
+        with _image_lock:
+            if len(_image_hashes) > 20000:
+                _image_hashes.clear()
+            _image_hashes.update(fetched)
+        known.update(fetched)
+    return {u: h for u, h in known.items() if h is not None}
+
+# -------------------- Sobre el DataFrame combinado --------------------
+def collapse_duplicates(df, zona: str = ""):
+    """
+    Deja un anuncio por grupo de duplicados entre fuentes (el primero, en el orden de SCRAPERS)
+    y le agrega "links_alternativos": [{"fuente", "link"}] con los demás.
+    """
+    if not DEDUP_ENABLED or df is None or len(df) < 2:
+        return df
+    records = df.to_dict('records')
+    hashes = image_hashes(r.get("imagen_url") for r in records)
+    index = DedupIndex()
+    for r in records:
+        if zona and not r.get("zona"):
+            r["zona"] = zona
+        index.add(r, hashes.get(r.get("imagen_url")))
+    groups = index.groups()
+    dup = {i for members in groups.values() for i in members}
+    keep = [i for i in range(len(records)) if i not in dup]
+    out = df.iloc[keep].reset_index(drop=True)
+    out["links_alternativos"] = [
+        [{"fuente": records[j].get("fuente", ""), "link": records[j].get("link", "")} for j in groups.get(i, [])]
+        for i in keep
+    ]
+    if dup:
+        print(f"Duplicados entre fuentes: {len(dup)} anuncios agrupados en {len(groups)}")
+    return out
@@ -0,0 +1,21 @@
+# Configuración de Gunicorn (se carga automáticamente desde el directorio de trabajo).
+# Los argumentos del Procfile / Dockerfile siguen teniendo prioridad.
+import os
+
+# Workers con hilos (gthread): un stream NDJSON largo (/scrape-all/stream, /jobs/<id>/stream)
+# ocupa un hilo y no el worker entero. La cantidad de workers sigue saliendo de -w /
+# WEB_CONCURRENCY; los jobs se comparten entre workers por SQLite (jobs.py).
+# Configuración (se puede sobreescribir por variables de entorno)
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+
+def on_starting(server):
+    """Exportar la cantidad de workers a los procesos hijos (el scheduler la usa, ver scheduler.py)."""
+    os.environ["GUNICORN_WORKERS"] = str(server.cfg.workers)
+
+def worker_exit(server, worker):
+    """Parar el scheduler y cerrar los Chromium del pool de drivers cuando el worker termina."""
+    from scheduler import get_scheduler
+    from scrapers.driver_pool import shutdown_driver_pool
+    get_scheduler().stop()
+    shutdown_driver_pool()
@@ -0,0 +1,143 @@
+import os
+import math
+import time
+import threading
+from collections import deque
+
+# -------------------- Salud de cada fuente --------------------
+# Por fuente: últimos resultados (éxito / error / timeout y duración), circuit breaker y
+# timeout adaptativo a partir del p95 de las corridas exitosas.
+# Configuración (se puede sobreescribir por variables de entorno)
+HEALTH_WINDOW = int(os.getenv("HEALTH_WINDOW", "50"))                    # corridas recordadas por fuente
+HEALTH_FAILURES_TO_OPEN = int(os.getenv("HEALTH_FAILURES_TO_OPEN", "3"))  # fallos seguidos que abren el circuito
+HEALTH_COOLDOWN = float(os.getenv("HEALTH_COOLDOWN", "300"))             # segundos sin llamar a la fuente
+HEALTH_MAX_COOLDOWN = float(os.getenv("HEALTH_MAX_COOLDOWN", "3600"))    # el cooldown se duplica si vuelve a fallar
+HEALTH_MIN_SAMPLES = int(os.getenv("HEALTH_MIN_SAMPLES", "5"))           # corridas exitosas antes de adaptar el timeout
+HEALTH_TIMEOUT_FACTOR = float(os.getenv("HEALTH_TIMEOUT_FACTOR", "1.5"))  # timeout = p95 * factor
+HEALTH_MIN_TIMEOUT = float(os.getenv("HEALTH_MIN_TIMEOUT", "30"))
+
+FAILURE_STATUSES = ("error", "timeout")
+
+def percentile(values, q: float):
+    """Percentil por rango más cercano (sin numpy), o None si no hay valores."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[k]
+
+class _SourceState:
+    def __init__(self, window: int):
+        self.runs = deque(maxlen=window)   # (ts, status, seconds, rows)
+        self.consecutive_failures = 0
+        self.state = "closed"              # closed -> open -> half_open -> closed / open
+        self.open_until = 0.0
+        self.cooldown = HEALTH_COOLDOWN
+        self.last_error = None
+
+class SourceHealth:
+    """Salud de las fuentes para el orquestador: qué fuentes llamar y con qué timeout."""
+    def __init__(self, window: int = HEALTH_WINDOW):
+        self.window = window
+        self._sources = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str) -> _SourceState:
+        st = self._sources.get(name)
+        if st is None:
+            st = self._sources[name] = _SourceState(self.window)
+        return st
+
+    def allow(self, name: str, now=None) -> bool:
+        """
+        False mientras el circuito esté abierto. Pasado el cooldown deja pasar una sola
+        corrida de prueba (half_open); las demás se siguen saltando hasta que termine.
+        """
+        now = now or time.time()
+        with self._lock:
+            st = self._get(name)
+            if st.state == "closed":
+                return True
+            if st.state == "open" and now >= st.open_until:
+                st.state = "half_open"
+                print(f"🩺 {name}: circuito medio abierto, corrida de prueba")
+                return True
+            return False
+
+    def record(self, name: str, status: str, seconds: float, rows: int = 0, error=None, now=None):
+        """Registra una corrida (status: ok / error / timeout). "skipped" y "circuit_open" no cuentan."""
+        now = now or time.time()
+        with self._lock:
+            st = self._get(name)
+            if status not in ("ok",) + FAILURE_STATUSES:
+                if st.state == "half_open":
+                    # la corrida de prueba no llegó a correr: se podrá probar de nuevo enseguida
+                    st.state, st.open_until = "open", now
+                return
+            st.runs.append((now, status, float(seconds or 0.0), int(rows or 0)))
+            if status == "ok":
+                if st.state != "closed":
+                    print(f"🩺 {name}: circuito cerrado (la fuente respondió)")
+                st.consecutive_failures = 0
+                st.state = "closed"
+                st.cooldown = HEALTH_COOLDOWN
+                return
+            st.consecutive_failures += 1
+            st.last_error = error or status
+            if st.state == "half_open":
+                # la prueba falló: volver a abrir con más cooldown
+                st.cooldown = min(st.cooldown * 2, HEALTH_MAX_COOLDOWN)
+                self._open(name, st, now)
+            elif st.state == "closed" and st.consecutive_failures >= HEALTH_FAILURES_TO_OPEN:
+                self._open(name, st, now)
+
+    def _open(self, name: str, st: _SourceState, now: float):
+        st.state = "open"
+        st.open_until = now + st.cooldown
+        print(f"🩺 {name}: circuito abierto por {st.cooldown:.0f}s ({st.consecutive_failures} fallos seguidos: {st.last_error})")
+
+    def timeout_for(self, name: str, default: float) -> float:
+        """p95 de las corridas exitosas * factor, entre HEALTH_MIN_TIMEOUT y `default`."""
+        with self._lock:
+            st = self._sources.get(name)
+            ok = [s for _, status, s, _ in st.runs if status == "ok"] if st else []
+        if len(ok) < HEALTH_MIN_SAMPLES:
+            return default
+        return max(HEALTH_MIN_TIMEOUT, min(default, percentile(ok, 95) * HEALTH_TIMEOUT_FACTOR))
+
+    def snapshot(self, names=(), default_timeout: float = None, now=None) -> dict:
+        """Estado por fuente para /health/sources (incluye `names` aunque todavía no hayan corrido)."""
+        now = now or time.time()
+        out = {}
+        with self._lock:
+            for name in names:
+                self._get(name)
+            items = [(name, st, list(st.runs)) for name, st in self._sources.items()]
+        for name, st, runs in items:
+            ok = [s for _, status, s, _ in runs if status == "ok"]
+            out[name] = {
+                "state": st.state,
+                "runs": len(runs),
+                "success_rate": round(len(ok) / len(runs), 3) if runs else None,
+                "timeouts": sum(1 for r in runs if r[1] == "timeout"),
+                "errors": sum(1 for r in runs if r[1] == "error"),
+                "consecutive_failures": st.consecutive_failures,
+                "p50_seconds": percentile(ok, 50),
+                "p95_seconds": percentile(ok, 95),
+                "last_run": runs[-1][0] if runs else None,
+                "last_error": st.last_error,
+                "retry_in_seconds": round(max(0.0, st.open_until - now), 1) if st.state == "open" else 0.0,
+            }
+            if default_timeout is not None:
+                out[name]["timeout_seconds"] = round(self.timeout_for(name, default_timeout), 1)
+        return out
+
+_health = None
+_health_lock = threading.Lock()
+
+def get_source_health() -> SourceHealth:
+    global _health
+    with _health_lock:
+        if _health is None:
+            _health = SourceHealth()
+        return _health
@@ -0,0 +1,340 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from orchestrator import run_all_scrapers, SCRAPERS
+from cache import get_result_cache
+from scrapers.common import DATA_DIR
+
+# -------------------- Jobs de scraping en segundo plano --------------------
+# El job corre en el worker que lo recibió, pero su estado y sus eventos se escriben en SQLite:
+# GET /jobs/<id> y /jobs/<id>/stream funcionan desde cualquier worker de gunicorn.
+# Configuración (se puede sobreescribir por variables de entorno)
+JOBS_MAX_WORKERS = int(os.getenv("JOBS_MAX_WORKERS", "2"))   # búsquedas ejecutándose a la vez (por worker)
+JOBS_MAX_QUEUE = int(os.getenv("JOBS_MAX_QUEUE", "10"))      # búsquedas esperando turno (por worker)
+JOBS_TTL = int(os.getenv("JOBS_TTL", "1800"))                # segundos que se guarda un job terminado
+JOBS_PATH = os.getenv("JOBS_PATH", os.path.join(DATA_DIR, "jobs.sqlite"))
+JOBS_POLL = float(os.getenv("JOBS_POLL", "0.5"))             # cada cuánto otro worker revisa eventos nuevos
+JOBS_ORPHAN_AFTER = int(os.getenv("JOBS_ORPHAN_AFTER", "900"))  # job sin novedades en este tiempo: su worker murió
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, params TEXT, status TEXT, created REAL, updated REAL,
+                                 finished REAL, error TEXT, sources TEXT, metrics TEXT, partial TEXT, results TEXT);
+CREATE TABLE IF NOT EXISTS job_eventos (job_id TEXT, seq INTEGER, event TEXT, PRIMARY KEY (job_id, seq));
+"""
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+class JobStore:
+    """Estado y eventos de los jobs en SQLite, compartidos por todos los workers."""
+    def __init__(self, path: str = JOBS_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def save(self, data: dict):
+        """Guarda el estado del job (data es ScrapeJob.to_dict() más created / finished)."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (data["job_id"], _dumps(data["params"]), data["status"], data["created"], time.time(),
+                 data["finished"], data["error"], _dumps(data["sources"]), _dumps(data["metrics"]),
+                 _dumps(data["partial"]), _dumps(data["resultados"]))
+            )
+
+    def append_event(self, job_id: str, seq: int, event: dict):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO job_eventos VALUES (?, ?, ?)", (job_id, seq, _dumps(event)))
+            conn.execute("UPDATE jobs SET updated = ? WHERE id = ?", (time.time(), job_id))
+
+    def load(self, job_id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT params, status, created, updated, finished, error, sources, metrics, "
+                               "partial, results FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        params, status, created, updated, finished, error, sources, metrics, partial, results = row
+        return {"job_id": job_id, "params": json.loads(params), "status": status, "created": created,
+                "updated": updated, "finished": finished, "error": error, "sources": json.loads(sources),
+                "metrics": json.loads(metrics), "partial": json.loads(partial), "resultados": json.loads(results)}
+
+    def events(self, job_id: str, after: int = 0) -> list:
+        """Eventos del job a partir de la posición `after`."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT event FROM job_eventos WHERE job_id = ? AND seq >= ? ORDER BY seq",
+                                (job_id, after)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def cleanup(self, now: float = None):
+        """Borra los jobs terminados hace más de JOBS_TTL (y los huérfanos igual de viejos)."""
+        limit = (now or time.time()) - JOBS_TTL
+        with self._connect() as conn:
+            old = [r[0] for r in conn.execute(
+                "SELECT id FROM jobs WHERE (finished IS NOT NULL AND finished < ?) OR updated < ?",
+                (limit, limit - JOBS_ORPHAN_AFTER)).fetchall()]
+            conn.executemany("DELETE FROM job_eventos WHERE job_id = ?", [(i,) for i in old])
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(i,) for i in old])
+
+class QueueFullError(Exception):
+    """La cola de jobs está llena."""
+
+class ScrapeJob:
+    """
+    Estado de una búsqueda: estado por fuente, filas parciales y resultado final.
+    Con `store`, cada cambio se escribe también en el JobStore para los otros workers.
+    """
+    def __init__(self, params: dict, store: Optional[JobStore] = None):
+        self.id = uuid.uuid4().hex
+        self.store = store
+        self.params = params
+        self.status = "queued"          # queued -> running -> done / error
+        self.created = time.time()
+        self.finished = None
+        self.error = None
+        self.sources = {name: {"status": "pending", "count": 0} for name, _ in SCRAPERS}
+        self.partial = {}               # fuente -> filas filtradas
+        self.results = None             # resultado final combinado y sin duplicados
+        self.metrics = {}               # fuente -> engine, estado, duración (lo completa run_all_scrapers)
+        self.events = []                # eventos para el streaming (en orden de llegada)
+        self._cond = threading.Condition()
+
+    def _persist(self, event: Optional[dict] = None, seq: int = 0):
+        """Escribe el estado (y el evento nuevo) en el store; nunca rompe el job."""
+        if self.store is None:
+            return
+        try:
+            data = self.to_dict()
+            data.update(created=self.created, finished=self.finished)
+            self.store.save(data)
+            if event is not None:
+                self.store.append_event(self.id, seq, event)
+        except Exception as e:
+            print(f"Error guardando el job {self.id}: {e}")
+
+    def _emit(self, event: dict):
+        with self._cond:
+            seq = len(self.events)
+            self.events.append(event)
+            self._cond.notify_all()
+        self._persist(event, seq)
+
+    def start(self):
+        with self._cond:
+            self.status = "running"
+        self._persist()
+
+    def on_source(self, name, df_filtered):
+        """Callback para run_all_scrapers(on_source=...)."""
+        rows = df_filtered.to_dict('records') if df_filtered is not None else []
+        self.on_source_rows(name, rows)
+
+    def on_source_rows(self, name, rows):
+        engine = self.metrics.get(name, {}).get("engine")
+        with self._cond:
+            self.partial[name] = rows
+            self.sources[name] = {"status": "done", "count": len(rows), "engine": engine}
+        self._emit({"event": "source", "fuente": name, "count": len(rows), "engine": engine, "resultados": rows})
+
+    def finish(self, results=None, error=None):
+        with self._cond:
+            self.results = results
+            self.error = error
+            self.status = "error" if error else "done"
+            self.finished = time.time()
+        if error:
+            self._emit({"event": "error", "error": error})
+        else:
+            self._emit({"event": "done", "total": len(results or [])})
+
+    @property
+    def terminal(self) -> bool:
+        return self.status in ("done", "error")
+
+    def expired(self, now=None) -> bool:
+        return self.finished is not None and (now or time.time()) - self.finished > JOBS_TTL
+
+    def to_dict(self, include_results: bool = True) -> dict:
+        with self._cond:
+            data = {
+                "job_id": self.id,
+                "status": self.status,
+                "params": self.params,
+                "sources": {k: dict(v) for k, v in self.sources.items()},
+                "error": self.error,
+                "metrics": {k: dict(v) for k, v in list(self.metrics.items())},
+            }
+            if include_results:
+                data["partial"] = dict(self.partial)
+                data["resultados"] = self.results
+        return data
+
+    def iter_ndjson(self, heartbeat: float = 15.0):
+        """Genera líneas NDJSON a medida que cada fuente termina (job de este worker)."""
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self.events) and not self.terminal:
+                    if not self._cond.wait(timeout=heartbeat):
+                        break
+                pending = self.events[i:]
+                i = len(self.events)
+                done = self.terminal and i >= len(self.events)
+            for ev in pending:
+                yield json.dumps(ev, ensure_ascii=False, default=str) + "\n"
+            if done:
+                return
+            if not pending:
+                yield json.dumps({"event": "heartbeat"}) + "\n"
+
+class StoredJob:
+    """Job de otro worker, leído del JobStore: mismo to_dict() e iter_ndjson() que ScrapeJob."""
+    def __init__(self, data: dict, store: JobStore):
+        self.id = data["job_id"]
+        self.store = store
+        self.data = data
+        if data["status"] not in ("done", "error") and time.time() - data["updated"] > JOBS_ORPHAN_AFTER:
+            # el worker que lo corría se reinició a mitad del scrape
+            data.update(status="error", error="El job se interrumpió (el worker que lo ejecutaba terminó)")
+
+    @property
+    def status(self) -> str:
+        return self.data["status"]
+
+    @property
+    def terminal(self) -> bool:
+        return self.status in ("done", "error")
+
+    def to_dict(self, include_results: bool = True) -> dict:
+        keys = ["job_id", "status", "params", "sources", "error", "metrics"]
+        if include_results:
+            keys += ["partial", "resultados"]
+        return {k: self.data[k] for k in keys}
+
+    def iter_ndjson(self, heartbeat: float = 15.0):
+        """Como ScrapeJob.iter_ndjson, leyendo los eventos del store cada JOBS_POLL segundos."""
+        i = 0
+        last = time.monotonic()
+        while True:
+            pending = self.store.events(self.id, i)
+            i += len(pending)
+            for ev in pending:
+                yield _dumps(ev) + "\n"
+                if ev.get("event") in ("done", "error"):
+                    return
+            now = time.monotonic()
+            if pending:
+                last = now
+            elif now - last >= heartbeat:
+                data = self.store.load(self.id)
+                if data is None:
+                    yield _dumps({"event": "error", "error": "Job expirado"}) + "\n"
+                    return
+                job = StoredJob(data, self.store)
+                if job.terminal:
+                    # terminó sin evento final: quedó huérfano
+                    yield _dumps({"event": "error", "error": job.data["error"]}) + "\n"
+                    return
+                yield _dumps({"event": "heartbeat"}) + "\n"
+                last = now
+            time.sleep(JOBS_POLL)
+
+class JobManager:
+    """
+    Ejecuta los jobs en un executor acotado (por worker) y expira los terminados. Los jobs
+    de otros workers se leen del JobStore.
+    """
+    def __init__(self, max_workers: int = JOBS_MAX_WORKERS, max_queue: int = JOBS_MAX_QUEUE,
+                 store: Optional[JobStore] = None):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="job")
+        self._slots = threading.BoundedSemaphore(max(1, max_workers) + max(0, max_queue))
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.store = store if store is not None else JobStore()
+
+    def _cleanup(self):
+        now = time.time()
+        with self._lock:
+            for job_id in [k for k, j in self._jobs.items() if j.expired(now)]:
+                del self._jobs[job_id]
+        try:
+            self.store.cleanup(now)
+        except Exception as e:
+            print(f"Error limpiando jobs: {e}")
+
+    def submit(self, params: dict) -> ScrapeJob:
+        self._cleanup()
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError("Demasiadas búsquedas en cola, intenta de nuevo en unos segundos")
+        job = ScrapeJob(params, store=self.store)
+        with self._lock:
+            self._jobs[job.id] = job
+        job._persist()
+        try:
+            self._executor.submit(self._run, job)
+        except Exception:
+            self._slots.release()
+            raise
+        return job
+
+    def get(self, job_id: str):
+        """El job de este worker, o el de otro worker leído del store (None si no existe o expiró)."""
+        self._cleanup()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        try:
+            data = self.store.load(job_id)
+        except Exception as e:
+            print(f"Error leyendo el job {job_id}: {e}")
+            return None
+        return StoredJob(data, self.store) if data is not None else None
+
+    def _run(self, job: ScrapeJob):
+        try:
+            job.start()
+            cache = get_result_cache()
+            cached = cache.peek("all", job.params)
+            if cached is not None:
+                # ya hay resultado en cache: emitir por fuente y terminar
+                for name, _ in SCRAPERS:
+                    job.on_source_rows(name, [r for r in cached if r.get("fuente") == name])
+                job.finish(results=cached)
+                return
+            df = run_all_scrapers(**job.params, on_source=job.on_source, metrics=job.metrics)
+            records = df.to_dict('records')
+            cache.put("all", job.params, records)
+            job.finish(results=records)
+        except Exception as e:
+            print(f"Error en job {job.id}: {e}")
+            job.finish(error=str(e))
+        finally:
+            self._slots.release()
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_job_manager() -> JobManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
@@ -1,6 +1,12 @@
+import os
 import re
+import time
+import queue
+import threading
+import numpy as np
 import pandas as pd
 from typing import Optional
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # Importar las funciones de scraping de sus respectivos archivos
 from scrapers.nestoria import scrape_nestoria
@@ -10,7 +16,22 @@ from scrapers.properati import scrape_properati
 from scrapers.doomos import scrape_doomos
 
 # Importar helpers de filtrado desde common
-from scrapers.common import _parse_price_soles, _extract_int_from_text
+from scrapers.common import ResultsBuffer, bind_results_buffer, iter_results, LISTING_COLUMNS
+from scrapers.listing import TYPED_COLUMNS, listings_frame, public_frame
+from scrapers.features import RE_FIRST_INT
+from scrapers.prices import price_pen
+
+# Store persistente de anuncios
+from store import save_scraped
+
+# Salud de cada fuente (circuit breaker y timeouts adaptativos)
+from health import get_source_health
+
+# Duplicados entre fuentes
+from dedup import DEDUP_ENABLED, DedupIndex, collapse_duplicates, image_hashes
+
+# Qué filtros ya aplicó cada sitio y búsquedas amplias en cache
+from planner import PLANNER_WIDEN, requested_filters, plan_query, local_args, widen, cached_superset, put_superset
 
 # -------------------- Filtrado y Unificación --------------------
 SCRAPERS = [
@@ -21,114 +42,505 @@ SCRAPERS = [
     ("doomos", scrape_doomos),
 ]
 
+# Patrones precompilados para el filtrado vectorizado (los mismos que usan los scrapers)
+_RE_FIRST_INT = RE_FIRST_INT
+
+def _numeric_columns(df):
+    """
+    Columnas numéricas usadas por los filtros: precio en soles (dólares convertidos),
+    dormitorios y baños. Si el frame viene de listings_frame ya están parseadas
+    (TYPED_COLUMNS); si no (p.ej. filas de la cache), se parsean una vez por frame: el precio
+    una vez por texto distinto y los enteros vectorizados.
+    """
+    if all(c in df.columns for c in TYPED_COLUMNS):
+        return df["precio_pen"], df["dormitorios_num"], df["banos_num"]
+    precio = df["precio"].astype(str)
+    pen = {p: price_pen(p) for p in precio.unique()}
+    precio_soles = pd.to_numeric(precio.map(pen), errors="coerce")
+    dorm_num = pd.to_numeric(df["dormitorios"].astype(str).str.extract(_RE_FIRST_INT, expand=False), errors="coerce")
+    banos_num = pd.to_numeric(df["baños"].astype(str).str.extract(_RE_FIRST_INT, expand=False), errors="coerce")
+    return precio_soles, dorm_num, banos_num
+
+def _req_int(value):
+    """Entero pedido por el usuario, o None si no aplica ("", "0", no numérico)."""
+    try:
+        if value is None or str(value).strip() == "" or str(value) == "0":
+            return None
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
 def _filter_df_strict(df, dormitorios_req, banos_req, price_min, price_max):
     if df is None or df.empty:
         return pd.DataFrame()
-    dfc = df.copy().reset_index(drop=True)
-    dfc["_precio_soles"] = dfc["precio"].apply(_parse_price_soles)
-    dfc["_dorm_num"] = dfc["dormitorios"].apply(_extract_int_from_text)
-    dfc["_banos_num"] = dfc["baños"].apply(_extract_int_from_text)
-    mask = pd.Series(True, index=dfc.index)
     # only require dorm/banos if user requested them
-    try:
-        if dormitorios_req is not None and str(dormitorios_req).strip() != "" and str(dormitorios_req) != "0":
-            dorm_req_int = int(dormitorios_req)
-            mask &= (dfc["_dorm_num"].notnull()) & (dfc["_dorm_num"] == dorm_req_int)
-    except:
-        pass
-    try:
-        if banos_req is not None and str(banos_req).strip() != "" and str(banos_req) != "0":
-            banos_req_int = int(banos_req)
-            mask &= (dfc["_banos_num"].notnull()) & (dfc["_banos_num"] == banos_req_int)
-    except:
-        pass
+    dorm_req_int = _req_int(dormitorios_req)
+    banos_req_int = _req_int(banos_req)
+    if dorm_req_int is None and banos_req_int is None and price_min is None and price_max is None:
+        # nada que filtrar en local: ni siquiera parsear las columnas
+        return df.reset_index(drop=True)
+    precio_soles, dorm_num, banos_num = _numeric_columns(df)
+    mask = np.ones(len(df), dtype=bool)
+    if dorm_req_int is not None:
+        mask &= (dorm_num == dorm_req_int).to_numpy()
+    if banos_req_int is not None:
+        mask &= (banos_num == banos_req_int).to_numpy()
     if (price_min is not None) or (price_max is not None):
-        if price_min is None:
-            price_min = -10**12
-        if price_max is None:
-            price_max = 10**12
-        mask &= dfc["_precio_soles"].notnull()
-        mask &= (dfc["_precio_soles"] >= int(price_min)) & (dfc["_precio_soles"] <= int(price_max))
-    df_filtered = dfc.loc[mask].copy().reset_index(drop=True)
-    df_filtered.drop(columns=["_precio_soles","_dorm_num","_banos_num"], errors="ignore", inplace=True)
-    return df_filtered
+        lo = -10**12 if price_min is None else int(price_min)
+        hi = 10**12 if price_max is None else int(price_max)
+        # NaN (sin precio o en una moneda sin tipo de cambio) nunca cumple la comparación
+        mask &= ((precio_soles >= lo) & (precio_soles <= hi)).to_numpy()
+    if mask.all():
+        return df.reset_index(drop=True)
+    return df[mask].reset_index(drop=True)
+
+def _keywords_pattern(palabras):
+    """Un solo regex que exige todas las palabras (lookaheads), para filtrar en una pasada."""
+    return "(?s)" + "".join(f"(?=.*{re.escape(p)})" for p in palabras)
 
 def _filter_by_keywords(df, palabras_clave: str):
     if df is None or df.empty or not palabras_clave or not palabras_clave.strip():
         return df
     palabras = palabras_clave.lower().split()
-    dfc = df.copy()
-    dfc["texto_completo"] = (
-        dfc["titulo"].astype(str) + " " +
-        dfc.get("descripcion", pd.Series([""]*len(dfc))).astype(str) + " " +
-        dfc.get("m2", pd.Series([""]*len(dfc))).astype(str) + " " +
-        dfc.get("dormitorios", pd.Series([""]*len(dfc))).astype(str) + " " +
-        dfc.get("baños", pd.Series([""]*len(dfc))).astype(str)
+    empty = pd.Series("", index=df.index)
+    texto_completo = (
+        df["titulo"].astype(str) + " " +
+        df.get("descripcion", empty).astype(str) + " " +
+        df.get("m2", empty).astype(str) + " " +
+        df.get("dormitorios", empty).astype(str) + " " +
+        df.get("baños", empty).astype(str)
     ).str.lower()
-    for p in palabras:
-        dfc = dfc[dfc["texto_completo"].str.contains(re.escape(p), na=False, case=False)]
-    dfc.drop(columns=["texto_completo"], errors="ignore", inplace=True)
-    return dfc
+    mask = texto_completo.str.match(_keywords_pattern(palabras), na=False)
+    return df[mask.to_numpy()]
 
-def run_all_scrapers(zona: str = "", dormitorios: str = "0", banos: str = "0",
-                     price_min: Optional[int] = None, price_max: Optional[int] = None,
-                     palabras_clave: str = ""):
-    frames = []
-    counts_raw = {}
-    counts_after = {}
-    print(f"🔎 Buscando: zona='{zona}' | dorms={dormitorios} | baños={banos} | pmin={price_min} | pmax={price_max} | keywords='{palabras_clave}'")
-    
-    for name, func in SCRAPERS:
-        print(f"-> Ejecutando scraper: {name}")
+COLUMNS = LISTING_COLUMNS
+
+# Configuración de ejecución en paralelo (se puede sobreescribir por variables de entorno)
+PARALLEL_DEFAULT = os.getenv("SCRAPE_PARALLEL", "1") not in ("0", "false", "False")
+MAX_WORKERS = int(os.getenv("SCRAPE_MAX_WORKERS", "5"))
+SOURCE_TIMEOUT = float(os.getenv("SCRAPE_SOURCE_TIMEOUT", "240"))  # segundos por fuente
+REQUEST_DEADLINE = float(os.getenv("SCRAPE_DEADLINE", "540"))      # segundos para toda la petición (< timeout de gunicorn)
+
+def _call_scraper(name, func, buf, **params):
+    """Ejecuta un scraper dentro de su buffer de resultados parciales."""
+    with bind_results_buffer(buf):
         try:
-            df = func(zona=zona, dormitorios=dormitorios, banos=banos, price_min=price_min, price_max=price_max, palabras_clave=palabras_clave)
+            return func(**params)
         except TypeError:
             # backward compatibility: call with fewer args
+            params.pop("palabras_clave", None)
             try:
-                df = func(zona=zona, dormitorios=dormitorios, banos=banos, price_min=price_min, price_max=price_max)
+                return func(**params)
             except Exception as e:
                 print(f" ❌ Error ejecutando {name} (fallback):", e)
-                df = pd.DataFrame()
+                buf.metrics["error"] = str(e)
+                return pd.DataFrame()
         except Exception as e:
             print(f" ❌ Error ejecutando {name}:", e)
-            df = pd.DataFrame()
-        
-        if df is None or not isinstance(df, pd.DataFrame):
-            df = pd.DataFrame(columns=["titulo","precio","m2","dormitorios","baños","descripcion","link","imagen_url"])
-        
-        # ensure columns present
-        for col in ["titulo","precio","m2","dormitorios","baños","descripcion","link","imagen_url"]:
-            if col not in df.columns:
-                df[col] = ""
-        
-        total_raw = len(df)
+            buf.metrics["error"] = str(e)
+            return pd.DataFrame()
+
+def _normalize_df(df):
+    """Columnas fijas y todo como texto sin espacios ni "None"."""
+    if df is None or not isinstance(df, pd.DataFrame):
+        df = pd.DataFrame(columns=COLUMNS)
+    if all(c in df.columns for c in COLUMNS + TYPED_COLUMNS):
+        # armado por listings_frame: el texto ya viene normalizado desde cada Listing
+        return df
+    
+    # ensure columns present
+    for col in COLUMNS:
+        if col not in df.columns:
+            df[col] = ""
+    
+    # normalize
+    df = df.fillna("").astype(object)
+    for col in COLUMNS:
+        df[col] = df[col].astype(str).str.strip().replace({None: "", "None": ""})
+    return df
+
+def _process_source_df(name, df, dormitorios, banos, price_min, price_max, palabras_clave, plan=None):
+    """
+    Normaliza y filtra el DataFrame de una fuente. Devuelve (raw, filtrado).
+    Solo se aplican los filtros que `plan` (por defecto plan_query de la búsqueda) deja en local.
+    """
+    df = _normalize_df(df)
+    total_raw = len(df)
+    print(f"   [{name}] encontrados (raw): {total_raw}")
+    
+    if plan is None:
+        plan = plan_query(name, dict(dormitorios=dormitorios, banos=banos, price_min=price_min,
+                                     price_max=price_max, palabras_clave=palabras_clave))
+    dormitorios, banos, price_min, price_max, palabras_clave = local_args(plan, dormitorios, banos, price_min, price_max, palabras_clave)
+    if plan.server:
+        print(f"   [{name}] ya filtrado en el sitio: {plan.server}")
+    
+    # strict filters (price/dorm/banos)
+    df_filtered = _filter_df_strict(df, dormitorios, banos, price_min, price_max)
+    print(f"   [{name}] después filtrado estricto: {len(df_filtered)}")
+    
+    if palabras_clave and palabras_clave.strip():
+        prev = len(df_filtered)
+        df_filtered = _filter_by_keywords(df_filtered, palabras_clave)
+        print(f"   [{name}] después filtrar por keywords: {len(df_filtered)} (eliminados {prev - len(df_filtered)})")
+    
+    if len(df_filtered) > 0:
+        df_filtered = public_frame(df_filtered).copy()
+        df_filtered["fuente"] = name
+    return total_raw, df_filtered
+
+def _filter_batch(name, rows, plan, dormitorios, banos, price_min, price_max, palabras_clave) -> list:
+    """Mismos filtros que _process_source_df sobre un lote de filas (sin logs por lote)."""
+    dormitorios, banos, price_min, price_max, palabras_clave = local_args(plan, dormitorios, banos, price_min, price_max, palabras_clave)
+    df = _filter_df_strict(listings_frame(rows), dormitorios, banos, price_min, price_max)
+    df = _filter_by_keywords(df, palabras_clave)
+    records = public_frame(df).to_dict('records') if df is not None and len(df) > 0 else []
+    for r in records:
+        r["fuente"] = name
+    return records
+
+def _source_metrics(buf, status, started, now=None):
+    """
+    Métricas de una fuente: lo que reportó el scraper (engine, ...) + estado y duración.
+    Un scraper que atrapó su propio error (metrics["error"]) sin devolver anuncios cuenta
+    como "error".
+    """
+    m = dict(buf.metrics)
+    if status == "ok" and m.get("error") and len(buf) == 0:
+        status = "error"
+    m["status"] = status
+    m["seconds"] = round((now or time.monotonic()) - started, 2) if started is not None else 0.0
+    return m
+
+def _record_health(name, m):
+    get_source_health().record(name, m["status"], m["seconds"], error=m.get("error"))
+
+def _skip_open_circuit(name, on_done, metrics) -> bool:
+    """Si el circuito de la fuente está abierto no se la llama: estado "circuit_open" y sin anuncios."""
+    if get_source_health().allow(name):
+        return False
+    print(f" 🩺 {name}: circuito abierto, se salta")
+    metrics[name] = {"status": "circuit_open", "seconds": 0.0}
+    on_done(name, pd.DataFrame())
+    return True
+
+def _run_sequential(params, on_done, metrics, scrapers=None, per_source=None):
+    per_source = per_source or {}
+    for name, func in (SCRAPERS if scrapers is None else scrapers):
+        if _skip_open_circuit(name, on_done, metrics):
+            continue
+        print(f"-> Ejecutando scraper: {name}")
+        buf = ResultsBuffer()
+        t = time.monotonic()
+        df = _call_scraper(name, func, buf, **per_source.get(name, params))
+        metrics[name] = _source_metrics(buf, "ok", t)
+        _record_health(name, metrics[name])
+        on_done(name, df)
+
+def _run_parallel(params, max_workers, source_timeout, deadline, on_done, metrics, buffers=None,
+                  scrapers=None, per_source=None):
+    """
+    Ejecuta los scrapers en un pool acotado. Si una fuente supera su timeout (el p95
+    observado de la fuente, con `source_timeout` como tope) o se acaba el deadline
+    global, se devuelven sus resultados parciales. Las fuentes con el circuito abierto
+    no se llaman.
+    on_done(name, df) se llama en cuanto cada fuente termina; metrics[name] queda
+    con el engine usado, el estado y la duración de cada fuente. `buffers`
+    ({fuente: ResultsBuffer}) permite leer las filas mientras llegan. `scrapers` limita las
+    fuentes (por defecto SCRAPERS) y `per_source` ({fuente: params}) cambia la búsqueda de alguna.
+    """
+    t0 = time.monotonic()
+    if buffers is None:
+        buffers = {name: ResultsBuffer() for name, _ in SCRAPERS}
+    started = {}
+    per_source = per_source or {}
+    health = get_source_health()
+    scrapers = [(name, func) for name, func in (SCRAPERS if scrapers is None else scrapers)
+                if not _skip_open_circuit(name, on_done, metrics)]
+    timeouts = {name: health.timeout_for(name, source_timeout) for name, _ in scrapers}
+
+    def _task(name, func):
+        started[name] = time.monotonic()
+        print(f"-> Ejecutando scraper: {name}")
+        return _call_scraper(name, func, buffers[name], **per_source.get(name, params))
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="scraper")
+    futures = {executor.submit(_task, name, func): name for name, func in scrapers}
+    pending = set(futures)
+    try:
+        while pending:
+            now = time.monotonic()
+            # próximo vencimiento: deadline global o timeout de alguna fuente en curso
+            limits = [t0 + deadline]
+            limits += [started[futures[f]] + timeouts[futures[f]] for f in pending if futures[f] in started]
+            wait_for = max(0.0, min(limits) - now)
+            done, pending = wait(pending, timeout=min(wait_for, 1.0), return_when=FIRST_COMPLETED)
+            for f in done:
+                name = futures[f]
+                status = "ok"
+                try:
+                    df = f.result()
+                except Exception as e:
+                    print(f" ❌ Error ejecutando {name}:", e)
+                    df = pd.DataFrame()
+                    status = "error"
+                metrics[name] = _source_metrics(buffers[name], status, started.get(name))
+                _record_health(name, metrics[name])
+                on_done(name, df)
+            now = time.monotonic()
+            for f in list(pending):
+                name = futures[f]
+                overdue = now >= t0 + deadline
+                if name in started and now >= started[name] + timeouts[name]:
+                    overdue = True
+                if not overdue:
+                    continue
+                pending.discard(f)
+                if f.cancel():
+                    print(f" ⏱️ {name}: no llegó a iniciar antes del deadline")
+                    metrics[name] = _source_metrics(buffers[name], "skipped", None)
+                    _record_health(name, metrics[name])
+                    on_done(name, pd.DataFrame())
+                    continue
+                buffers[name].cancel()
+                partial = buffers[name].snapshot()
+                print(f" ⏱️ {name}: timeout ({timeouts[name]:.0f}s), devolviendo {len(partial)} resultados parciales")
+                metrics[name] = _source_metrics(buffers[name], "timeout", started.get(name), now)
+                _record_health(name, metrics[name])
+                on_done(name, listings_frame(partial))
+    finally:
+        # no bloquear la respuesta esperando a los scrapers que siguen corriendo
+        executor.shutdown(wait=False, cancel_futures=True)
+    print(f"Scrapers terminados en {time.monotonic() - t0:.1f}s")
+
+def run_all_scrapers(zona: str = "", dormitorios: str = "0", banos: str = "0",
+                     price_min: Optional[int] = None, price_max: Optional[int] = None,
+                     palabras_clave: str = "", parallel: Optional[bool] = None,
+                     max_workers: int = MAX_WORKERS, source_timeout: float = SOURCE_TIMEOUT,
+                     deadline: float = REQUEST_DEADLINE, on_source=None, metrics: Optional[dict] = None):
+    """
+    Ejecuta todos los scrapers, filtra cada fuente y combina los resultados.
+    Con PLANNER_SUPERSET, las fuentes cuya búsqueda amplia (misma zona, sin filtros) está fresca
+    en la cache no se scrapean: se filtra esa en local (estado "superset"). Con PLANNER_WIDEN, las demás se
+    scrapean con la búsqueda amplia, que queda en la cache para las próximas.
+    on_source(name, df_filtrado), si se pasa, se llama en cuanto cada fuente termina.
+    metrics, si se pasa, se completa con {fuente: {engine, status, seconds, raw, filtrados}}.
+    """
+    if metrics is None:
+        metrics = {}
+    counts_raw = {}
+    counts_after = {}
+    print(f"🔎 Buscando: zona='{zona}' | dorms={dormitorios} | baños={banos} | pmin={price_min} | pmax={price_max} | keywords='{palabras_clave}'")
+    
+    params = dict(zona=zona, dormitorios=dormitorios, banos=banos, price_min=price_min, price_max=price_max, palabras_clave=palabras_clave)
+    filtered = {}
+    plans = {name: plan_query(name, params) for name, _ in SCRAPERS}
+    supersets = {}   # fuente -> records de la búsqueda amplia en cache
+    per_source = {}  # fuente -> búsqueda amplia a scrapear (PLANNER_WIDEN)
+    for name, _ in SCRAPERS:
+        rows = cached_superset(name, params)
+        if rows is not None:
+            supersets[name] = rows
+            plans[name] = plan_query(name, params, widened=True)
+        elif PLANNER_WIDEN and requested_filters(params):
+            per_source[name] = widen(params)
+            plans[name] = plan_query(name, params, widened=True)
+    
+    def _on_done(name, df):
+        if name in per_source and metrics.get(name, {}).get("status") == "ok":
+            put_superset(name, params, public_frame(df).to_dict('records') if df is not None else [])
+        if name not in supersets:
+            # guardar todo lo scrapeado (antes de filtrar) en el store persistente
+            save_scraped(df, fuente=name, zona=zona)
+        total_raw, df_filtered = _process_source_df(name, df, dormitorios, banos, price_min, price_max, palabras_clave,
+                                                    plan=plans[name])
         counts_raw[name] = total_raw
-        print(f"   encontrados (raw): {total_raw}")
-        
-        # normalize
-        df = df.fillna("").astype(object)
-        for col in ["titulo","precio","m2","dormitorios","baños","descripcion","link","imagen_url"]:
-            df[col] = df[col].astype(str).str.strip().replace({None: "", "None": ""})
-        
-        # strict filters (price/dorm/banos)
-        df_filtered = _filter_df_strict(df, dormitorios, banos, price_min, price_max)
-        print(f"   después filtrado estricto: {len(df_filtered)}")
-        
-        # keywords: apply post-scrape ONLY for sources that didn't use keyword in URL
-        # EXCLUDE properati because it uses 'amenities' and text may not contain the keyword
-        if palabras_clave and palabras_clave.strip() and name not in ("urbania", "doomos", "properati"):
-            prev = len(df_filtered)
-            df_filtered = _filter_by_keywords(df_filtered, palabras_clave)
-            print(f"   después filtrar por keywords: {len(df_filtered)} (eliminados {prev - len(df_filtered)})")
-        
         counts_after[name] = len(df_filtered)
-        if len(df_filtered) > 0:
-            df_filtered = df_filtered.copy()
-            df_filtered["fuente"] = name
+        metrics.setdefault(name, {}).update(raw=total_raw, filtrados=len(df_filtered))
+        filtered[name] = df_filtered
+        if on_source is not None:
+            try:
+                on_source(name, df_filtered)
+            except Exception as e:
+                print(f" ❌ Error en on_source para {name}:", e)
+    
+    for name, rows in supersets.items():
+        print(f" 🗂️ {name}: filtrando la búsqueda amplia en cache ({len(rows)} anuncios)")
+        metrics[name] = {"status": "superset", "seconds": 0.0}
+        _on_done(name, pd.DataFrame(rows))
+    scrapers = [(name, func) for name, func in SCRAPERS if name not in supersets]
+    
+    if parallel is None:
+        parallel = PARALLEL_DEFAULT
+    if parallel:
+        _run_parallel(params, max_workers, source_timeout, deadline, _on_done, metrics, scrapers=scrapers, per_source=per_source)
+    else:
+        _run_sequential(params, _on_done, metrics, scrapers=scrapers, per_source=per_source)
+    
+    combined = _combine_frames(filtered, zona)
+    if combined.empty:
+        print("⚠️ Ninguna fuente devolvió anuncios tras filtrar. Conteo raw:", counts_raw)
+    return combined
+
+# -------------------- Streaming --------------------
+STREAM_POLL = float(os.getenv("SCRAPE_STREAM_POLL", "0.5"))  # segundos máx. entre lotes del stream
+
+def iter_source(name: str, **params):
+    """Genera los anuncios normalizados de una fuente a medida que su scraper los parsea."""
+    return iter_results(dict(SCRAPERS)[name], **params)
+
+def _link_key(row):
+    link = row.get("link") or ""
+    if not link or link.startswith("#"):
+        return None
+    return (link, row.get("titulo") or "")
+
+def stream_all_scrapers(zona: str = "", dormitorios: str = "0", banos: str = "0",
+                        price_min: Optional[int] = None, price_max: Optional[int] = None,
+                        palabras_clave: str = "", parallel: Optional[bool] = None,
+                        max_workers: int = MAX_WORKERS, source_timeout: float = SOURCE_TIMEOUT,
+                        deadline: float = REQUEST_DEADLINE, metrics: Optional[dict] = None):
+    """
+    Como run_all_scrapers, pero generador: filtra y quita duplicados a medida que cada
+    scraper agrega anuncios a su buffer. Genera eventos:
+      {"event": "rows", "fuente", "resultados": [...], "duplicados": [...]}
+                                                                 lote de anuncios nuevos ya filtrados; los que
+                                                                 son el mismo anuncio que uno ya enviado de otra
+                                                                 fuente van en "duplicados" como
+                                                                 {"link" (el enviado), "fuente", "alternativo"}
+      {"event": "source", "fuente", "status", "raw", "filtrados", "engine", "imagenes"}
+                                                                 la fuente terminó ("imagenes": {link: url}
+                                                                 de los anuncios ya enviados cuya imagen se
+                                                                 resolvió después, p.ej. Nestoria)
+      {"event": "done", "total"}
+    Los duplicados (link, título) se descartan por orden de llegada, no por orden de SCRAPERS.
+    """
+    if metrics is None:
+        metrics = {}
+    print(f"🔎 Stream: zona='{zona}' | dorms={dormitorios} | baños={banos} | pmin={price_min} | pmax={price_max} | keywords='{palabras_clave}'")
+    params = dict(zona=zona, dormitorios=dormitorios, banos=banos, price_min=price_min, price_max=price_max, palabras_clave=palabras_clave)
+    filters = (dormitorios, banos, price_min, price_max, palabras_clave)
+    plans = {name: plan_query(name, params) for name, _ in SCRAPERS}
+    if parallel is None:
+        parallel = PARALLEL_DEFAULT
+    arrived = threading.Event()
+    buffers = {name: ResultsBuffer(on_append=arrived.set) for name, _ in SCRAPERS}
+    finished = queue.Queue()  # (fuente, df) en cuanto termina cada una
+
+    def _on_done(name, df):
+        finished.put((name, df))
+        arrived.set()
+
+    def _runner():
+        try:
+            _run_parallel(params, max_workers if parallel else 1, source_timeout, deadline, _on_done, metrics, buffers)
+        finally:
+            finished.put(None)
+            arrived.set()
+
+    threading.Thread(target=_runner, name="scrape-stream", daemon=True).start()
+    offsets = {name: 0 for name in buffers}
+    sent = {name: {} for name in buffers}  # fuente -> {link: imagen_url enviada}
+    seen = set()
+    index = DedupIndex() if DEDUP_ENABLED else None
+    index_links = []  # posición en el índice -> link enviado
+    total = 0
+    closed = set()
+    running = True
+
+    def _drain(name, rows=None):
+        nonlocal total
+        if rows is None:
+            rows = buffers[name][offsets[name]:]
+            offsets[name] += len(rows)
+        if not rows:
+            return None
+        out, dups = [], []
+        batch = _filter_batch(name, rows, plans[name], *filters)
+        hashes = image_hashes(r["imagen_url"] for r in batch) if index is not None else {}
+        for r in batch:
+            key = _link_key(r)
+            if key is None or key in seen:
+                continue
+            seen.add(key)
+            if index is not None:
+                canon = index.add(r if r.get("zona") or not zona else dict(r, zona=zona), hashes.get(r["imagen_url"]))
+                index_links.append(r["link"])
+                if canon is not None:
+                    dups.append({"link": index_links[canon], "fuente": name, "alternativo": r["link"]})
+                    continue
+            sent[name][r["link"]] = r["imagen_url"]
+            out.append(r)
+        total += len(out)
+        if not out and not dups:
+            return None
+        return {"event": "rows", "fuente": name, "resultados": out, "duplicados": dups}
+
+    try:
+        while running or not finished.empty():
+            arrived.wait(timeout=STREAM_POLL)
+            arrived.clear()
+            done = []
+            while True:
+                try:
+                    item = finished.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                else:
+                    done.append(item)
+            for name in buffers:
+                if name in closed:
+                    continue
+                ev = _drain(name)
+                if ev:
+                    yield ev
+            for name, df in done:
+                closed.add(name)
+                if not buffers[name] and df is not None and len(df):
+                    # scraper que no usa el buffer compartido: filtrar su DataFrame al terminar
+                    ev = _drain(name, df.to_dict('records'))
+                    if ev:
+                        yield ev
+                # guardar todo lo scrapeado (antes de filtrar) en el store persistente
+                save_scraped(df, fuente=name, zona=zona)
+                raw = 0 if df is None else len(df)
+                filtrados = len(sent[name])
+                m = metrics.setdefault(name, {})
+                m.update(raw=raw, filtrados=filtrados)
+                imagenes = {}
+                if df is not None and len(df) and "imagen_url" in df.columns and "link" in df.columns:
+                    for link, img in zip(df["link"], df["imagen_url"]):
+                        if link in sent[name] and img and sent[name][link] != str(img).strip():
+                            imagenes[link] = str(img).strip()
+                print(f"   [{name}] stream: raw {raw}, enviados {filtrados}")
+                yield {"event": "source", "fuente": name, "status": m.get("status"), "raw": raw,
+                       "filtrados": filtrados, "engine": m.get("engine"), "imagenes": imagenes}
+        yield {"event": "done", "total": total}
+    finally:
+        # el cliente cortó el stream: no seguir scrapeando para nadie
+        for buf in buffers.values():
+            buf.cancel()
+
+def combine_source_results(raw_dfs: dict, dormitorios: str = "0", banos: str = "0",
+                           price_min: Optional[int] = None, price_max: Optional[int] = None,
+                           palabras_clave: str = "", zona: str = ""):
+    """Filtra y combina DataFrames crudos ya scrapeados ({fuente: df}) igual que run_all_scrapers."""
+    filtered = {}
+    for name, df in raw_dfs.items():
+        filtered[name] = _process_source_df(name, df, dormitorios, banos, price_min, price_max, palabras_clave)[1]
+    return _combine_frames(filtered, zona)
+
+def _combine_frames(filtered: dict, zona: str = ""):
+    frames = []
+    # combinar en el orden de SCRAPERS para que drop_duplicates sea determinista
+    for name, _ in SCRAPERS:
+        df_filtered = filtered.get(name)
+        if df_filtered is not None and len(df_filtered) > 0:
             frames.append(df_filtered)
     
     if not frames:
-        print("⚠️ Ninguna fuente devolvió anuncios tras filtrar. Conteo raw:", counts_raw)
         return pd.DataFrame()
     
     combined = pd.concat(frames, ignore_index=True, sort=False)
@@ -137,6 +549,8 @@ def run_all_scrapers(zona: str = "", dormitorios: str = "0", banos: str = "0",
     combined = combined[~combined["link"].str.startswith("#")].reset_index(drop=True)
     combined = combined[combined["link"] != ""].reset_index(drop=True)
     combined = combined.drop_duplicates(subset=["link","titulo"], keep="first").reset_index(drop=True)
+    # El mismo anuncio publicado en varias fuentes: uno solo, con los links alternativos
+    combined = collapse_duplicates(combined, zona)
     
     print(f"Resultados combinados y unificados: {len(combined)}")
     
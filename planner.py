@@ -0,0 +1,105 @@
+import os
+from collections import namedtuple
+from typing import Optional
+
+from cache import get_result_cache
+from scrapers.nestoria import NESTORIA_SERVER_FILTERS
+from scrapers.infocasas import INFOCASAS_SERVER_FILTERS
+from scrapers.urbania import URBANIA_SERVER_FILTERS
+from scrapers.properati import PROPERATI_SERVER_FILTERS
+from scrapers.doomos import DOOMOS_SERVER_FILTERS
+
+# -------------------- Planner de filtros (push-down) --------------------
+# Cada fuente declara qué filtros ya aplica el sitio y con qué semántica (<FUENTE>_SERVER_FILTERS);
+# el planner decide cuáles hace falta repetir en local. Opcionalmente, si en la cache está la
+# búsqueda amplia de la fuente (misma zona, sin filtros; p.ej. la del scheduler) se filtra esa en
+# vez de scrapear. Apagado por defecto: la amplia corta en el tope de páginas / resultados de
+# cada scraper, así que no es un superconjunto completo y se perderían anuncios que el filtro
+# del sitio sí habría devuelto.
+# Configuración (se puede sobreescribir por variables de entorno)
+PLANNER_SUPERSET = os.getenv("PLANNER_SUPERSET", "0") in ("1", "true", "True")  # servir desde la búsqueda amplia en cache
+PLANNER_WIDEN = os.getenv("PLANNER_WIDEN", "0") in ("1", "true", "True")             # si no está: scrapear la amplia una vez y cachearla
+
+SERVER_FILTERS = {
+    "nestoria": NESTORIA_SERVER_FILTERS,
+    "infocasas": INFOCASAS_SERVER_FILTERS,
+    "urbania": URBANIA_SERVER_FILTERS,
+    "properati": PROPERATI_SERVER_FILTERS,
+    "doomos": DOOMOS_SERVER_FILTERS,
+}
+
+# Semánticas del sitio que dejan de sobra el filtro local. El local es exacto en dormitorios y
+# baños ("min" no alcanza) y compara el precio en soles con la conversión de scrapers/prices.py,
+# descartando los avisos sin precio: el rango de ningún sitio equivale a eso.
+COVERS = {
+    "dormitorios": ("exact",),
+    "banos": ("exact",),
+    "precio": (),
+    "palabras_clave": ("text", "amenities"),
+}
+
+QueryPlan = namedtuple("QueryPlan", ["local", "server", "widened"])
+
+def _is_set(params: dict, key: str) -> bool:
+    value = params.get(key)
+    if key in ("price_min", "price_max"):
+        return value is not None
+    return bool(value and str(value).strip() and str(value).strip() != "0")
+
+def requested_filters(params: dict) -> set:
+    """Filtros que pide la búsqueda."""
+    out = {f for f in ("dormitorios", "banos", "palabras_clave") if _is_set(params, f)}
+    if _is_set(params, "price_min") or _is_set(params, "price_max"):
+        out.add("precio")
+    return out
+
+def server_semantics(name: str, params: dict) -> dict:
+    """
+    {filtro: semántica} de lo que el sitio aplica en esta búsqueda. Una declaración
+    (semántica, requisitos) solo vale si la búsqueda trae todos los parámetros requeridos.
+    """
+    out = {}
+    for f, decl in SERVER_FILTERS.get(name, {}).items():
+        if isinstance(decl, tuple):
+            decl, requires = decl
+            if not all(_is_set(params, p) for p in requires):
+                continue
+        out[f] = decl
+    return out
+
+def plan_query(name: str, params: dict, widened: bool = False) -> QueryPlan:
+    """
+    Qué filtros pedidos hay que aplicar en local a lo que devuelve `name`. Con `widened`
+    (filas de la búsqueda amplia) el sitio no aplicó ninguno y van todos en local.
+    """
+    requested = requested_filters(params)
+    server = {} if widened else {f: s for f, s in server_semantics(name, params).items() if f in requested}
+    local = frozenset(f for f in requested if server.get(f) not in COVERS[f])
+    return QueryPlan(local, server, widened)
+
+def local_args(plan: QueryPlan, dormitorios, banos, price_min, price_max, palabras_clave) -> tuple:
+    """Los argumentos de los filtros locales según el plan (los que no van, apagados)."""
+    local = plan.local
+    return (
+        dormitorios if "dormitorios" in local else "0",
+        banos if "banos" in local else "0",
+        price_min if "precio" in local else None,
+        price_max if "precio" in local else None,
+        palabras_clave if "palabras_clave" in local else "",
+    )
+
+def widen(params: dict) -> dict:
+    """La búsqueda amplia: misma zona y sin filtros (la que crawlea el scheduler)."""
+    return dict(params, dormitorios="0", banos="0", price_min=None, price_max=None, palabras_clave="")
+
+def cached_superset(name: str, params: dict) -> Optional[list]:
+    """
+    Records frescos de la búsqueda amplia de `name` en la cache, o None si no están, si la
+    búsqueda ya es amplia o si vino vacía (posible fallo de la fuente: mejor scrapear).
+    """
+    if not PLANNER_SUPERSET or not requested_filters(params):
+        return None
+    return get_result_cache().peek(name, widen(params), fresh_only=True) or None
+
+def put_superset(name: str, params: dict, records: list):
+    get_result_cache().put(name, widen(params), records)
@@ -0,0 +1,241 @@
+import os
+import math
+import time
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from orchestrator import SCRAPERS, _call_scraper, _source_metrics, _record_health, combine_source_results
+from health import get_source_health
+from cache import CACHE_BACKEND, get_result_cache
+from store import save_scraped
+from scrapers.common import DATA_DIR, ResultsBuffer
+from scrapers.listing import public_frame
+from scrapers.zones import ZONAS_LIMA, zone_key, canonical_zone
+
+try:
+    import fcntl
+except ImportError:  # Windows (desarrollo local): sin lock entre procesos
+    fcntl = None
+
+# -------------------- Scheduler de crawls en segundo plano --------------------
+# Configuración (se puede sobreescribir por variables de entorno)
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "0") in ("1", "true", "True")
+SCHEDULER_PATH = os.getenv("SCHEDULER_PATH", os.path.join(DATA_DIR, "scheduler.sqlite"))
+SCHEDULER_INTERVAL = int(os.getenv("SCHEDULER_INTERVAL", str(6 * 3600)))  # re-crawl de cada zona/fuente
+SCHEDULER_TICK = int(os.getenv("SCHEDULER_TICK", "60"))                   # cada cuánto se revisa qué toca
+SCHEDULER_BATCH = int(os.getenv("SCHEDULER_BATCH", "10"))                 # crawls máximos por tick
+SCHEDULER_MAX_WORKERS = int(os.getenv("SCHEDULER_MAX_WORKERS", "3"))
+SCHEDULER_SOURCE_CONCURRENCY = int(os.getenv("SCHEDULER_SOURCE_CONCURRENCY", "1"))
+SCHEDULER_JITTER = float(os.getenv("SCHEDULER_JITTER", "20"))             # segundos aleatorios antes de cada crawl
+POPULARITY_HALF_LIFE = float(os.getenv("SCHEDULER_POPULARITY_HALF_LIFE", str(3 * 24 * 3600)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS popularidad (zona TEXT PRIMARY KEY, hits REAL, last_request REAL);
+CREATE TABLE IF NOT EXISTS crawls (fuente TEXT, zona TEXT, last_crawl REAL, last_count INTEGER,
+                                   PRIMARY KEY (fuente, zona));
+"""
+
+def _zona_key(zona: str) -> str:
+    """Clave del distrito (resuelve alias y errores de tipeo con el registro de zonas)."""
+    return zone_key(canonical_zone(zona))
+
+# zona normalizada -> nombre canónico del distrito (el que entienden los scrapers)
+_ZONAS = {zone_key(z): z for z in ZONAS_LIMA}
+_ZONAS[""] = ""
+
+class CrawlScheduler:
+    """
+    Re-crawlea cada zona de cada fuente cada `interval` segundos, priorizando las zonas
+    más pedidas y los datos más viejos, y escribe en la cache de resultados y en el store.
+    """
+    def __init__(self, path: str = SCHEDULER_PATH, interval: int = SCHEDULER_INTERVAL,
+                 batch: int = SCHEDULER_BATCH, max_workers: int = SCHEDULER_MAX_WORKERS,
+                 source_concurrency: int = SCHEDULER_SOURCE_CONCURRENCY, jitter: float = SCHEDULER_JITTER):
+        self.path = path
+        self.interval = interval
+        self.batch = batch
+        self.max_workers = max(1, max_workers)
+        self.jitter = jitter
+        self._source_slots = {name: threading.Semaphore(max(1, source_concurrency)) for name, _ in SCRAPERS}
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock_file = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # ---- popularidad ----
+    def record_request(self, zona: str):
+        """Suma un hit (con decaimiento exponencial) a la zona pedida por un usuario."""
+        key = _zona_key(zona)
+        if key not in _ZONAS:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT hits, last_request FROM popularidad WHERE zona = ?", (key,)).fetchone()
+            hits = 0.0
+            if row:
+                hits = row[0] * math.pow(0.5, (now - row[1]) / POPULARITY_HALF_LIFE)
+            conn.execute("INSERT OR REPLACE INTO popularidad VALUES (?, ?, ?)", (key, hits + 1, now))
+
+    # ---- planificación ----
+    def due_crawls(self, now=None):
+        """Pares (fuente, zona) vencidos, ordenados por popularidad y antigüedad de los datos."""
+        now = now or time.time()
+        with self._connect() as conn:
+            pop = {z: h * math.pow(0.5, (now - t) / POPULARITY_HALF_LIFE)
+                   for z, h, t in conn.execute("SELECT zona, hits, last_request FROM popularidad")}
+            last = {(f, z): t for f, z, t in conn.execute("SELECT fuente, zona, last_crawl FROM crawls")}
+        due = []
+        for name, _ in SCRAPERS:
+            for key in _ZONAS:
+                age = now - last.get((name, key), 0)
+                if age < self.interval:
+                    continue
+                staleness = min(age / self.interval, 10.0)
+                due.append(((1.0 + pop.get(key, 0.0)) * staleness, key, name))
+        # a igual prioridad, las fuentes de una misma zona quedan juntas en el lote
+        due.sort(reverse=True)
+        return [(name, key) for _, key, name in due]
+
+    def _crawl(self, name: str, key: str):
+        """Scrapea una zona de una fuente sin filtros y guarda en store + cache."""
+        func = dict(SCRAPERS)[name]
+        zona = _ZONAS[key]
+        params = dict(zona=zona, dormitorios="0", banos="0", price_min=None, price_max=None, palabras_clave="")
+        with self._source_slots[name]:
+            if self._stop.wait(random.uniform(0, self.jitter)):
+                return None
+            if not get_source_health().allow(name):
+                print(f"🗓️ Crawl {name} / '{zona or 'lima (todo)'}': circuito abierto, se posterga")
+                return None
+            t0 = time.monotonic()
+            buf = ResultsBuffer()
+            df = _call_scraper(name, func, buf, **params)
+            _record_health(name, _source_metrics(buf, "ok", t0))
+            save_scraped(df, fuente=name, zona=zona)
+            # fresco hasta el próximo crawl (el TTL por fuente vencería horas antes)
+            get_result_cache().put(name, params, public_frame(df).to_dict('records') if df is not None else [],
+                                   ttl=self.interval)
+        count = 0 if df is None else len(df)
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO crawls VALUES (?, ?, ?, ?)", (name, key, time.time(), count))
+        print(f"🗓️ Crawl {name} / '{zona or 'lima (todo)'}': {count} anuncios en {time.monotonic() - t0:.1f}s")
+        return df
+
+    def run_once(self):
+        """Ejecuta un lote de crawls vencidos respetando la concurrencia por fuente."""
+        todo = self.due_crawls()[:self.batch]
+        if not todo:
+            return 0
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="crawl") as ex:
+            futures = {ex.submit(self._crawl, name, key): (name, key) for name, key in todo}
+            by_zone = {}
+            for f, (name, key) in futures.items():
+                try:
+                    df = f.result()
+                except Exception as e:
+                    print(f"Error en crawl {name}/{key}: {e}")
+                    continue
+                if df is not None:
+                    by_zone.setdefault(key, {})[name] = df
+        # si en este lote se crawlearon todas las fuentes de una zona, precalentar también /scrape-all
+        for key, dfs in by_zone.items():
+            if len(dfs) == len(SCRAPERS):
+                params = dict(zona=_ZONAS[key], dormitorios="0", banos="0", price_min=None, price_max=None, palabras_clave="")
+                get_result_cache().put("all", params, combine_source_results(dfs, zona=_ZONAS[key]).to_dict('records'), ttl=self.interval)
+        return len(todo)
+
+    # ---- ciclo de vida ----
+    def _acquire_leader_lock(self) -> bool:
+        """Solo un proceso (worker de gunicorn) por máquina ejecuta el scheduler."""
+        if fcntl is None:
+            return True
+        f = open(self.path + ".lock", "w")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._lock_file = f
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error en el scheduler: {e}")
+            self._stop.wait(SCHEDULER_TICK)
+
+    def start(self) -> bool:
+        if self._thread is not None:
+            return True
+        if not self._acquire_leader_lock():
+            return False
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="crawl-scheduler")
+        self._thread.start()
+        print("🗓️ Scheduler de crawls iniciado")
+        return True
+
+    def stop(self):
+        self._stop.set()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> CrawlScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = CrawlScheduler()
+        return _scheduler
+
+def _web_workers() -> int:
+    """Procesos que atienden requests: gunicorn.conf.py exporta GUNICORN_WORKERS; sin gunicorn, uno."""
+    try:
+        return max(1, int(os.getenv("GUNICORN_WORKERS", "1")))
+    except ValueError:
+        return 1
+
+def scheduler_active() -> bool:
+    """
+    SCHEDULER_ENABLED y una cache que vean todos los workers: con la cache en memoria y
+    varios workers solo el proceso líder vería lo precalentado.
+    """
+    if not SCHEDULER_ENABLED:
+        return False
+    return CACHE_BACKEND == "sqlite" or _web_workers() == 1
+
+def record_zone_request(zona: str):
+    """Registra la zona pedida por un usuario (nunca rompe el request; nada si no hay scheduler)."""
+    if not scheduler_active():
+        return
+    try:
+        get_scheduler().record_request(zona)
+    except Exception as e:
+        print(f"Error registrando popularidad de zona: {e}")
+
+def start_scheduler() -> bool:
+    if not SCHEDULER_ENABLED:
+        return False
+    if not scheduler_active():
+        print(f"⚠️ Con {_web_workers()} workers el scheduler requiere RESULT_CACHE_BACKEND=sqlite "
+              f"(cache compartida entre workers); scheduler desactivado")
+        return False
+    return get_scheduler().start()
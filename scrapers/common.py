@@ -3,7 +3,7 @@ import time
 import requests
 import pandas as pd
 from typing import Optional
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 
 # Imports de Selenium
 from selenium import webdriver
@@ -15,10 +15,97 @@ from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 import os
 import shutil
+import threading
+from contextlib import contextmanager
+
+# Patrones precompilados de precio / enteros / m²
+from .features import first_int, m2_from_text
+from .prices import parse_price, price_pen
+# Directorio para datos persistentes (caches, base de datos local)
+DATA_DIR = os.getenv("SCRAPER_DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+
 # User Agent Común
 COMMON_UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
              "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/140.0.0.0 Safari/537.36")
 
+# -------------------- Perfil de bloqueo de recursos --------------------
+# Los scrapers solo leen el DOM (el `src` de las imágenes, no sus bytes): no se descargan
+# imágenes, fuentes ni scripts de analítica/publicidad.
+BLOCK_RESOURCES = os.getenv("SCRAPER_BLOCK_RESOURCES", "1") not in ("0", "false", "False")
+PAGE_LOAD_STRATEGY = os.getenv("SCRAPER_PAGE_LOAD_STRATEGY", "eager")  # "eager": no esperar imágenes/iframes
+BLOCKED_URL_PATTERNS = [
+    # imágenes y fuentes
+    "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    # video
+    "*.mp4", "*.webm",
+    # analítica, publicidad y widgets de terceros
+    "*google-analytics.com*", "*googletagmanager.com*", "*googlesyndication.com*",
+    "*doubleclick.net*", "*googleadservices.com*", "*adservice.google.*",
+    "*facebook.net*", "*connect.facebook.*", "*hotjar.com*", "*clarity.ms*",
+    "*criteo.*", "*taboola.com*", "*outbrain.com*", "*tiktok.com*", "*hubspot*",
+    "*newrelic.com*", "*nr-data.net*", "*segment.io*", "*cdn.segment.com*",
+    "*onesignal.com*", "*intercom.io*", "*zopim.com*", "*zdassets.com*",
+    "*maps.googleapis.com*", "*youtube.com*",
+]
+# Patrones que NO se bloquean en cada fuente (si el listado depende de ellos para armarse)
+RESOURCE_ALLOWLIST = {
+    "nestoria": [],
+    "infocasas": [],
+    "urbania": [],
+    "doomos": [],
+}
+
+def _allowlist_for(source: str) -> list:
+    env = os.getenv(f"SCRAPER_RESOURCE_ALLOW_{(source or '').upper()}", "")
+    return RESOURCE_ALLOWLIST.get(source, []) + [p.strip() for p in env.split(",") if p.strip()]
+
+def apply_resource_profile(driver, source: str = ""):
+    """Aplica (vía CDP) los bloqueos de la fuente al driver. Solo reenvía si cambió de fuente."""
+    if not BLOCK_RESOURCES or getattr(driver, "_resource_profile", None) == source:
+        return
+    allowed = set(_allowlist_for(source))
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": [p for p in BLOCKED_URL_PATTERNS if p not in allowed]})
+        driver._resource_profile = source
+    except Exception as e:
+        print(f"No se pudo aplicar el bloqueo de recursos: {e}")
+
+# bytes transferidos (documento + recursos no bloqueados; los de otros dominios sin
+# Timing-Allow-Origin cuentan 0) y cantidad de requests de la navegación
+_JS_PAGE_METRICS = """
+const nav = performance.getEntriesByType('navigation')[0];
+const res = performance.getEntriesByType('resource');
+let bytes = nav ? (nav.transferSize || 0) : 0;
+for (const r of res) bytes += (r.transferSize || 0);
+return {bytes: bytes, requests: res.length + 1, status: nav ? (nav.responseStatus || 0) : 0};
+"""
+
+def load_page(driver, url: str, metrics: Optional[dict] = None, source: str = ""):
+    """
+    driver.get(url) con el perfil de bloqueo de la fuente y turno del rate limiter del host,
+    acumulando en `metrics` páginas, bytes transferidos, requests y tiempo de carga (ms).
+    """
+    # import local: ratelimit importa DATA_DIR de este módulo
+    from .ratelimit import wait_turn, report_status
+    apply_resource_profile(driver, source)
+    wait_turn(url)
+    t0 = time.monotonic()
+    driver.get(url)
+    elapsed_ms = int((time.monotonic() - t0) * 1000)
+    try:
+        page = driver.execute_script(_JS_PAGE_METRICS) or {}
+    except Exception:
+        page = {}
+    report_status(url, page.get("status"))
+    if metrics is None:
+        return
+    metrics["pages"] = metrics.get("pages", 0) + 1
+    metrics["load_ms"] = metrics.get("load_ms", 0) + elapsed_ms
+    metrics["bytes"] = metrics.get("bytes", 0) + int(page.get("bytes") or 0)
+    metrics["requests"] = metrics.get("requests", 0) + int(page.get("requests") or 0)
+
 # -------------------- Helpers --------------------
 
 def create_driver(headless: bool = True):
@@ -35,6 +122,11 @@ def create_driver(headless: bool = True):
     options.add_experimental_option("excludeSwitches", ["enable-automation"])
     options.add_experimental_option('useAutomationExtension', False)
 
+    # Cargar solo lo necesario: DOM listo sin esperar imágenes, y sin descargar imágenes
+    options.page_load_strategy = PAGE_LOAD_STRATEGY
+    if BLOCK_RESOURCES:
+        options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+
     system_chrome = shutil.which("chromium") or shutil.which("google-chrome")
     system_driver = shutil.which("chromedriver")
 
@@ -59,9 +151,166 @@ def create_driver(headless: bool = True):
         })
     except Exception:
         pass
-        
+
+    apply_resource_profile(driver)
     return driver
 
+# -------------------- Esperas adaptativas --------------------
+_JS_COUNT = "return document.querySelectorAll(arguments[0]).length;"
+_JS_COUNT_AND_HEIGHT = ("return [document.querySelectorAll(arguments[0]).length, "
+                        "document.body ? document.body.scrollHeight : 0];")
+
+class Readiness:
+    """
+    Condición de "página lista" que declara cada scraper:
+    selector de las cards, timeout de aparición y cuánto scroll de carga perezosa hacer.
+    """
+    def __init__(self, selector: str, timeout: float = 10.0, max_scrolls: int = 0, settle: float = 0.8):
+        self.selector = selector
+        self.timeout = timeout
+        self.max_scrolls = max_scrolls
+        self.settle = settle
+
+def _count(driver, css: str) -> int:
+    try:
+        return int(driver.execute_script(_JS_COUNT, css) or 0)
+    except Exception:
+        return 0
+
+def wait_for_selector(driver, css: str, timeout: float = 10.0, poll: float = 0.2) -> bool:
+    """Espera hasta que exista al menos un elemento `css`. Devuelve False si vence el timeout."""
+    deadline = time.monotonic() + timeout
+    while True:
+        if _count(driver, css) > 0:
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(poll)
+
+def wait_for_stable_count(driver, css: str, timeout: float = 6.0, poll: float = 0.25, stable_polls: int = 2) -> int:
+    """Espera a que el número de elementos `css` deje de cambiar. Devuelve el conteo final."""
+    deadline = time.monotonic() + timeout
+    last, stable = _count(driver, css), 0
+    while time.monotonic() < deadline and stable < stable_polls:
+        time.sleep(poll)
+        n = _count(driver, css)
+        stable = stable + 1 if n == last else 0
+        last = n
+    return last
+
+def scroll_until_stable(driver, css: str, max_scrolls: int = 8, settle: float = 0.8, poll: float = 0.15) -> int:
+    """
+    Hace scroll al fondo mientras la página siga creciendo (altura del documento o
+    número de cards). Tras cada scroll espera como máximo `settle` segundos a que aparezca
+    contenido nuevo; si no aparece, deja de hacer scroll. Devuelve el número de cards.
+    """
+    try:
+        count, height = driver.execute_script(_JS_COUNT_AND_HEIGHT, css)
+    except Exception:
+        return 0
+    for _ in range(max_scrolls):
+        try:
+            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        except Exception:
+            break
+        grew = False
+        deadline = time.monotonic() + settle
+        while time.monotonic() < deadline:
+            time.sleep(poll)
+            try:
+                new_count, new_height = driver.execute_script(_JS_COUNT_AND_HEIGHT, css)
+            except Exception:
+                break
+            if new_count > count or new_height > height:
+                count, height, grew = new_count, new_height, True
+                break
+        if not grew:
+            break
+    return count
+
+def wait_until_ready(driver, readiness: Readiness) -> bool:
+    """Espera la condición declarada por el scraper. Devuelve False si las cards nunca aparecieron."""
+    if not wait_for_selector(driver, readiness.selector, timeout=readiness.timeout):
+        return False
+    if readiness.max_scrolls > 0:
+        scroll_until_stable(driver, readiness.selector, max_scrolls=readiness.max_scrolls, settle=readiness.settle)
+    else:
+        wait_for_stable_count(driver, readiness.selector, timeout=readiness.settle * 3)
+    return True
+
+def page_marker(driver, css: str):
+    """Captura el primer elemento `css` y el conteo actual, para detectar un cambio de página."""
+    try:
+        elems = driver.find_elements(By.CSS_SELECTOR, css)
+    except Exception:
+        elems = []
+    return (elems[0] if elems else None, len(elems))
+
+def wait_for_page_change(driver, marker, css: str, timeout: float = 5.0, poll: float = 0.2) -> bool:
+    """Espera a que el primer elemento capturado quede obsoleto o cambie el número de cards."""
+    first, count = marker
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if first is not None:
+            try:
+                first.is_enabled()  # lanza StaleElementReferenceException si la página cambió
+            except Exception:
+                return wait_for_selector(driver, css, timeout=max(0.0, deadline - time.monotonic()))
+        if _count(driver, css) != count:
+            return True
+        time.sleep(poll)
+    return False
+
+# -------------------- Parseo HTML --------------------
+# Backend de BeautifulSoup: "lxml" (C, bastante más rápido) si está instalado, si no "html.parser"
+try:
+    import lxml  # noqa: F401
+    _DEFAULT_PARSER = "lxml"
+except ImportError:
+    _DEFAULT_PARSER = "html.parser"
+HTML_PARSER = os.getenv("SCRAPER_HTML_PARSER", _DEFAULT_PARSER)
+
+def make_soup(html: str, parse_only: Optional[SoupStrainer] = None) -> BeautifulSoup:
+    """BeautifulSoup con el backend configurado; `parse_only` restringe el árbol a los nodos del strainer."""
+    return BeautifulSoup(html or "", HTML_PARSER, parse_only=parse_only)
+
+class ParsedPage:
+    """
+    Una página parseada una sola vez por llamada.
+    Con `only` (SoupStrainer de los contenedores de resultados) primero se arma un árbol solo
+    con las cards; si un selector no encuentra nada ahí (cambió el markup, selectores de
+    fallback) se parsea la página completa, también una sola vez.
+    """
+    def __init__(self, html: str, only: Optional[SoupStrainer] = None):
+        self.html = html or ""
+        self.only = only
+        self._scoped = make_soup(self.html, only) if only is not None else None
+        self._full = None
+
+    @property
+    def full(self) -> BeautifulSoup:
+        if self._full is None:
+            self._full = make_soup(self.html)
+        return self._full
+
+    def select(self, css: str) -> list:
+        if self._scoped is not None:
+            found = self._scoped.select(css)
+            if found:
+                return found
+        return self.full.select(css)
+
+    def select_one(self, css: str):
+        if self._scoped is not None:
+            found = self._scoped.select_one(css)
+            if found is not None:
+                return found
+        return self.full.select_one(css)
+
+def as_page(html, only: Optional[SoupStrainer] = None) -> ParsedPage:
+    """Acepta HTML o una ParsedPage ya parseada (p.ej. por el fetch HTTP) para no parsear dos veces."""
+    return html if isinstance(html, ParsedPage) else ParsedPage(html, only=only)
+
 def slugify_zone(zona: str) -> str:
     if not zona:
         return ""
@@ -72,27 +321,32 @@ def slugify_zone(zona: str) -> str:
     s = re.sub(r"[^a-z0-9\-]", "", s)
     return s
 
+def canonical_link(link: str) -> str:
+    """Link canónico para identificar un anuncio: sin fragmento, sin parámetros de tracking ni '/' final."""
+    if not link:
+        return ""
+    from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+    try:
+        parts = urlsplit(str(link).strip())
+    except ValueError:
+        return str(link).strip()
+    if not parts.scheme or not parts.netloc:
+        return str(link).strip()
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if not k.lower().startswith("utm_") and k.lower() not in ("gclid", "fbclid")]
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(query), ""))
+
 def parse_precio_con_moneda(precio_str):
-    if not precio_str:
-        return (None, None)
-    s = str(precio_str)
-    moneda = None
-    if "S/" in s or s.strip().startswith("S/"):
-        moneda = "S"
-    elif "$" in s:
-        moneda = "USD"
-    nums = re.sub(r"[^\d]", "", s)
-    return (moneda, int(nums)) if nums else (moneda, None)
+    """("S" / "USD" / None, monto entero) del texto del precio (ver prices.parse_price)."""
+    return parse_price(precio_str)
 
 def _extract_m2(s):
-    if s is None:
-        return None
-    m = re.search(r"(\d{1,4})\s*(m²|m2)", str(s), flags=re.I)
-    return int(m.group(1)) if m else None
+    return m2_from_text(s)
 
 def _parse_price_soles(s):
-    moneda, val = parse_precio_con_moneda(str(s))
-    return val if moneda == "S" else None
+    """Precio en soles (los dólares se convierten con la tabla de prices.TASAS_A_SOLES)."""
+    return price_pen(s)
 
 def normalize_text(text):
     """Elimina acentos y pasa a minúsculas"""
@@ -104,9 +358,106 @@ def _extract_int_from_text(s):
     Extrae el primer número entero de una cadena de texto.
     Es más robusta y maneja espacios, saltos de línea y caracteres especiales.
     """
-    if s is None:
-        return None
-    text = str(s).strip()
-    text = re.sub(r'\s+', ' ', text)
-    m = re.search(r'(\d+)', text)
-    return int(m.group(1)) if m else None
\ No newline at end of file
+    return first_int(s)
+
+# -------------------- Resultados parciales --------------------
+_results_ctx = threading.local()
+
+class ResultsBuffer(list):
+    """
+    Lista de resultados de un scraper que el orquestador puede leer mientras
+    el scraper sigue corriendo (para devolver resultados parciales si hay timeout
+    o para ir generando los anuncios a medida que llegan).
+    """
+    def __init__(self, on_append=None):
+        super().__init__()
+        self._cancel = threading.Event()
+        self.metrics = {}  # lo que el scraper quiera reportar (p.ej. "engine": "http" / "selenium")
+        self._on_append = on_append  # callback sin argumentos tras cada append/extend
+
+    def append(self, item):
+        super().append(item)
+        if self._on_append is not None:
+            self._on_append()
+
+    def extend(self, items):
+        super().extend(items)
+        if self._on_append is not None:
+            self._on_append()
+
+    def cancel(self):
+        """Pide al scraper que deje de procesar más anuncios."""
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def snapshot(self):
+        return list(self)
+
+def results_buffer() -> ResultsBuffer:
+    """
+    Devuelve el buffer asignado al hilo actual por el orquestador,
+    o uno nuevo si el scraper se llama directamente.
+    """
+    buf = getattr(_results_ctx, "buffer", None)
+    return buf if buf is not None else ResultsBuffer()
+
+@contextmanager
+def bind_results_buffer(buf: ResultsBuffer):
+    """Asigna `buf` como buffer de resultados del hilo actual."""
+    _results_ctx.buffer = buf
+    try:
+        yield buf
+    finally:
+        _results_ctx.buffer = None
+
+# Columnas de un anuncio (todas texto)
+LISTING_COLUMNS = ["titulo", "precio", "m2", "dormitorios", "baños", "descripcion", "link", "imagen_url"]
+
+def normalize_row(row: dict) -> dict:
+    """Mismo normalizado que el orquestador aplica al DataFrame: columnas fijas, texto sin espacios ni "None"."""
+    out = {}
+    for col in LISTING_COLUMNS:
+        value = row.get(col)
+        value = "" if value is None or value != value else str(value).strip()  # value != value: NaN
+        out[col] = "" if value == "None" else value
+    return out
+
+def iter_results(scrape, poll: float = 1.0, **params):
+    """
+    Ejecuta `scrape(**params)` en un hilo y genera cada anuncio (normalizado) en cuanto
+    el scraper lo agrega a su buffer, sin esperar al DataFrame final. Si el consumidor
+    deja de iterar se cancela el scraper. Los campos que el scraper complete al final
+    (p.ej. la imagen de detalle de Nestoria) no se actualizan en lo ya generado.
+    """
+    arrived = threading.Event()
+    finished = threading.Event()
+    buf = ResultsBuffer(on_append=arrived.set)
+
+    def _run():
+        with bind_results_buffer(buf):
+            try:
+                scrape(**params)
+            except Exception as e:
+                print(f" ❌ Error ejecutando {getattr(scrape, '__name__', scrape)}:", e)
+            finally:
+                finished.set()
+                arrived.set()
+
+    threading.Thread(target=_run, name="iter-scraper", daemon=True).start()
+    i = 0
+    try:
+        while True:
+            arrived.wait(timeout=poll)
+            arrived.clear()
+            done = finished.is_set()
+            rows = buf[i:]
+            i += len(rows)
+            for row in rows:
+                yield normalize_row(row)
+            if done and i >= len(buf):
+                return
+    finally:
+        buf.cancel()
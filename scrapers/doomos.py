@@ -1,197 +1,227 @@
+import os
 import re
-import time
 import requests
 from typing import Optional
-import pandas as pd
-from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
 
 # Imports locales desde el módulo 'common'
 from .common import (
-    create_driver
+    load_page,
+    as_page,
+    results_buffer,
+    Readiness,
+    wait_until_ready
 )
+from .driver_pool import acquire_driver, release_driver
+from .extract import extract_cards, append_rows
+from .features import Features, card_features, card_features_many
+from .fetch import fetch_listing
+from .listing import Listing, listings_frame
+from .paginate import (
+    PAGE_WORKERS, set_query_param, page_plan, merge_new, fetch_pages, http_pages,
+    driver_hrefs, last_linked_page, driver_fanout
+)
+from .zones import resolve_zone
 
 # -------------------- Doomos --------------------
+# Condición de "página lista": cards de resultados, con hasta 3 scrolls de carga
+DOOMOS_READY = Readiness(".content_result", timeout=10, max_scrolls=3, settle=1.0)
+# Parseo acotado a las cards del listado
+DOOMOS_ONLY = SoupStrainer(class_="content_result")
+# Páginas del listado (parámetro pagina=) a recorrer como máximo
+DOOMOS_MAX_PAGES = int(os.getenv("DOOMOS_MAX_PAGES", "3"))
+# Valor monetario dentro del texto del precio: "S/ 1.680" o "US$ 480"
+_RE_DOOMOS_PRECIO = re.compile(r"(S/|US\$)\s*[\d\.,]+")
+
+# Filtros que ya aplica el sitio (ver planner.py): el keyword busca en el texto del aviso
+DOOMOS_SERVER_FILTERS = {"dormitorios": "min", "banos": "min", "precio": "range", "palabras_clave": "text"}
+
+def build_doomos_url(zona: str = "", dormitorios: str = "0", banos: str = "0",
+                     price_min: Optional[int] = None, price_max: Optional[int] = None,
+                     palabras_clave: str = "") -> str:
+    # Construir URL base CORRECTA para Doomos
+    base_url = "http://www.doomos.com.pe/search/"
+
+    # Parámetros base
+    params = {
+        "clase": "1",  # Departamentos
+        "stipo": "16",  # Alquiler
+        "pagina": "1",
+        "sort": "primeasc"
+    }
+
+    # Si NO se especifica zona, usar LIMA por defecto con el ID CORRECTO
+    if not zona or not zona.strip():
+        params["loc_name"] = "Lima (Región de Lima)"
+        params["loc_id"] = "-352647"  # ← ¡¡¡ESTA ES LA LÍNEA CORREGIDA!!!
+    else:
+        zone = resolve_zone(zona)
+        loc_id = zone.doomos_id if zone is not None else ""
+        zona_formateada = f"{zone.name if zone is not None else zona.strip()} (Región de Lima)"
+        params["loc_name"] = zona_formateada
+        if loc_id:
+            params["loc_id"] = loc_id
+
+    # Agregar filtros opcionales
+    if dormitorios and dormitorios != "0":
+        params["piezas"] = dormitorios
+    if banos and banos != "0":
+        params["banos"] = banos
+    if price_min is not None:
+        params["preciomin"] = str(price_min)
+    if price_max is not None:
+        params["preciomax"] = str(price_max)
+    if palabras_clave and palabras_clave.strip():
+        params["keyword"] = palabras_clave.strip()
+
+    # Construir URL completa
+    url = base_url + "?" + "&".join(f"{k}={requests.utils.quote(str(v))}" for k, v in params.items())
+    return url
+
+# Extracción en el navegador (mismos selectores que el parseo con BeautifulSoup)
+DOOMOS_JS_SPEC = {
+    "cards": [".content_result"],
+    "text": 400,
+    "fields": {
+        "link": {"sel": [".content_result_titulo a"], "attr": ["href"]},
+        "title": {"sel": [".content_result_titulo a"]},
+        "price": {"sel": [".content_result_precio"]},
+        "desc": {"sel": [".content_result_descripcion"]},
+        "img": {"sel": ["img.content_result_image"], "attr": ["src", "data-src"]},
+    },
+}
+
+def _doomos_row(raw: dict, feats: Optional[Features] = None) -> Optional[Listing]:
+    """Arma el anuncio con los campos crudos de una card (vengan de BeautifulSoup o del JS)."""
+    # Link y título
+    href = raw.get("link")
+    if href is None:
+        return None
+    title = raw.get("title") or ""
+
+    # Construir URL completa si es relativa
+    if href and href.startswith("/"):
+        href = "http://www.doomos.com.pe" + href
+
+    # Precio (TEXTO COMPLETO)
+    price_full_text = raw.get("price") or ""
+
+    # EXTRAER DORMITORIOS ("dormitorio" o "hab."), BAÑOS Y M2 DEL TEXTO DEL PRECIO
+    if feats is None:
+        feats = card_features(price_full_text)
+
+    # LIMPIAR EL CAMPO "precio" PARA QUE SOLO CONTENGA EL VALOR MONETARIO
+    # Buscar el patrón: "S/ 1.680" o "US$ 480"
+    precio_limpio = ""
+    match_precio = _RE_DOOMOS_PRECIO.search(price_full_text)
+    if match_precio:
+        precio_limpio = match_precio.group(0).strip()
+    else:
+        # Si no coincide el patrón, dejar el texto original como fallback
+        precio_limpio = price_full_text
+
+    # Descripción
+    desc = raw["desc"] if raw.get("desc") is not None else (raw.get("text") or "")[:400]
+
+    # IMAGEN DIRECTAMENTE DEL LISTADO (NO ENTRAR AL DETALLE)
+    img_url = raw.get("img") or ""
+    if img_url and img_url.startswith("//"):
+        img_url = "https:" + img_url
+    img_url = img_url.strip()
+
+    return Listing(
+        titulo=title,
+        precio=precio_limpio,  # ← ¡CAMBIO CLAVE AQUÍ!
+        m2=feats.m2,
+        dormitorios=feats.dormitorios,
+        banos=feats.banos,
+        descripcion=desc,
+        link=href,
+        imagen_url=img_url
+    )
+
+def parse_doomos_html(html: str, results: Optional[list] = None) -> list:
+    """Parsea el listado de Doomos (sin navegador) y agrega los anuncios a `results`."""
+    if results is None:
+        results = []
+    cards = as_page(html, only=DOOMOS_ONLY).select(".content_result")
+
+    if not cards:
+        print("No se encontraron cards en Doomos")
+        return results
+
+    print(f"Se encontraron {len(cards)} cards en Doomos")
+
+    for card in cards:
+        if getattr(results, "cancelled", False):
+            break
+        try:
+            a_tag = card.select_one(".content_result_titulo a")
+            if not a_tag:
+                continue
+            price_elem = card.select_one(".content_result_precio")
+            desc_elem = card.select_one(".content_result_descripcion")
+            img_tag = card.select_one("img.content_result_image")
+            row = _doomos_row({
+                "link": a_tag.get("href") or "",
+                "title": a_tag.get_text(" ", strip=True),
+                "price": price_elem.get_text(" ", strip=True) if price_elem else "",
+                "desc": desc_elem.get_text(" ", strip=True) if desc_elem else None,
+                "text": card.get_text(" ", strip=True)[:400] if not desc_elem else "",
+                "img": (img_tag.get("src") or img_tag.get("data-src") or "") if img_tag else "",
+            })
+            if row:
+                results.append(row)
+
+        except Exception as e:
+            print(f"Error procesando card en Doomos: {e}")
+            continue
+
+    return results
+
+def _page_rows_driver(driver, url: str, metrics: dict) -> list:
+    load_page(driver, url, metrics, "doomos")
+    # Esperar a las cards y hacer scroll solo mientras carguen más
+    wait_until_ready(driver, DOOMOS_READY)
+    items = extract_cards(driver, DOOMOS_JS_SPEC, "Doomos")
+    if items:
+        feats = card_features_many(raw.get("price") or "" for raw in items)
+        return append_rows([], list(zip(items, feats)), lambda item: _doomos_row(*item))
+    return parse_doomos_html(driver.page_source)
+
 def scrape_doomos(zona: str = "", dormitorios: str = "0", banos: str = "0",
                     price_min: Optional[int] = None, price_max: Optional[int] = None,
-                    palabras_clave: str = ""):
-    driver = create_driver(headless=True)
-    results = []
+                    palabras_clave: str = "", max_pages: int = DOOMOS_MAX_PAGES,
+                    max_results: Optional[int] = None):
+    url = build_doomos_url(zona, dormitorios, banos, price_min, price_max, palabras_clave)
+    print(f"URL de Doomos: {url}")
+    results = results_buffer()
+    seen = set()
+    # Primero HTTP plano: si el HTML del servidor ya trae las cards no hace falta navegador
+    page = fetch_listing(url, DOOMOS_READY.selector, "doomos", only=DOOMOS_ONLY, metrics=results.metrics)
+    if page is not None:
+        results.metrics["engine"] = "http"
+        if merge_new(parse_doomos_html(page), seen, results, max_results):
+            # siguientes páginas (pagina=N) en paralelo con la misma sesión
+            http_pages(url, page, "pagina", parse_doomos_html, "doomos", seen, results, max_pages,
+                       max_results, only=DOOMOS_ONLY)
+        return listings_frame(results)
+    results.metrics["engine"] = "selenium"
+    driver = acquire_driver()
     try:
-        # Mapeo ACTUALIZADO de zonas a sus IDs específicos para Doomos
-        ZONA_IDS_CORRECTOS = {
-            "ancón": "-336912",
-            "ate": "-337679",
-            "breña": "65645345",
-            "carabayllo": "-339907",
-            "chaclacayo": "-341190",
-            "chorrillos": "-342811",
-            "cieneguilla": "-343329",
-            "comas": "-343903",
-            "el agustino": "-345552",
-            "jesús maría": "348294",
-            "la molina": "-351740",
-            "la victoria": "-352442",
-            "lima": "45343445",  # Cercado de Lima
-            "lince": "-352696",
-            "los olivos": "191126",
-            "lurigancho": "-353648",
-            "lurín": "-353652",
-            "magdalena del mar": "326245",
-            "miraflores": "-354864",
-            "pachacámac": "-356636",
-            "pucusana": "-359672",
-            "pueblo libre": "-359690",
-            "puente piedra": "-359759",
-            "punta hermosa": "-360186",
-            "punta negra": "-360189",
-            "rímac": "-361308",
-            "san bartolo": "-362154",
-            "san borja": "-362170",
-            "san isidro": "-362425",
-            "san luis": "-362738",
-            "san miguel": "-362804",
-            "santiago de surco": "-364705",
-            "surquillo": "-364723"
-        }
-
-        # Construir URL base CORRECTA para Doomos
-        base_url = "http://www.doomos.com.pe/search/"
-
-        # Parámetros base
-        params = {
-            "clase": "1",  # Departamentos
-            "stipo": "16",  # Alquiler
-            "pagina": "1",
-            "sort": "primeasc"
-        }
-
-        # Si NO se especifica zona, usar LIMA por defecto con el ID CORRECTO
-        if not zona or not zona.strip():
-            params["loc_name"] = "Lima (Región de Lima)"
-            params["loc_id"] = "-352647"  # ← ¡¡¡ESTA ES LA LÍNEA CORREGIDA!!!
-        else:
-            zona_lower = zona.strip().lower()
-            loc_id = ZONA_IDS_CORRECTOS.get(zona_lower, "")
-            zona_formateada = f"{zona.strip()} (Región de Lima)"
-            params["loc_name"] = zona_formateada
-            if loc_id:
-                params["loc_id"] = loc_id
-
-        # Agregar filtros opcionales
-        if dormitorios and dormitorios != "0":
-            params["piezas"] = dormitorios
-        if banos and banos != "0":
-            params["banos"] = banos
-        if price_min is not None:
-            params["preciomin"] = str(price_min)
-        if price_max is not None:
-            params["preciomax"] = str(price_max)
-        if palabras_clave and palabras_clave.strip():
-            params["keyword"] = palabras_clave.strip()
-
-        # Construir URL completa
-        url = base_url + "?" + "&".join(f"{k}={requests.utils.quote(str(v))}" for k, v in params.items())
-        print(f"URL de Doomos: {url}")
-
-        driver.get(url)
-        time.sleep(3)
-
-        # Scroll para cargar más resultados
-        for _ in range(3):
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(1)
-
-        soup = BeautifulSoup(driver.page_source, "html.parser")
-        cards = soup.select(".content_result")
-
-        if not cards:
-            print("No se encontraron cards en Doomos")
-            return pd.DataFrame()
-
-        print(f"Se encontraron {len(cards)} cards en Doomos")
-
-        for card in cards:
-            try:
-                # Extraer link y título
-                a_tag = card.select_one(".content_result_titulo a")
-                if not a_tag:
-                    continue
-
-                title = a_tag.get_text(" ", strip=True)
-                href = a_tag.get("href") or ""
-
-                # Construir URL completa si es relativa
-                if href and href.startswith("/"):
-                    href = "http://www.doomos.com.pe" + href
-
-                # Extraer precio (TEXTO COMPLETO)
-                price_elem = card.select_one(".content_result_precio")
-                price_full_text = price_elem.get_text(" ", strip=True) if price_elem else ""
-
-                # EXTRAER DORMITORIOS, BAÑOS Y M2 DEL TEXTO DEL PRECIO
-                dormitorios_text = ""
-                banos_text = ""
-                m2_text = ""
-
-                price_text_content = price_full_text.lower() if price_full_text else ""
-
-                # 🔥 CORRECCIÓN CLAVE: Buscar "hab." además de "dormitorio"
-                dorm_match = re.search(r'(\d+)\s*(?:dormitorio|hab)', price_text_content)
-                if dorm_match:
-                    dormitorios_text = dorm_match.group(1)
-
-                banos_match = re.search(r'(\d+)\s*baño', price_text_content)
-                if banos_match:
-                    banos_text = banos_match.group(1)
-
-                m2_match = re.search(r'(\d+)\s*m2', price_text_content)
-                if m2_match:
-                    m2_text = m2_match.group(1)
-
-                # LIMPIAR EL CAMPO "precio" PARA QUE SOLO CONTENGA EL VALOR MONETARIO
-                # Buscar el patrón: "S/ 1.680" o "US$ 480"
-                precio_limpio = ""
-                match_precio = re.search(r'(S/|US\$)\s*[\d\.,]+', price_full_text)
-                if match_precio:
-                    precio_limpio = match_precio.group(0).strip()
-                else:
-                    # Si no coincide el patrón, dejar el texto original como fallback
-                    precio_limpio = price_full_text
-
-                # Extraer descripción
-                desc_elem = card.select_one(".content_result_descripcion")
-                desc = desc_elem.get_text(" ", strip=True) if desc_elem else card.get_text(" ", strip=True)[:400]
-
-                # EXTRAER IMAGEN DIRECTAMENTE DEL LISTADO (NO ENTRAR AL DETALLE)
-                img_url = ""
-                img_tag = card.select_one("img.content_result_image")
-                if img_tag:
-                    img_url = img_tag.get("src") or img_tag.get("data-src") or ""
-                    if img_url and img_url.startswith("//"):
-                        img_url = "https:" + img_url
-                    img_url = img_url.strip()
-
-                results.append({
-                    "titulo": title,
-                    "precio": precio_limpio,  # ← ¡CAMBIO CLAVE AQUÍ!
-                    "m2": m2_text,
-                    "dormitorios": dormitorios_text,
-                    "baños": banos_text,
-                    "descripcion": desc,
-                    "link": href,
-                    "imagen_url": img_url
-                })
-
-            except Exception as e:
-                print(f"Error procesando card en Doomos: {e}")
-                continue
+        first = _page_rows_driver(driver, url, results.metrics)
+        if merge_new(first, seen, results, max_results) and max_pages > 1 and not results.cancelled:
+            plan = page_plan(None, len(first), max_pages, last_linked_page(driver_hrefs(driver), "pagina"))
+            if plan:
+                urls = [set_query_param(url, "pagina", n) for n in plan]
+                page_rows = lambda d, u: _page_rows_driver(d, u, results.metrics)
+                with driver_fanout(driver, min(PAGE_WORKERS, len(plan)), page_rows) as fetch_one:
+                    fetch_pages(urls, fetch_one, seen, results, fetch_one.workers, max_results)
 
     except Exception as e:
         print(f"Error en Doomos scraper: {e}")
+        results.metrics["error"] = str(e)
     finally:
-        try:
-            driver.quit()
-        except:
-            pass
+        release_driver(driver)
 
-    return pd.DataFrame(results)
\ No newline at end of file
+    return listings_frame(results)
@@ -0,0 +1,181 @@
+import os
+import queue
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+
+# Imports locales desde el módulo 'common'
+from .common import create_driver
+
+# -------------------- Pool de drivers --------------------
+# Configuración (se puede sobreescribir por variables de entorno)
+POOL_SIZE = int(os.getenv("DRIVER_POOL_SIZE", "3"))              # máximo de Chromium vivos por proceso
+POOL_WARM = int(os.getenv("DRIVER_POOL_WARM", "1"))              # drivers a precalentar al arrancar
+POOL_MAX_USES = int(os.getenv("DRIVER_POOL_MAX_USES", "20"))     # reciclar tras N usos
+POOL_ACQUIRE_TIMEOUT = float(os.getenv("DRIVER_POOL_ACQUIRE_TIMEOUT", "120"))
+
+class DriverPool:
+    """
+    Pool de drivers de Chrome headless reutilizables.
+    Los scrapers piden un driver con acquire() y lo devuelven con release();
+    entre usos se limpian cookies y storage, y los drivers caídos o muy usados se reciclan.
+    """
+    def __init__(self, size: int = POOL_SIZE, max_uses: int = POOL_MAX_USES, factory=None):
+        self.size = max(1, size)
+        self.max_uses = max(1, max_uses)
+        self._factory = factory or (lambda: create_driver(headless=True))
+        self._idle = queue.LifoQueue()
+        self._uses = {}
+        self._live = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    # ---- ciclo de vida de cada driver ----
+    def _create(self):
+        with self._lock:
+            if self._closed or self._live >= self.size:
+                return None
+            self._live += 1
+        try:
+            driver = self._factory()
+        except Exception:
+            with self._lock:
+                self._live -= 1
+            raise
+        with self._lock:
+            self._uses[driver] = 0
+        return driver
+
+    def _destroy(self, driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        with self._lock:
+            if driver in self._uses:
+                del self._uses[driver]
+                self._live -= 1
+
+    def _is_healthy(self, driver) -> bool:
+        try:
+            return driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def _reset(self, driver) -> bool:
+        """Limpia cookies y storage para que el siguiente uso empiece limpio."""
+        try:
+            try:
+                driver.execute_script("try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}")
+            except Exception:
+                pass
+            try:
+                driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            except Exception:
+                driver.delete_all_cookies()
+            driver.get("about:blank")
+            return True
+        except Exception:
+            return False
+
+    # ---- API pública ----
+    def acquire(self, timeout: float = POOL_ACQUIRE_TIMEOUT):
+        """Entrega un driver sano. Lanza TimeoutError si no hay ninguno libre a tiempo."""
+        deadline = time.monotonic() + timeout
+        while True:
+            if self._closed:
+                raise RuntimeError("El pool de drivers está cerrado")
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                driver = self._create()
+                if driver is not None:
+                    return driver
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No hay drivers libres tras {timeout}s (pool de {self.size})")
+                try:
+                    # espera corta para volver a intentar crear si otro driver se destruyó
+                    driver = self._idle.get(timeout=min(remaining, 1.0))
+                except queue.Empty:
+                    continue
+            if self._is_healthy(driver):
+                return driver
+            print("♻️ Driver del pool no responde, se recicla")
+            self._destroy(driver)
+
+    def release(self, driver, broken: bool = False):
+        """Devuelve el driver al pool (o lo cierra si está roto, cerrado o agotado)."""
+        if driver is None:
+            return
+        with self._lock:
+            uses = self._uses.get(driver, 0) + 1
+            self._uses[driver] = uses
+        if broken or self._closed or uses >= self.max_uses or not self._reset(driver):
+            self._destroy(driver)
+            return
+        self._idle.put(driver)
+
+    @contextmanager
+    def borrow(self, timeout: float = POOL_ACQUIRE_TIMEOUT):
+        driver = self.acquire(timeout=timeout)
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def warm(self, n: int = POOL_WARM):
+        """Precrea hasta `n` drivers ociosos para sacar el arranque de Chromium del request."""
+        for _ in range(max(0, n - self._idle.qsize())):
+            try:
+                driver = self._create()
+            except Exception as e:
+                print(f"Error precalentando driver: {e}")
+                return
+            if driver is None:
+                return
+            self._idle.put(driver)
+
+    def warm_async(self, n: int = POOL_WARM):
+        threading.Thread(target=self.warm, args=(n,), daemon=True, name="driver-pool-warm").start()
+
+    def shutdown(self):
+        """Cierra todos los drivers ociosos; los prestados se cierran al devolverse."""
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._destroy(driver)
+
+    def stats(self) -> dict:
+        with self._lock:
+            live = self._live
+        return {"size": self.size, "live": live, "idle": self._idle.qsize(), "closed": self._closed}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_driver_pool() -> DriverPool:
+    """Pool único por proceso (cada worker de gunicorn tiene el suyo)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DriverPool()
+            atexit.register(_pool.shutdown)
+        return _pool
+
+def acquire_driver(timeout: float = POOL_ACQUIRE_TIMEOUT):
+    return get_driver_pool().acquire(timeout=timeout)
+
+def release_driver(driver, broken: bool = False):
+    get_driver_pool().release(driver, broken=broken)
+
+def shutdown_driver_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
@@ -0,0 +1,95 @@
+import os
+from typing import Optional
+
+# -------------------- Extracción de cards en el navegador --------------------
+# "js": un solo execute_script por página devuelve las cards ya recortadas (JSON compacto).
+# "html": driver.page_source + BeautifulSoup (también es el fallback si el JS falla o no encuentra cards).
+EXTRACT_MODE = os.getenv("SCRAPER_EXTRACT_MODE", "js")
+
+# Spec por fuente:
+#   {"cards": [selectores alternativos, gana el primero con resultados],
+#    "text": máx. caracteres del texto completo de la card (0 = no enviarlo),
+#    "fields": {nombre: {"sel": [selectores alternativos], "attr": [atributos] (si no, texto), "all": bool}}}
+# Por card se devuelve {"text": ..., campo: valor}; valor es None si ningún selector encontró elemento.
+# El texto se arma como get_text(" ", strip=True) de BeautifulSoup para que ambos caminos coincidan.
+_JS_EXTRACT = r"""
+const spec = arguments[0];
+const SKIP = {SCRIPT: 1, STYLE: 1, TEMPLATE: 1};
+const txt = (el) => {
+  const w = document.createTreeWalker(el, NodeFilter.SHOW_TEXT);
+  const out = [];
+  let n;
+  while ((n = w.nextNode())) {
+    if (n.parentNode && SKIP[n.parentNode.nodeName]) continue;
+    const t = n.nodeValue.trim();
+    if (t) out.push(t);
+  }
+  return out.join(" ");
+};
+const first = (root, sels) => {
+  for (const s of sels) {
+    try {
+      const e = root.querySelector(s);
+      if (e) return e;
+    } catch (err) {}
+  }
+  return null;
+};
+const attr = (el, names) => {
+  for (const a of names) {
+    const v = el.getAttribute(a);
+    if (v) return v;
+  }
+  return "";
+};
+let cards = [];
+for (const s of spec.cards) {
+  let found = [];
+  try { found = document.querySelectorAll(s); } catch (err) {}
+  if (found.length) { cards = Array.from(found); break; }
+}
+return cards.map((c) => {
+  const row = {};
+  if (spec.text) row.text = txt(c).slice(0, spec.text);
+  for (const [name, f] of Object.entries(spec.fields)) {
+    if (f.all) {
+      row[name] = Array.from(c.querySelectorAll(f.sel.join(", "))).map(txt);
+      continue;
+    }
+    const el = first(c, f.sel);
+    row[name] = el === null ? null : (f.attr ? attr(el, f.attr) : txt(el));
+  }
+  return row;
+});
+"""
+
+def extract_cards(driver, spec: dict, label: str = "") -> Optional[list]:
+    """
+    Extrae las cards de la página actual con un solo execute_script.
+    Devuelve None si el modo no es "js", si el script falla o si no encontró cards
+    (el scraper debe caer a page_source + BeautifulSoup).
+    """
+    if EXTRACT_MODE != "js":
+        return None
+    try:
+        items = driver.execute_script(_JS_EXTRACT, spec)
+    except Exception as e:
+        print(f"Extracción JS falló en {label}, se usa page_source: {e}")
+        return None
+    if not items:
+        return None
+    print(f"⚡ {label}: {len(items)} cards extraídas por JS")
+    return items
+
+def append_rows(results: list, items: list, build_row) -> list:
+    """Convierte las cards crudas con `build_row` (None = descartar) y las agrega a `results`."""
+    for raw in items:
+        if getattr(results, "cancelled", False):
+            break
+        try:
+            row = build_row(raw)
+        except Exception:
+            continue
+        if row:
+            results.append(row)
+    return results
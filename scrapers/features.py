@@ -0,0 +1,94 @@
+import re
+from collections import namedtuple
+from typing import Optional
+
+# -------------------- Extracción de características --------------------
+# Patrones precompilados compartidos por todos los scrapers (y por common, el store y el
+# orquestador): dormitorios, baños y m² salen de una sola pasada por el texto de la card.
+RE_FIRST_INT = re.compile(r"(\d+)")
+RE_NON_DIGITS = re.compile(r"\D+")
+# número seguido de su unidad; el grupo con nombre dice qué característica es. Doomos escribe
+# los dormitorios como "3 hab." y se cuentan como tales
+RE_CARD_FEATURES = re.compile(
+    r"(?<!\d)(\d{1,4})\s*(?:(?P<dorm>dormitori|dorm\b|hab)|(?P<banos>bañ|banos?\b)|(?P<m2>m²|m2\b))",
+    re.I,
+)
+# igual pero sin "hab": en Nestoria "1 habitación de servicio" no es un dormitorio
+RE_CARD_FEATURES_DORM = re.compile(
+    r"(?<!\d)(\d{1,4})\s*(?:(?P<dorm>dormitori|dorm\b)|(?P<banos>bañ|banos?\b)|(?P<m2>m²|m2\b))",
+    re.I,
+)
+# en las listas de características (urbania, infocasas) cada etiqueta trae una sola
+RE_LABEL_KIND = re.compile(r"(?P<dorm>dorm)|(?P<banos>bañ|bano)|(?P<m2>m²)", re.I)
+
+Features = namedtuple("Features", ["dormitorios", "banos", "m2"])
+NO_FEATURES = Features(None, None, None)
+
+def first_int(s) -> Optional[int]:
+    """Primer entero del texto, o None."""
+    if s is None:
+        return None
+    m = RE_FIRST_INT.search(str(s))
+    return int(m.group(1)) if m else None
+
+def all_digits(s) -> Optional[int]:
+    """Todos los dígitos del texto como un entero ("S/ 1.680" -> 1680), o None."""
+    digits = RE_NON_DIGITS.sub("", str(s))
+    return int(digits) if digits else None
+
+def m2_from_text(s) -> Optional[int]:
+    """m² del texto ("85 m²", "120m2"), o None."""
+    if s is None:
+        return None
+    for m in RE_CARD_FEATURES.finditer(str(s)):
+        if m.group("m2"):
+            return int(m.group(1))
+    return None
+
+def card_features(text: str, pattern: re.Pattern = RE_CARD_FEATURES) -> Features:
+    """
+    Dormitorios, baños y m² del texto de una card en una sola pasada (el primero de cada uno).
+    `pattern` elige qué cuenta como dormitorio (RE_CARD_FEATURES_DORM: sin "hab").
+    """
+    if not text:
+        return NO_FEATURES
+    dorm = banos = m2 = None
+    for m in pattern.finditer(text):
+        if m.group("dorm"):
+            if dorm is None:
+                dorm = int(m.group(1))
+        elif m.group("banos"):
+            if banos is None:
+                banos = int(m.group(1))
+        elif m2 is None:
+            m2 = int(m.group(1))
+        if dorm is not None and banos is not None and m2 is not None:
+            break
+    return Features(dorm, banos, m2)
+
+def label_features(labels) -> Features:
+    """Lo mismo a partir de etiquetas sueltas ("3 dorm.", "2 baños", "85 m² tot."): primer número de cada una."""
+    dorm = banos = m2 = None
+    for text in labels or []:
+        kind = RE_LABEL_KIND.search(text or "")
+        if not kind:
+            continue
+        n = first_int(text)
+        if kind.group("dorm"):
+            dorm = n if dorm is None else dorm
+        elif kind.group("banos"):
+            banos = n if banos is None else banos
+        else:
+            m2 = n if m2 is None else m2
+    return Features(dorm, banos, m2)
+
+def card_features_many(texts, pattern: re.Pattern = RE_CARD_FEATURES) -> list:
+    """card_features de una lista de cards (los textos repetidos se extraen una sola vez)."""
+    memo = {}
+    out = []
+    for text in texts:
+        feats = memo.get(text)
+        if feats is None:
+            feats = memo[text] = card_features(text, pattern)
+        out.append(feats)
+    return out
@@ -0,0 +1,117 @@
+import os
+import re
+import time
+import threading
+from typing import Callable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Imports locales desde el módulo 'common'
+from .common import COMMON_UA, ParsedPage
+from .ratelimit import polite_get
+
+# -------------------- Fetch HTTP primero, navegador como fallback --------------------
+# Configuración (se puede sobreescribir por variables de entorno)
+FETCH_MODE = os.getenv("SCRAPER_FETCH_MODE", "auto")                    # "auto" (HTTP y si no Selenium) o "browser"
+HTTP_FETCH_TIMEOUT = float(os.getenv("HTTP_FETCH_TIMEOUT", "12"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+HTTP_RETRY_AFTER = float(os.getenv("HTTP_RETRY_AFTER", "1800"))        # segundos sin reintentar HTTP en una fuente que lo necesitó renderizar
+
+# Texto visible de una búsqueda sin resultados (el HTML no trae cards y no es por render con JS)
+_RE_NO_RESULTS = re.compile(
+    r"no (?:se )?(?:encontr\w*|hay) (?:ning[uú]n )?(?:resultados?|inmuebles?|propiedades|avisos|anuncios)"
+    r"|sin resultados|(?<![\d.,])0 (?:resultados?|inmuebles|propiedades|avisos|anuncios)",
+    re.I,
+)
+
+_session = None
+_lock = threading.Lock()
+_needs_browser = {}  # fuente -> time.time() hasta el que se va directo al navegador
+
+def get_http_session() -> requests.Session:
+    """Sesión HTTP keep-alive compartida por todos los scrapers."""
+    global _session
+    with _lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_SIZE)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            s.headers.update({
+                "User-Agent": COMMON_UA,
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+                "Accept-Language": "es-PE,es;q=0.9,en;q=0.8",
+            })
+            _session = s
+        return _session
+
+def _mark_needs_browser(source: str):
+    with _lock:
+        _needs_browser[source] = time.time() + HTTP_RETRY_AFTER
+
+def _record_http(metrics: Optional[dict], r, t0: float):
+    """Mismas métricas que load_page del navegador: páginas, bytes, requests y ms."""
+    if metrics is None:
+        return
+    metrics["pages"] = metrics.get("pages", 0) + 1
+    metrics["load_ms"] = metrics.get("load_ms", 0) + int((time.monotonic() - t0) * 1000)
+    metrics["bytes"] = metrics.get("bytes", 0) + len(r.content or b"")
+    metrics["requests"] = metrics.get("requests", 0) + 1
+
+def fetch_listing(url: str, cards_css: str, source: str, only=None, metrics: Optional[dict] = None,
+                  is_empty: Optional[Callable[[ParsedPage], bool]] = None) -> Optional[ParsedPage]:
+    """
+    Intenta traer el listado por HTTP plano. Devuelve la página ya parseada si trae al menos
+    una card (`cards_css`) o si es una búsqueda sin resultados; None si la respuesta está
+    vacía, falló o se arma con JS (el scraper debe usar el navegador). Solo un 403 (anti-bots)
+    o un HTML armado con JS dejan a la fuente en el navegador por HTTP_RETRY_AFTER; un 5xx,
+    un 429 o un timeout son de esta vez. En `metrics` se acumulan bytes y tiempo de la descarga.
+    `is_empty` es el chequeo propio de la fuente para "sin resultados" (p.ej. el conteo del
+    título); sin él se busca el texto genérico de _RE_NO_RESULTS.
+    """
+    if FETCH_MODE == "browser":
+        return None
+    with _lock:
+        until = _needs_browser.get(source, 0)
+    if time.time() < until:
+        return None
+    t0 = time.monotonic()
+    try:
+        r = polite_get(get_http_session(), url, blocked=(429,), timeout=HTTP_FETCH_TIMEOUT)
+    except Exception as e:
+        print(f"🌐 {source}: HTTP falló ({e}), se usa el navegador")
+        return None
+    _record_http(metrics, r, t0)
+    # un 403 del HTTP plano suele ser la protección anti-bots (el navegador sí pasa): no pone al host en backoff
+    if r.status_code == 403:
+        print(f"🌐 {source}: HTTP 403, se usa el navegador")
+        _mark_needs_browser(source)
+        return None
+    if r.status_code != 200 or not r.text:
+        print(f"🌐 {source}: HTTP {r.status_code}, se usa el navegador (solo esta vez)")
+        return None
+    page = ParsedPage(r.text, only=only)
+    if not page.select(cards_css):
+        if is_empty(page) if is_empty is not None else _RE_NO_RESULTS.search(page.full.get_text(" ", strip=True)):
+            print(f"🌐 {source}: la búsqueda no tiene resultados")
+            return page
+        print(f"🌐 {source}: el HTML no trae cards (render con JS), se usa el navegador")
+        _mark_needs_browser(source)
+        return None
+    print(f"🌐 {source}: listado por HTTP en {time.monotonic() - t0:.1f}s ({len(r.content) // 1024} KB)")
+    return page
+
+def fetch_page(url: str, source: str, only=None, metrics: Optional[dict] = None) -> Optional[ParsedPage]:
+    """GET de una página adicional (p.ej. siguiente página) con la sesión compartida."""
+    t0 = time.monotonic()
+    try:
+        # igual que fetch_listing: un 403 anti-bot no deja al host en backoff (el navegador sí puede pasar)
+        r = polite_get(get_http_session(), url, blocked=(429,), timeout=HTTP_FETCH_TIMEOUT)
+    except Exception as e:
+        print(f"🌐 {source}: HTTP falló en {url}: {e}")
+        return None
+    _record_http(metrics, r, t0)
+    if r.status_code != 200 or not r.text:
+        return None
+    return ParsedPage(r.text, only=only)
@@ -0,0 +1,221 @@
+import os
+import time
+import sqlite3
+import threading
+import requests
+from contextlib import contextmanager
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from bs4 import SoupStrainer
+from requests.adapters import HTTPAdapter
+
+# Imports locales desde el módulo 'common'
+from .common import (
+    COMMON_UA,
+    DATA_DIR,
+    make_soup,
+    wait_for_selector
+)
+from .ratelimit import polite_get, wait_turn, detail_bucket
+
+# -------------------- Imágenes del detalle (Nestoria) --------------------
+# Configuración (se puede sobreescribir por variables de entorno)
+IMAGE_CACHE_PATH = os.getenv("IMAGE_CACHE_PATH", os.path.join(DATA_DIR, "imagenes.sqlite"))
+IMAGE_CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", str(7 * 24 * 3600)))       # 7 días
+IMAGE_CACHE_MISS_TTL = int(os.getenv("IMAGE_CACHE_MISS_TTL", str(24 * 3600)))  # anuncios sin imagen: 1 día
+IMAGE_FETCH_WORKERS = int(os.getenv("IMAGE_FETCH_WORKERS", "8"))
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "8"))
+# Tiempo máximo de resolve_images en modo "sync" (dentro del timeout de la fuente): lo que no
+# alcance se resuelve en segundo plano. El ritmo de los detalles es RATE_LIMIT_DETAIL_RPS (ratelimit.py).
+IMAGE_SYNC_BUDGET = float(os.getenv("IMAGE_SYNC_BUDGET", "60"))
+DETAIL_IMAGE_SELECTORS = "img[data-element='main-swiper-slide'], img#d_a_c_photo, meta[itemprop='image']"
+# Del detalle solo interesan <img> y <meta>
+DETAIL_IMAGE_ONLY = SoupStrainer(["img", "meta"])
+
+def extract_main_image(html: str) -> str:
+    """Extrae la imagen principal de la página de detalle de un anuncio."""
+    detail_soup = make_soup(html, parse_only=DETAIL_IMAGE_ONLY)
+    img_url = ""
+
+    # Método 1: Buscar por el selector original (data-element)
+    main_img = detail_soup.select_one("img[data-element='main-swiper-slide']")
+    if main_img:
+        img_url = main_img.get("src") or main_img.get("data-src") or ""
+
+    # Método 2: Si falla, buscar por ID 'd_a_c_photo'
+    if not img_url:
+        img_by_id = detail_soup.select_one("img#d_a_c_photo")
+        if img_by_id:
+            img_url = img_by_id.get("src") or img_by_id.get("data-src") or ""
+
+    # Método 3: Si aún no se encuentra, buscar en la etiqueta meta con itemprop="image"
+    if not img_url:
+        meta_img = detail_soup.select_one("meta[itemprop='image']")
+        if meta_img:
+            img_url = meta_img.get("content") or ""
+
+    # Limpiar y formatear la URL
+    img_url = img_url.strip()
+    if img_url.startswith("//"):
+        img_url = "https:" + img_url
+    return img_url
+
+class ImageCache:
+    """Cache persistente link -> imagen_url con TTL (SQLite, compartido entre workers)."""
+    def __init__(self, path: str = IMAGE_CACHE_PATH, ttl: int = IMAGE_CACHE_TTL, miss_ttl: int = IMAGE_CACHE_MISS_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS imagenes (link TEXT PRIMARY KEY, imagen_url TEXT, ts REAL)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, links):
+        """Devuelve {link: imagen_url} de las entradas vigentes."""
+        links = list(links)
+        found = {}
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            for i in range(0, len(links), 500):
+                chunk = links[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT link, imagen_url, ts FROM imagenes WHERE link IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for link, img, ts in rows:
+                    ttl = self.ttl if img else self.miss_ttl
+                    if now - ts <= ttl:
+                        found[link] = img
+        return found
+
+    def set_many(self, mapping: dict):
+        if not mapping:
+            return
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO imagenes (link, imagen_url, ts) VALUES (?, ?, ?)",
+                [(link, img or "", now) for link, img in mapping.items()]
+            )
+
+_session = None
+_init_lock = threading.Lock()
+_cache = None
+
+def _get_session() -> requests.Session:
+    """Sesión HTTP keep-alive con pool de conexiones del tamaño del pool de hilos."""
+    global _session
+    with _init_lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=IMAGE_FETCH_WORKERS)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            s.headers.update({"User-Agent": COMMON_UA})
+            _session = s
+        return _session
+
+def get_image_cache() -> ImageCache:
+    global _cache
+    with _init_lock:
+        if _cache is None:
+            _cache = ImageCache()
+        return _cache
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else deadline - time.monotonic()
+
+def _fetch_image_http(link: str, deadline: Optional[float] = None):
+    """Devuelve la imagen vía HTTP plano, o None si hay que usar Selenium (o se acabó el tiempo)."""
+    left = _remaining(deadline)
+    if left is not None and left <= 0:
+        return None
+    try:
+        # un 403 solo significa "usar Selenium": no dejar al host en backoff por eso
+        r = polite_get(_get_session(), link, blocked=(429,), max_wait=left, bucket=detail_bucket(link),
+                       timeout=IMAGE_FETCH_TIMEOUT if left is None else max(1.0, min(IMAGE_FETCH_TIMEOUT, left)))
+        r.raise_for_status()
+    except Exception:
+        return None
+    return extract_main_image(r.text) or None
+
+def _fetch_image_selenium(driver, link: str, max_wait: Optional[float] = None) -> Optional[str]:
+    """
+    Imagen del detalle cargado con Selenium ("" si la página cargó y no tiene imagen), o None
+    si falló (rate limit, timeout, driver caído): eso no se guarda en cache como "sin imagen".
+    """
+    try:
+        wait_turn(link, max_wait, detail_bucket(link))
+        driver.get(link)
+        # Esperar a que aparezca alguna de las fuentes de imagen (máx. 3s)
+        wait_for_selector(driver, DETAIL_IMAGE_SELECTORS, timeout=3)
+        return extract_main_image(driver.page_source)
+    except Exception as e:
+        print(f"Error al obtener imagen de detalle en Nestoria para {link}: {e}")
+        return None
+
+def resolve_images(links, driver=None, max_workers: int = IMAGE_FETCH_WORKERS,
+                   budget: Optional[float] = None) -> dict:
+    """
+    Resuelve la imagen principal de cada link:
+    1) cache persistente, 2) HTTP en paralelo, 3) Selenium (si se pasa `driver`) como fallback.
+    Con `budget` (segundos) no se pasa de ese tiempo: los links que no alcanzaron quedan sin
+    imagen en el resultado y se resuelven en segundo plano (solo HTTP) para la próxima vez.
+    """
+    deadline = time.monotonic() + budget if budget is not None else None
+    links = [l for l in dict.fromkeys(links) if l]
+    if not links:
+        return {}
+    cache = get_image_cache()
+    resolved = cache.get_many(links)
+    missing = [l for l in links if l not in resolved]
+    print(f"Imágenes: {len(resolved)} en cache, {len(missing)} por resolver")
+    if not missing:
+        return resolved
+
+    fetched = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="img") as ex:
+        for link, img in zip(missing, ex.map(lambda l: _fetch_image_http(l, deadline), missing)):
+            if img is not None:
+                fetched[link] = img
+
+    fallback = [l for l in missing if l not in fetched]
+    if fallback and driver is not None:
+        print(f"Imágenes: {len(fallback)} sin resultado por HTTP, usando Selenium")
+        for link in fallback:
+            left = _remaining(deadline)
+            if left is not None and left <= 0:
+                break
+            img = _fetch_image_selenium(driver, link, left)
+            if img is not None:
+                fetched[link] = img
+
+    cache.set_many(fetched)
+    resolved.update(fetched)
+    if deadline is not None and time.monotonic() >= deadline:
+        pending = [l for l in missing if l not in fetched]
+        if pending:
+            print(f"Imágenes: presupuesto de {budget:.0f}s agotado, {len(pending)} quedan para segundo plano")
+            resolve_images_background(pending)
+    return resolved
+
+def resolve_images_background(links):
+    """Resuelve (solo por HTTP) y guarda en cache en un hilo aparte; no bloquea la respuesta."""
+    links = list(links)
+    if not links:
+        return
+    def _run():
+        try:
+            resolve_images(links)
+        except Exception as e:
+            print(f"Error resolviendo imágenes en segundo plano: {e}")
+    threading.Thread(target=_run, daemon=True, name="img-background").start()
@@ -1,70 +1,54 @@
-import re
-import time
+import os
 import requests
 from typing import Optional
-import pandas as pd
-from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
 
 # Imports locales desde el módulo 'common'
 from .common import (
-    create_driver,
-    slugify_zone
+    load_page,
+    as_page,
+    slugify_zone,
+    results_buffer,
+    Readiness,
+    wait_until_ready
 )
+from .driver_pool import acquire_driver, release_driver
+from .extract import extract_cards, append_rows
+from .features import label_features
+from .fetch import fetch_listing
+from .paginate import merge_new
+from .listing import Listing, listings_frame
+from .zones import resolve_zone
 
 # -------------------- Infocasas --------------------
-def scrape_infocasas(zona: str = "", dormitorios: str = "0", banos: str = "0",
-                       price_min: Optional[int] = None, price_max: Optional[int] = None,
-                       palabras_clave: str = "", max_scrolls: int = 8):
-    # Mapeo específico para InfoCasas
-    ZONA_MAPEO_INFOCASAS = {
-        "ancón": "ancon",
-        "ate": "ate",
-        "barranco": "barranco",
-        "breña": "breña",
-        "carabayllo": "carabayllo",
-        "chaclacayo": "chaclacayo",
-        "chorrillos": "chorrillos",
-        "cieneguilla": "cieneguilla",
-        "comas": "comas",
-        "el agustino": "el-agustino",
-        "independencia": "independencia",
-        "jesús maría": "jesus-maria",
-        "la molina": "la-molina",
-        "la victoria": "la-victoria",
-        "lima": "lima-cercado",
-        "lince": "lince",
-        "los olivos": "los-olivos",
-        "lurigancho": "lurigancho",
-        "lurín": "lurin",
-        "magdalena del mar": "magdalena-del-mar",
-        "miraflores": "miraflores",
-        "pachacámac": "pachacamac",
-        "pucusana": "pucusana",
-        "pueblo libre": "pueblo-libre",
-        "puente piedra": "puente-piedra",
-        "punta hermosa": "punta-hermosa",
-        "punta negra": "punta-negra",
-        "rímac": "rimac",
-        "san bartolo": "san-bartolo",
-        "san borja": "san-borja",
-        "san isidro": "san-isidro",
-        "san juan de lurigancho": "san-juan-de-lurigancho",
-        "san juan de miraflores": "san-juan-de-miraflores",
-        "san luis": "san-luis",
-        "san martín de porres": "san-martin-de-porres",
-        "san miguel": "san-miguel",
-        "santa anita": "santa-anita",
-        "santa maría del mar": "santa-maria-del-mar",
-        "santa rosa": "santa-rosa",
-        "santiago de surco": "santiago-de-surco",
-        "surquillo": "surquillo",
-        "villa el salvador": "villa-el-salvador",
-        "villa maría del triunfo": "villa-maria-del-triunfo"
-    }
+# Condición de "página lista": cards del listado (el scroll carga más de forma perezosa)
+INFOCASAS_CARDS = "div.listingCard, article"
+# Parseo acotado a las cards del listado
+INFOCASAS_ONLY = SoupStrainer("div", class_="listingCard")
+# El HTML del servidor trae solo la primera tanda de cards y el resto llega con el scroll: si
+# por HTTP vienen al menos INFOCASAS_HTTP_BATCH cards (o hay link a la página siguiente) la
+# búsqueda puede tener más y se completa con el navegador
+# Configuración (se puede sobreescribir por variables de entorno)
+INFOCASAS_HTTP_BATCH = int(os.getenv("INFOCASAS_HTTP_BATCH", "20"))
+INFOCASAS_NEXT = "link[rel=next], a[rel=next]"
+
+# Filtros que ya aplica el sitio (ver planner.py): /N-dormitorio y /N-bano son exactos, el rango
+# de precio solo va en la URL junto con dormitorios y baños, y searchstring ordena por relevancia
+# (no garantiza que el aviso tenga las palabras)
+INFOCASAS_SERVER_FILTERS = {
+    "dormitorios": "exact",
+    "banos": "exact",
+    "precio": ("range", ("dormitorios", "banos", "price_min", "price_max")),
+    "palabras_clave": "relevance",
+}
+
+def build_infocasas_url(zona: str = "", dormitorios: str = "0", banos: str = "0",
+                        price_min: Optional[int] = None, price_max: Optional[int] = None,
+                        palabras_clave: str = "") -> str:
     # Construir URL base según la zona
     if zona and zona.strip():
-        zona_lower = zona.strip().lower()
-        zone_slug = ZONA_MAPEO_INFOCASAS.get(zona_lower, slugify_zone(zona))
+        zone = resolve_zone(zona)
+        zone_slug = zone.infocasas if zone is not None else slugify_zone(zona)
         base = f"https://www.infocasas.com.pe/alquiler/casas-y-departamentos/lima/{zone_slug}"
     else:
         base = "https://www.infocasas.com.pe/alquiler/casas-y-departamentos"
@@ -83,89 +67,120 @@ def scrape_infocasas(zona: str = "", dormitorios: str = "0", banos: str = "0",
             base += f"&searchstring={requests.utils.quote(palabras_clave.strip())}"
         else:
             base += f"?searchstring={requests.utils.quote(palabras_clave.strip())}"
+    return base
+
+# Extracción en el navegador (mismos selectores que el parseo con BeautifulSoup)
+INFOCASAS_JS_SPEC = {
+    "cards": ["div.listingCard", "article"],
+    "text": 400,
+    "fields": {
+        "link": {"sel": ["a[href]"], "attr": ["href"]},
+        "title": {"sel": ["h2.lc-title", ".lc-title", "a[href]"]},
+        "price": {"sel": [".main-price", ".lc-price p", ".property-price-tag p"]},
+        "typology": {"sel": [".lc-typologyTag__item strong"], "all": True},
+        "desc": {"sel": [".lc-description", "p"]},
+        "img": {"sel": [".cardImageGallery .gallery-image img"], "attr": ["src", "data-src"]},
+    },
+}
+
+def _infocasas_row(raw: dict) -> Optional[Listing]:
+    """Arma el anuncio con los campos crudos de una card (vengan de BeautifulSoup o del JS)."""
+    href = raw.get("link")
+    # Verificar que el elemento tiene el atributo href
+    if href is None:
+        return None
+    # Construir URL completa
+    if href and href.startswith("/"):
+        href = "https://www.infocasas.com.pe" + href
+    title = raw["title"] if raw.get("title") is not None else (raw.get("text") or "")[:250]
+    price = raw.get("price") or ""
+    # Extraer dormitorios, baños y m² de los tags
+    feats = label_features(raw.get("typology"))
+    desc = raw["desc"] if raw.get("desc") is not None else (raw.get("text") or "")[:400]
+    # Imagen directamente del listado (no entrar al detalle)
+    img_url = raw.get("img") or ""
+    if img_url and img_url.startswith("//"):
+        img_url = "https:" + img_url
+    img_url = img_url.strip()
+    return Listing(
+        titulo=title,
+        precio=price,
+        m2=feats.m2,
+        dormitorios=feats.dormitorios,
+        banos=feats.banos,
+        descripcion=desc,
+        link=href or "",
+        imagen_url=img_url
+    )
+
+def parse_infocasas_html(html: str, results: Optional[list] = None) -> list:
+    """Parsea el listado de InfoCasas (sin navegador) y agrega los anuncios a `results`."""
+    if results is None:
+        results = []
+    page = as_page(html, only=INFOCASAS_ONLY)
+    # Buscar los contenedores de anuncios específicos de InfoCasas
+    nodes = page.select("div.listingCard") or page.select("article")
+    for n in nodes:
+        if getattr(results, "cancelled", False):
+            break
+        try:
+            a = n.select_one("a[href]")
+            if not a:
+                continue
+            title_elem = n.select_one("h2.lc-title") or n.select_one(".lc-title") or a
+            price_elem = n.select_one(".main-price") or n.select_one(".lc-price p") or n.select_one(".property-price-tag p")
+            desc_elem = n.select_one(".lc-description") or n.select_one("p")
+            img_tag = n.select_one(".cardImageGallery .gallery-image img")
+            row = _infocasas_row({
+                "link": a.get("href") or "",
+                "title": title_elem.get_text(" ", strip=True),
+                "price": price_elem.get_text(" ", strip=True) if price_elem else None,
+                "typology": [item.get_text() for item in n.select(".lc-typologyTag__item strong")],
+                "desc": desc_elem.get_text(" ", strip=True) if desc_elem else None,
+                "text": n.get_text(" ", strip=True)[:400] if not desc_elem else "",
+                "img": (img_tag.get("src") or img_tag.get("data-src") or "") if img_tag else None,
+            })
+            if row:
+                results.append(row)
+        except Exception as e:
+            continue
+    return results
+
+def infocasas_http_truncated(page) -> bool:
+    """True si el listado por HTTP parece cortado en la primera tanda de cards."""
+    return len(page.select(INFOCASAS_CARDS)) >= INFOCASAS_HTTP_BATCH or page.full.select_one(INFOCASAS_NEXT) is not None
+
+def scrape_infocasas(zona: str = "", dormitorios: str = "0", banos: str = "0",
+                       price_min: Optional[int] = None, price_max: Optional[int] = None,
+                       palabras_clave: str = "", max_scrolls: int = 8):
+    base = build_infocasas_url(zona, dormitorios, banos, price_min, price_max, palabras_clave)
     print(f"URL de InfoCasas: {base}")  # Mostrar URL usada
-    driver = create_driver(headless=True)
-    results = []
+    results = results_buffer()
+    # Primero HTTP plano: si el HTML del servidor ya trae todas las cards no hace falta navegador
+    page = fetch_listing(base, INFOCASAS_CARDS, "infocasas", only=INFOCASAS_ONLY, metrics=results.metrics)
+    if page is not None:
+        results.metrics["engine"] = "http"
+        parse_infocasas_html(page, results)
+        if not infocasas_http_truncated(page):
+            return listings_frame(results)
+        # las de la primera tanda ya quedan en el buffer; el navegador agrega las que faltan
+        print(f"🌐 infocasas: HTTP trae solo la primera tanda ({len(results)} anuncios), se completa con el navegador")
+    seen = {r.get("link") for r in results}
+    results.metrics["engine"] = "selenium"
+    driver = acquire_driver()
     try:
-        driver.get(base)
-        time.sleep(2)  # Esperar a que cargue la página
-        # Hacer scroll para cargar más resultados
-        for _ in range(max_scrolls):
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(0.6)
-        soup = BeautifulSoup(driver.page_source, "html.parser")
-        # Buscar los contenedores de anuncios específicos de InfoCasas
-        nodes = soup.select("div.listingCard") or soup.select("article")
-        for n in nodes:
-            try:
-                # Verificar que el elemento tiene el atributo href
-                a = n.select_one("a[href]")
-                if not a:
-                    continue
-                href = a.get("href") if a else ""
-                # Construir URL completa
-                if href and href.startswith("/"):
-                    href = "https://www.infocasas.com.pe" + href
-                # Extraer título
-                title_elem = n.select_one("h2.lc-title") or n.select_one(".lc-title") or a
-                title = title_elem.get_text(" ", strip=True) if title_elem else n.get_text(" ", strip=True)[:250]
-                # Extraer precio
-                price = ""
-                price_elem = n.select_one(".main-price") or n.select_one(".lc-price p") or n.select_one(".property-price-tag p")
-                if price_elem:
-                    price = price_elem.get_text(" ", strip=True)
-                # Extraer ubicación
-                location_elem = n.select_one(".lc-location") or n.select_one("strong")
-                location = location_elem.get_text(" ", strip=True) if location_elem else ""
-                # Extraer dormitorios, baños y m² de los tags
-                dormitorios_text = ""
-                banos_text = ""
-                m2_text = ""
-                # Buscar en los elementos con clase lc-typologyTag__item
-                typology_items = n.select(".lc-typologyTag__item strong")
-                for item in typology_items:
-                    text = item.get_text().strip()
-                    if "Dorm" in text:
-                        dorm_match = re.search(r'(\d+)', text)
-                        if dorm_match:
-                            dormitorios_text = dorm_match.group(1)
-                    elif "Baños" in text or "Baño" in text:
-                        banos_match = re.search(r'(\d+)', text)
-                        if banos_match:
-                            banos_text = banos_match.group(1)
-                    elif "m²" in text:
-                        m2_match = re.search(r'(\d+)', text)
-                        if m2_match:
-                            m2_text = m2_match.group(1)
-                # Extraer descripción
-                desc_elem = n.select_one(".lc-description") or n.select_one("p")
-                desc = desc_elem.get_text(" ", strip=True) if desc_elem else n.get_text(" ", strip=True)[:400]
-                # EXTRAER IMAGEN DIRECTAMENTE DEL LISTADO (NO ENTRAR AL DETALLE)
-                img_url = ""
-                img_tag = n.select_one(".cardImageGallery .gallery-image img")
-                if img_tag:
-                    img_url = img_tag.get("src") or img_tag.get("data-src") or ""
-                    if img_url and img_url.startswith("//"):
-                        img_url = "https:" + img_url
-                    img_url = img_url.strip()
-                results.append({
-                    "titulo": title,
-                    "precio": price,
-                    "m2": m2_text,
-                    "dormitorios": dormitorios_text,
-                    "baños": banos_text,
-                    "descripcion": desc,
-                    "link": href or "",
-                    "imagen_url": img_url
-                })
-            except Exception as e:
-                continue
+        load_page(driver, base, results.metrics, "infocasas")
+        # Esperar a las cards y hacer scroll mientras sigan cargando más resultados
+        wait_until_ready(driver, Readiness(INFOCASAS_CARDS, timeout=8, max_scrolls=max_scrolls, settle=0.6))
+        items = extract_cards(driver, INFOCASAS_JS_SPEC, "InfoCasas")
+        if items:
+            merge_new(append_rows([], items, _infocasas_row), seen, results)
+        else:
+            merge_new(parse_infocasas_html(driver.page_source), seen, results)
     except Exception as e:
         print(f"Error en InfoCasas scraper: {e}")
+        results.metrics["error"] = str(e)
         pass
     finally:
-        try:
-            driver.quit()
-        except:
-            pass
-    return pd.DataFrame(results)
\ No newline at end of file
+        release_driver(driver)
+    return listings_frame(results)
\ No newline at end of file
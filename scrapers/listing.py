@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+from typing import Optional
+
+# Imports locales desde el módulo 'common'
+from .common import (
+    LISTING_COLUMNS,
+    canonical_link,
+    parse_precio_con_moneda,
+    _extract_int_from_text
+)
+from .prices import to_soles
+
+# -------------------- Anuncio tipado --------------------
+# Columnas numéricas ya parseadas que acompañan a las de texto en el DataFrame de un scraper
+# (float con NaN, igual que el parseo con regex que reemplazan). No salen por la API.
+TYPED_COLUMNS = ["moneda", "precio_valor", "precio_pen", "m2_num", "dormitorios_num", "banos_num"]
+
+def _text(value) -> str:
+    if value is None or value != value:  # NaN
+        return ""
+    value = str(value).strip()
+    return "" if value == "None" else value
+
+def _int(value) -> Optional[int]:
+    if value is None or isinstance(value, int):
+        return value
+    return _extract_int_from_text(_text(value) or None)
+
+class Listing:
+    """
+    Un anuncio, parseado una sola vez cuando el scraper lo arma: moneda y monto del precio
+    (y su equivalente en soles para los filtros), dormitorios / baños / m² como enteros y el link canónico. Se lee como el dict de siempre
+    (row["baños"], row.get("link")...) para no romper a quien espera filas dict.
+    """
+    __slots__ = ("titulo", "precio", "moneda", "precio_valor", "precio_pen", "m2", "dormitorios", "banos",
+                 "descripcion", "link", "imagen_url")
+
+    def __init__(self, titulo="", precio="", m2=None, dormitorios=None, banos=None,
+                 descripcion="", link="", imagen_url=""):
+        self.titulo = _text(titulo)
+        self._set_precio(precio)
+        self.m2 = _int(m2)
+        self.dormitorios = _int(dormitorios)
+        self.banos = _int(banos)
+        self.descripcion = _text(descripcion)
+        self.link = canonical_link(_text(link))
+        self.imagen_url = _text(imagen_url)
+
+    @classmethod
+    def from_row(cls, row) -> "Listing":
+        """Desde una fila dict (columnas de texto) o un Listing."""
+        if isinstance(row, cls):
+            return row
+        return cls(row.get("titulo"), row.get("precio"), row.get("m2"), row.get("dormitorios"),
+                   row.get("baños"), row.get("descripcion"), row.get("link"), row.get("imagen_url"))
+
+    def _set_precio(self, precio):
+        self.precio = _text(precio)
+        self.moneda, self.precio_valor = parse_precio_con_moneda(self.precio)
+        self.precio_pen = to_soles(self.moneda, self.precio_valor)
+
+    @property
+    def precio_soles(self) -> Optional[int]:
+        """Precio en soles (los dólares convertidos con prices.TASAS_A_SOLES)."""
+        return self.precio_pen
+
+    # --- lectura como dict ---
+    def __getitem__(self, key):
+        if key == "baños":
+            key = "banos"
+        if key not in LISTING_COLUMNS and key != "banos":
+            raise KeyError(key)
+        value = getattr(self, key)
+        if key in ("m2", "dormitorios", "banos"):
+            return "" if value is None else str(value)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in ("m2", "dormitorios", "baños", "banos"):
+            setattr(self, "banos" if key == "baños" else key, _int(value))
+        elif key == "precio":
+            self._set_precio(value)
+        elif key == "link":
+            self.link = canonical_link(_text(value))
+        elif key in LISTING_COLUMNS:
+            setattr(self, key, _text(value))
+        else:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key) -> bool:
+        return key in LISTING_COLUMNS
+
+    def to_row(self) -> dict:
+        """Fila de texto con las columnas de siempre (lo que sale por la API)."""
+        return {col: self[col] for col in LISTING_COLUMNS}
+
+    def __repr__(self):
+        return f"Listing({self.titulo[:40]!r}, {self.precio!r}, {self.link!r})"
+
+def listings_frame(rows) -> pd.DataFrame:
+    """
+    DataFrame de un scraper a partir de sus anuncios (Listing o dicts): columnas de texto
+    de siempre + TYPED_COLUMNS ya parseadas, armado por columnas sin volver a parsear.
+    """
+    items = [Listing.from_row(r) for r in rows]
+    if not items:
+        return pd.DataFrame(columns=LISTING_COLUMNS + TYPED_COLUMNS)
+    nan = np.nan
+    data = {col: [it[col] for it in items] for col in LISTING_COLUMNS}
+    data["moneda"] = [it.moneda or "" for it in items]
+    data["precio_valor"] = np.array([nan if it.precio_valor is None else it.precio_valor for it in items], dtype=float)
+    data["precio_pen"] = np.array([nan if it.precio_pen is None else it.precio_pen for it in items], dtype=float)
+    data["m2_num"] = np.array([nan if it.m2 is None else it.m2 for it in items], dtype=float)
+    data["dormitorios_num"] = np.array([nan if it.dormitorios is None else it.dormitorios for it in items], dtype=float)
+    data["banos_num"] = np.array([nan if it.banos is None else it.banos for it in items], dtype=float)
+    return pd.DataFrame(data)
+
+def public_frame(df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+    """El mismo DataFrame sin las columnas tipadas (para la API, la cache y los jobs)."""
+    if df is None:
+        return df
+    typed = [c for c in TYPED_COLUMNS if c in df.columns]
+    return df.drop(columns=typed) if typed else df
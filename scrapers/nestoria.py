@@ -1,38 +1,55 @@
+import os
 import re
-import time
 from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
 import pandas as pd
-from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
 
 # Imports locales desde el módulo 'common'
 from .common import (
-    create_driver,
-    parse_precio_con_moneda,
+    load_page,
+    ParsedPage,
+    as_page,
     normalize_text,
-    _extract_int_from_text
+    _extract_int_from_text,
+    results_buffer,
+    Readiness,
+    wait_for_selector,
+    scroll_until_stable,
+    canonical_link
 )
+from .driver_pool import acquire_driver, release_driver
+from .extract import extract_cards, append_rows
+from .features import Features, RE_CARD_FEATURES_DORM, card_features, card_features_many
+from .fetch import fetch_listing
+from .images import IMAGE_SYNC_BUDGET, resolve_images, resolve_images_background, get_image_cache
+from .listing import Listing, listings_frame
+from .zones import NESTORIA_EXCEPCIONES, resolve_zone, nestoria_slug
 
 # -------------------- Nestoria (VERSÓN CORREGIDA Y FUNCIONAL CON IMÁGENES) --------------------
-EXCEPCIONES = ["miraflores", "tarapoto", "la molina", "magdalena", "lambayeque", "ventanilla", "la victoria"]
-
+NESTORIA_IMAGE_MODE = os.getenv("NESTORIA_IMAGE_MODE", "sync")
+# Condición de "página lista": título con el conteo o cards de resultados
+NESTORIA_READY = Readiness("div.listings__title h1, li.rating__new, ul#main__listing_res > li",
+                           timeout=10, max_scrolls=5, settle=1.0)
+NESTORIA_CARDS = "li.rating__new, ul#main__listing_res > li"
+# Parseo acotado a las cards (y al título con el conteo de resultados)
+NESTORIA_ONLY = SoupStrainer("li", class_="rating__new")
+NESTORIA_TITLE_ONLY = SoupStrainer("div", class_="listings__title")
+_RE_NESTORIA_TOTAL = re.compile(r"^(\d+)\s+inmuebles")
 def build_zona_slug_nestoria(zona_input: str) -> str:
     if not zona_input or not zona_input.strip():
         return "lima"  # ← ¡ESTO ES LO ÚNICO QUE CAMBIA!
-    z = zona_input.strip().lower().replace(" ", "-")
-    if z not in [e.lower() for e in EXCEPCIONES]:
-        return z
-    else:
-        return "lima_" + z
+    # las excepciones de Nestoria valen sobre lo que escribió el usuario, antes de resolver alias
+    if zona_input.strip().lower() in NESTORIA_EXCEPCIONES:
+        return nestoria_slug(zona_input)
+    zone = resolve_zone(zona_input)
+    return zone.nestoria if zone is not None else nestoria_slug(zona_input)
 
-def scrape_nestoria(zona: str = "", dormitorios: str = "0", banos: str = "0",
-                      price_min: Optional[int] = None, price_max: Optional[int] = None,
-                      palabras_clave: str = "", max_results_per_zone: int = 200):
-    """
-    Scraper FINAL para Nestoria. Usa Selenium.
-    Extrae la imagen DEL DETALLE de cada anuncio.
-    Solo entra al detalle para obtener la imagen, no para extraer más datos.
-    VALIDA si la búsqueda devolvió 0 resultados y en ese caso devuelve DataFrame vacío.
-    """
+# Filtros que ya aplica el sitio (ver planner.py); no recibe palabras clave
+NESTORIA_SERVER_FILTERS = {"dormitorios": "min", "banos": "min", "precio": "range"}
+
+def build_nestoria_url(zona: str = "", dormitorios: str = "0", banos: str = "0",
+                       price_min: Optional[int] = None, price_max: Optional[int] = None) -> str:
     zona_slug = build_zona_slug_nestoria(zona)
     base_url = f"https://www.nestoria.pe/{zona_slug}/inmuebles/alquiler"
     if dormitorios and dormitorios != "0":
@@ -46,139 +63,180 @@ def scrape_nestoria(zona: str = "", dormitorios: str = "0", banos: str = "0",
         params.append(f"price_max={price_max}")
     if params:
         base_url += "?" + "&".join(params)
-    print(f"URL de Nestoria: {base_url}")
-    driver = create_driver(headless=True)
-    results = []
-    try:
-        driver.get(base_url)
-        time.sleep(3)
+    return base_url
 
-        # --- NUEVA VALIDACIÓN: Verificar si hay 0 resultados ---
-        soup_check = BeautifulSoup(driver.page_source, "html.parser")
-        h1_title = soup_check.select_one("div.listings__title h1")
-        if h1_title:
-            title_text = h1_title.get_text(strip=True).lower()
-            # Buscar el patrón: "{número} inmuebles en ..."
-            match = re.search(r'^(\d+)\s+inmuebles', title_text)
-            if match:
-                result_count = int(match.group(1))
-                if result_count == 0:
-                    print("Nestoria: La búsqueda devolvió 0 resultados. Saltando...")
-                    return pd.DataFrame()  # Devolver vacío si son 0 resultados
-            else:
-                print("Advertencia: No se pudo extraer el número de resultados de la página.")
-        else:
-            print("Advertencia: No se encontró el título con el conteo de resultados.")
+def nestoria_result_count(html: str) -> Optional[int]:
+    """Número de resultados del título "{número} inmuebles en ..." o None si no se encuentra."""
+    h1_title = ParsedPage(html, only=NESTORIA_TITLE_ONLY).select_one("div.listings__title h1")
+    if not h1_title:
+        print("Advertencia: No se encontró el título con el conteo de resultados.")
+        return None
+    title_text = h1_title.get_text(strip=True).lower()
+    # Buscar el patrón: "{número} inmuebles en ..."
+    match = _RE_NESTORIA_TOTAL.search(title_text)
+    if not match:
+        print("Advertencia: No se pudo extraer el número de resultados de la página.")
+        return None
+    return int(match.group(1))
+
+# Extracción en el navegador (mismos selectores que el parseo con BeautifulSoup)
+NESTORIA_JS_SPEC = {
+    "cards": ["li.rating__new", "ul#main__listing_res > li"],
+    "text": 4000,
+    "fields": {
+        "link": {"sel": ["a.results__link", "a[href]"], "attr": ["data-href", "href"]},
+        "title": {"sel": [".listing__title__text", ".listing__title", "a.results__link", "a[href]"]},
+        "price": {"sel": [".result__details__price span", ".result__details__price", ".price"]},
+        "desc": {"sel": [".listing__description", ".result__summary"]},
+    },
+}
 
-        # Scroll para cargar más resultados
-        for _ in range(5):
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(1)
-        soup = BeautifulSoup(driver.page_source, "html.parser")
-        # Seleccionar los contenedores de anuncios
-        items = soup.select("li.rating__new") or soup.select("ul#main__listing_res > li")
-        if not items:
-            items = [li for li in soup.find_all("li") if li.select_one(".result__details__price")]
-        if not items:
-            items = soup.find_all(["li", "div", "article"], class_=lambda x: x and any(cls in x for cls in ["listing", "result", "property", "item"]))
-        seen_links = set()
-        for i, li in enumerate(items):
-            try:
-                # Extraer link
-                a_tag = li.select_one("a.results__link") or li.select_one("a[href]")
-                if not a_tag:
-                    continue
-                link = a_tag.get("data-href") or a_tag.get("href") or ""
-                if link and link.startswith("/"):
-                    link = "https://www.nestoria.pe" + link
-                if not link or link in seen_links:
-                    continue
-                # Extraer título
-                title_elem = li.select_one(".listing__title__text") or li.select_one(".listing__title") or a_tag
-                title = title_elem.get_text(" ", strip=True) if title_elem else a_tag.get_text(" ", strip=True)[:140]
-                # Extraer precio
-                price_elem = li.select_one(".result__details__price span") or li.select_one(".result__details__price") or li.select_one(".price")
-                price_text = price_elem.get_text(" ", strip=True) if price_elem else ""
-                # Aplicar filtro de precio aquí mismo
-                moneda, precio_val = parse_precio_con_moneda(price_text)
-                if price_max is not None and moneda == "S" and precio_val is not None and precio_val > price_max:
-                    continue
-                if price_min is not None and moneda == "S" and precio_val is not None and precio_val < price_min:
-                    continue
-                if moneda == "USD" and (price_max is not None or price_min is not None):
-                    continue
-                # Extraer descripción
-                desc_elem = li.select_one(".listing__description") or li.select_one(".result__summary") or None
-                desc = desc_elem.get_text(" ", strip=True) if desc_elem else li.get_text(" ", strip=True)[:800]
-                # Extraer dormitorios, baños y m2 del texto
-                text_content = li.get_text(" ", strip=True).lower()
-                dormitorios_text = ""
-                dorm_match = re.search(r'(\d+)\s*dormitori', text_content, flags=re.I)
-                if dorm_match:
-                    dormitorios_text = dorm_match.group(1)
-                banos_text = ""
-                banos_match = re.search(r'(\d+)\s*bañ', text_content, flags=re.I)
-                if banos_match:
-                    banos_text = banos_match.group(1)
-                m2_text = ""
-                m2_match = re.search(r'(\d{1,4})\s*(m²|m2)', text_content, flags=re.I)
-                if m2_match:
-                    m2_text = m2_match.group(1)
-                # AHORA: Entrar al detalle para obtener la imagen principal (MÉTODO ROBUSTO)
-                img_url = ""
-                try:
-                    driver.get(link)
-                    time.sleep(1)  # Esperar a que cargue la imagen
-                    detail_soup = BeautifulSoup(driver.page_source, "html.parser")
+def _nestoria_link(href: str) -> str:
+    """Link del detalle sin query ni fragmento: el mismo anuncio llega con distintos parámetros de búsqueda."""
+    if href.startswith("/"):
+        href = "https://www.nestoria.pe" + href
+    link = canonical_link(href)
+    parts = urlsplit(link)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, "", "")) if parts.netloc else link
 
-                    # Método 1: Buscar por el selector original (data-element)
-                    main_img = detail_soup.select_one("img[data-element='main-swiper-slide']")
-                    if main_img:
-                        img_url = main_img.get("src") or main_img.get("data-src") or ""
+def _nestoria_row(raw: dict, price_min: Optional[int] = None, price_max: Optional[int] = None,
+                  seen_links: Optional[set] = None, feats: Optional[Features] = None) -> Optional[Listing]:
+    """Arma el anuncio con los campos crudos de una card (vengan de BeautifulSoup o del JS)."""
+    link = raw.get("link")
+    if link is None:
+        return None
+    link = _nestoria_link(link)
+    if not link or (seen_links is not None and link in seen_links):
+        return None
+    text = raw.get("text") or ""
+    desc = raw["desc"] if raw.get("desc") is not None else text[:800]
+    # Dormitorios, baños y m2 del texto (una sola pasada; "hab" no cuenta como dormitorio)
+    if feats is None:
+        feats = card_features(text, RE_CARD_FEATURES_DORM)
+    row = Listing(
+        titulo=raw.get("title") or "",
+        precio=raw.get("price") or "",
+        m2=feats.m2,
+        dormitorios=feats.dormitorios,
+        banos=feats.banos,
+        descripcion=desc,
+        link=link,
+        imagen_url=""  # se completa después con resolve_images
+    )
+    # Aplicar filtro de precio aquí mismo (en soles; los dólares convertidos)
+    if price_max is not None and row.precio_pen is not None and row.precio_pen > price_max:
+        return None
+    if price_min is not None and row.precio_pen is not None and row.precio_pen < price_min:
+        return None
+    if seen_links is not None:
+        seen_links.add(link)
+    return row
 
-                    # Método 2: Si falla, buscar por ID 'd_a_c_photo'
-                    if not img_url:
-                        img_by_id = detail_soup.select_one("img#d_a_c_photo")
-                        if img_by_id:
-                            img_url = img_by_id.get("src") or img_by_id.get("data-src") or ""
+def parse_nestoria_html(html: str, price_min: Optional[int] = None, price_max: Optional[int] = None,
+                        results: Optional[list] = None) -> list:
+    """
+    Parsea la página de resultados de Nestoria (sin navegador) y agrega los anuncios a `results`.
+    La imagen queda vacía: se resuelve después desde el detalle.
+    """
+    if results is None:
+        results = []
+    page = as_page(html, only=NESTORIA_ONLY)
+    # Seleccionar los contenedores de anuncios
+    items = page.select("li.rating__new") or page.select("ul#main__listing_res > li")
+    if not items:
+        items = [li for li in page.full.find_all("li") if li.select_one(".result__details__price")]
+    if not items:
+        items = page.full.find_all(["li", "div", "article"], class_=lambda x: x and any(cls in x for cls in ["listing", "result", "property", "item"]))
+    seen_links = set()
+    for li in items:
+        if getattr(results, "cancelled", False):
+            break
+        try:
+            a_tag = li.select_one("a.results__link") or li.select_one("a[href]")
+            if not a_tag:
+                continue
+            title_elem = li.select_one(".listing__title__text") or li.select_one(".listing__title") or a_tag
+            price_elem = li.select_one(".result__details__price span") or li.select_one(".result__details__price") or li.select_one(".price")
+            desc_elem = li.select_one(".listing__description") or li.select_one(".result__summary") or None
+            row = _nestoria_row({
+                "link": a_tag.get("data-href") or a_tag.get("href") or "",
+                "title": title_elem.get_text(" ", strip=True),
+                "price": price_elem.get_text(" ", strip=True) if price_elem else "",
+                "desc": desc_elem.get_text(" ", strip=True) if desc_elem else None,
+                "text": li.get_text(" ", strip=True),
+            }, price_min, price_max, seen_links)
+            if row:
+                results.append(row)
+        except Exception as e:
+            continue
+    return results
 
-                    # Método 3: Si aún no se encuentra, buscar en la etiqueta meta con itemprop="image"
-                    if not img_url:
-                        meta_img = detail_soup.select_one("meta[itemprop='image']")
-                        if meta_img:
-                            img_url = meta_img.get("content") or ""
+def scrape_nestoria(zona: str = "", dormitorios: str = "0", banos: str = "0",
+                      price_min: Optional[int] = None, price_max: Optional[int] = None,
+                      palabras_clave: str = "", max_results_per_zone: int = 200,
+                      image_mode: str = NESTORIA_IMAGE_MODE):
+    """
+    Scraper FINAL para Nestoria. Usa Selenium.
+    Extrae la imagen DEL DETALLE de cada anuncio.
+    Solo entra al detalle para obtener la imagen, no para extraer más datos.
+    image_mode: "sync" (resuelve imágenes antes de devolver), "defer" (devuelve ya y
+    resuelve en segundo plano hacia la cache) o "none" (solo lo que ya esté en cache).
+    VALIDA si la búsqueda devolvió 0 resultados y en ese caso devuelve DataFrame vacío.
+    """
+    base_url = build_nestoria_url(zona, dormitorios, banos, price_min, price_max)
+    print(f"URL de Nestoria: {base_url}")
+    results = results_buffer()
+    # Primero HTTP plano: si el HTML del servidor ya trae las cards (o el título con 0 resultados)
+    # no hace falta navegador. El título solo no alcanza: "sin resultados" es únicamente el conteo 0
+    page = fetch_listing(base_url, NESTORIA_CARDS, "nestoria", only=NESTORIA_ONLY, metrics=results.metrics,
+                         is_empty=lambda p: nestoria_result_count(p.html) == 0)
+    driver = None
+    try:
+        if page is not None:
+            results.metrics["engine"] = "http"
+            # --- VALIDACIÓN: Verificar si hay 0 resultados ---
+            if nestoria_result_count(page.html) == 0:
+                print("Nestoria: La búsqueda devolvió 0 resultados. Saltando...")
+                return pd.DataFrame()
+            parse_nestoria_html(page, price_min, price_max, results)
+        else:
+            results.metrics["engine"] = "selenium"
+            driver = acquire_driver()
+            load_page(driver, base_url, results.metrics, "nestoria")
+            wait_for_selector(driver, NESTORIA_READY.selector, timeout=NESTORIA_READY.timeout)
 
-                    # Limpiar y formatear la URL
-                    if img_url:
-                        if img_url.startswith("//"):
-                            img_url = "https:" + img_url
-                        img_url = img_url.strip()
-                    else:
-                        img_url = ""  # Asegurarse de que sea cadena vacía si no se encontró nada
+            # --- NUEVA VALIDACIÓN: Verificar si hay 0 resultados ---
+            if nestoria_result_count(driver.page_source) == 0:
+                print("Nestoria: La búsqueda devolvió 0 resultados. Saltando...")
+                return pd.DataFrame()  # Devolver vacío si son 0 resultados
 
-                except Exception as e:
-                    print(f"Error al obtener imagen de detalle en Nestoria para {link}: {e}")
-                    pass
+            # Scroll para cargar más resultados (solo mientras la página siga creciendo)
+            scroll_until_stable(driver, NESTORIA_CARDS, max_scrolls=NESTORIA_READY.max_scrolls, settle=NESTORIA_READY.settle)
+            items = extract_cards(driver, NESTORIA_JS_SPEC, "Nestoria")
+            if items:
+                seen_links = set()
+                feats = card_features_many((raw.get("text") or "" for raw in items), RE_CARD_FEATURES_DORM)
+                append_rows(results, list(zip(items, feats)),
+                            lambda item: _nestoria_row(item[0], price_min, price_max, seen_links, item[1]))
+            else:
+                parse_nestoria_html(driver.page_source, price_min, price_max, results)
 
-                results.append({
-                    "titulo": title,
-                    "precio": price_text,
-                    "m2": m2_text,
-                    "dormitorios": dormitorios_text,
-                    "baños": banos_text,
-                    "descripcion": desc,
-                    "link": link,
-                    "imagen_url": img_url
-                })
-                seen_links.add(link)
-            except Exception as e:
-                continue
+        # Imagen principal DEL DETALLE: cache + HTTP en paralelo, Selenium solo como fallback
+        links = [r["link"] for r in results]
+        if image_mode == "sync" and not results.cancelled:
+            images = resolve_images(links, driver=driver, budget=IMAGE_SYNC_BUDGET)
+        else:
+            images = get_image_cache().get_many(links)
+            if image_mode == "defer":
+                # devolver ya los anuncios; las imágenes faltantes quedan en cache para la próxima vez
+                resolve_images_background([l for l in links if l not in images])
+        for r in results:
+            r["imagen_url"] = images.get(r["link"], "")
     except Exception as e:
         print(f"Error en Nestoria scraper: {e}")
+        results.metrics["error"] = str(e)
     finally:
-        try:
-            driver.quit()
-        except:
-            pass
+        if driver is not None:
+            release_driver(driver)
     print(f"Procesados {len(results)} anuncios válidos")
-    return pd.DataFrame(results)
\ No newline at end of file
+    return listings_frame(results)
\ No newline at end of file
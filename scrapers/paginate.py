@@ -0,0 +1,196 @@
+import os
+import re
+import math
+import queue
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, urljoin, quote
+
+# Imports locales
+from .driver_pool import acquire_driver, release_driver
+from .fetch import fetch_page
+
+# -------------------- Paginación en paralelo --------------------
+# Configuración (se puede sobreescribir por variables de entorno)
+PAGE_WORKERS = int(os.getenv("SCRAPER_PAGE_WORKERS", "3"))            # páginas descargadas a la vez por fuente
+EXTRA_DRIVER_TIMEOUT = float(os.getenv("SCRAPER_EXTRA_DRIVER_TIMEOUT", "0.5"))
+NEXT_LINKS = "a[rel='next'], a[aria-label='Siguiente'], a[data-qa='pagination-next'], a.pagination__next, a.next"
+_JS_HREFS = "return Array.from(document.querySelectorAll('a[href]'), a => a.getAttribute('href'));"
+
+def set_query_param(url: str, name: str, value) -> str:
+    """
+    Devuelve `url` con el parámetro `name` reemplazado en su lugar (o agregado al final;
+    quitado si value es None). Los demás parámetros se vuelven a codificar con %20 como
+    requests.utils.quote, igual que los arman los build_*_url.
+    """
+    parts = urlsplit(url)
+    query, found = [], False
+    for k, v in parse_qsl(parts.query, keep_blank_values=True):
+        if k == name:
+            if value is not None and not found:
+                query.append((k, str(value)))
+            found = True
+        else:
+            query.append((k, v))
+    if value is not None and not found:
+        query.append((name, str(value)))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query, quote_via=quote), parts.fragment))
+
+def page_plan(total: Optional[int], per_page: int, max_pages: int, last_page: Optional[int] = None) -> list:
+    """
+    Números de página a pedir después de la primera, hasta max_pages:
+    por el total de resultados si se conoce, si no por la última página enlazada,
+    y si no hay ninguno de los dos, todas hasta max_pages (se corta cuando una no aporte nada).
+    """
+    last = max_pages
+    if total is not None and per_page > 0:
+        last = min(max_pages, math.ceil(total / per_page))
+    elif last_page is not None:
+        last = min(max_pages, last_page)
+    return list(range(2, last + 1))
+
+def page_hrefs(page) -> list:
+    """Todos los href de una ParsedPage (árbol completo: la paginación no está en las cards)."""
+    return [a.get("href") or "" for a in page.full.select("a[href]")]
+
+def driver_hrefs(driver) -> list:
+    """Todos los href de la página abierta en el navegador, en un solo execute_script."""
+    try:
+        return driver.execute_script(_JS_HREFS) or []
+    except Exception:
+        return []
+
+def last_linked_page(hrefs, param: str) -> Optional[int]:
+    """Mayor número de página en los links de paginación (`param=N`), o None si no hay."""
+    pattern = re.compile(rf"[?&]{re.escape(param)}=(\d+)")
+    numbers = [int(m.group(1)) for m in map(pattern.search, hrefs or []) if m]
+    return max(numbers) if numbers else None
+
+def next_link(page, base_url: str) -> str:
+    """URL absoluta del link "siguiente" de una ParsedPage, o "" si no hay."""
+    a = page.full.select_one(NEXT_LINKS)
+    href = a.get("href") if a else ""
+    return urljoin(base_url, href) if href else ""
+
+def merge_new(rows, seen: set, results, max_results: Optional[int] = None) -> int:
+    """Agrega a `results` las filas cuyo link todavía no se vio. Devuelve cuántas agregó."""
+    added = 0
+    for row in rows or []:
+        if getattr(results, "cancelled", False):
+            break
+        if max_results is not None and len(results) >= max_results:
+            break
+        link = row.get("link")
+        if link in seen:
+            continue
+        seen.add(link)
+        results.append(row)
+        added += 1
+    return added
+
+def fetch_pages(urls, fetch_one, seen: set, results, workers: int = PAGE_WORKERS,
+                max_results: Optional[int] = None) -> int:
+    """
+    Descarga las páginas en tandas de `workers` a la vez y mezcla cada una en orden de página
+    en cuanto llega (los resultados parciales quedan disponibles enseguida en `results`).
+    Corta cuando una página no aporta links nuevos, al llegar a max_results o si se cancela.
+    Devuelve cuántas páginas se mezclaron.
+    """
+    workers = max(1, workers)
+    merged = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="page") as ex:
+        for i in range(0, len(urls), workers):
+            if getattr(results, "cancelled", False):
+                return merged
+            wave = urls[i:i + workers]
+            futures = [ex.submit(fetch_one, u) for u in wave]
+            for url, f in zip(wave, futures):
+                try:
+                    rows = f.result()
+                except Exception as e:
+                    print(f"Error descargando {url}: {e}")
+                    rows = None
+                added = merge_new(rows, seen, results, max_results)
+                merged += 1
+                full = max_results is not None and len(results) >= max_results
+                if not added or full:
+                    for other in futures:
+                        other.cancel()
+                    return merged
+    return merged
+
+def follow_next(first_page, url: str, fetch_page_fn, parse_rows, seen: set, results,
+                max_pages: int, max_results: Optional[int] = None) -> int:
+    """Cuando no se pueden calcular las URLs de antemano: sigue el link "siguiente" de a una."""
+    page, merged = first_page, 0
+    for _ in range(max_pages - 1):
+        nxt = next_link(page, url)
+        if not nxt or getattr(results, "cancelled", False):
+            break
+        page = fetch_page_fn(nxt)
+        if page is None:
+            break
+        merged += 1
+        if not merge_new(parse_rows(page), seen, results, max_results):
+            break
+        if max_results is not None and len(results) >= max_results:
+            break
+        url = nxt
+    return merged
+
+def http_pages(url: str, first_page, param: str, parse_rows, source: str, seen: set, results,
+               max_pages: int, max_results: Optional[int] = None, total: Optional[int] = None,
+               per_page: int = 0, only=None, workers: int = PAGE_WORKERS) -> int:
+    """
+    Páginas 2..N de un listado cuya primera página (`first_page`, ya mezclada en `results`)
+    se bajó por HTTP. El plan sale del total de resultados, de los links `param=N` o, si la
+    página solo trae un link "siguiente", se sigue de a una. `parse_rows(page)` devuelve las
+    filas de una página. Devuelve cuántas páginas extra se mezclaron.
+    """
+    if max_pages <= 1 or getattr(results, "cancelled", False):
+        return 0
+    if max_results is not None and len(results) >= max_results:
+        return 0
+    fetch = lambda u: fetch_page(u, source, only=only, metrics=getattr(results, "metrics", None))
+    last = None if total is not None else last_linked_page(page_hrefs(first_page), param)
+    if total is None and last is None and next_link(first_page, url):
+        return follow_next(first_page, url, fetch, parse_rows, seen, results, max_pages, max_results)
+    urls = [set_query_param(url, param, n) for n in page_plan(total, per_page, max_pages, last)]
+
+    def fetch_one(page_url):
+        page = fetch(page_url)
+        return None if page is None else parse_rows(page)
+
+    return fetch_pages(urls, fetch_one, seen, results, workers, max_results)
+
+@contextmanager
+def driver_fanout(main_driver, wanted: int, fetch_with):
+    """
+    El driver del scraper más hasta `wanted - 1` drivers extra del pool, solo si están libres
+    (no se bloquea a las otras fuentes). Entrega fetch_one(url), que ejecuta
+    fetch_with(driver, url) con el primer driver libre; fetch_one.workers dice cuántos hay.
+    """
+    extra = []
+    for _ in range(max(0, wanted - 1)):
+        try:
+            extra.append(acquire_driver(timeout=EXTRA_DRIVER_TIMEOUT))
+        except Exception:
+            break
+    free = queue.Queue()
+    for d in [main_driver] + extra:
+        free.put(d)
+
+    def fetch_one(url):
+        driver = free.get()
+        try:
+            return fetch_with(driver, url)
+        finally:
+            free.put(driver)
+
+    fetch_one.workers = 1 + len(extra)
+    try:
+        yield fetch_one
+    finally:
+        for d in extra:
+            release_driver(d)
@@ -0,0 +1,84 @@
+import os
+import re
+from typing import Optional
+
+# -------------------- Precios y monedas --------------------
+# Moneda y monto de textos como "S/ 1.680", "S/. 2,500.00", "US$ 480" o "USD 1,200", y el
+# precio en soles (PEN) con una tabla de tipos de cambio local, calculado una vez por anuncio.
+# Configuración (se puede sobreescribir por variables de entorno)
+FX_USD_PEN = float(os.getenv("FX_USD_PEN", "3.75"))   # soles por dólar
+# Otras monedas: FX_RATES="EUR=4.05,USD=3.72" (soles por unidad; pisa a FX_USD_PEN)
+FX_RATES_ENV = os.getenv("FX_RATES", "")
+
+def _rates_from_env(spec: str) -> dict:
+    rates = {}
+    for part in spec.split(","):
+        code, _, value = part.partition("=")
+        try:
+            rates[code.strip().upper()] = float(value)
+        except ValueError:
+            continue
+    return rates
+
+# moneda -> soles por unidad ("S" es la moneda de los anuncios en soles)
+TASAS_A_SOLES = {"S": 1.0, "USD": FX_USD_PEN, **_rates_from_env(FX_RATES_ENV)}
+
+# marcador de moneda; el orden importa ("US$" antes que "$", "S/." antes que "S/")
+_RE_MONEDA = re.compile(r"US\$|U\$S|\$|S/\.?|€|\b(?:USD|PEN|soles|d[oó]lares|EUR)\b", re.I)
+# "1 680" (miles con espacio) antes que "1.680" / "2,500.00"
+_RE_MONTO = re.compile(r"\d{1,3}(?:[ \u00a0]\d{3})+(?![\d.,])|\d[\d.,]*\d|\d")
+_MONEDAS = {"us$": "USD", "u$s": "USD", "usd": "USD", "$": "USD", "dolares": "USD", "dólares": "USD",
+            "s/": "S", "s/.": "S", "pen": "S", "soles": "S", "eur": "EUR", "€": "EUR"}
+
+def parse_amount(token: str) -> Optional[float]:
+    """
+    Monto con separadores de miles y decimales en cualquiera de los dos estilos:
+    "1.680" / "1,680" -> 1680, "2,500.00" / "2.500,00" -> 2500.0, "1.5" -> 1.5.
+    """
+    token = re.sub(r"[ \u00a0]", "", token or "")
+    if not token:
+        return None
+    last_dot, last_comma = token.rfind("."), token.rfind(",")
+    if last_dot >= 0 and last_comma >= 0:
+        # los dos separadores: el último es el decimal
+        dec = "." if last_dot > last_comma else ","
+        whole, _, frac = token.rpartition(dec)
+        whole = re.sub(r"[.,]", "", whole)
+    elif last_dot >= 0 or last_comma >= 0:
+        sep = "." if last_dot >= 0 else ","
+        parts = token.split(sep)
+        if len(parts) > 2 or len(parts[-1]) == 3:
+            # "1.680", "1,250,000": separador de miles
+            whole, frac = "".join(parts), ""
+        else:
+            whole, frac = parts[0], parts[1]
+    else:
+        whole, frac = token, ""
+    try:
+        return float(f"{whole or 0}.{frac or 0}")
+    except ValueError:
+        return None
+
+def parse_price(text) -> tuple:
+    """
+    (moneda, monto entero) del texto de un precio: moneda "S", "USD", "EUR" o None si no
+    tiene marcador; se toma el primer monto después del marcador (o el primero del texto).
+    """
+    if not text:
+        return (None, None)
+    s = str(text)
+    m = _RE_MONEDA.search(s)
+    moneda = _MONEDAS.get(m.group(0).lower()) if m else None
+    monto = _RE_MONTO.search(s, m.end() if m else 0) or (_RE_MONTO.search(s) if m else None)
+    value = parse_amount(monto.group(0)) if monto else None
+    return (moneda, int(round(value)) if value is not None else None)
+
+def to_soles(moneda: Optional[str], valor) -> Optional[int]:
+    """Monto en soles según TASAS_A_SOLES; None si no hay monto o la moneda no está en la tabla."""
+    if valor is None or valor != valor:
+        return None
+    rate = TASAS_A_SOLES.get(moneda) if moneda else None
+    return int(round(valor * rate)) if rate is not None else None
+
+def price_pen(text) -> Optional[int]:
+    return to_soles(*parse_price(text))
@@ -1,72 +1,37 @@
-import re
+import os
 import requests
 from typing import Optional
 import pandas as pd
-from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
 
 # Imports locales desde el módulo 'common'
 from .common import (
-    COMMON_UA,
-    slugify_zone
+    as_page,
+    slugify_zone,
+    results_buffer
 )
+from .features import first_int
+from .fetch import fetch_page
+from .listing import Listing, listings_frame
+from .paginate import merge_new, http_pages
+from .zones import resolve_zone
 
 # -------------------- Properati --------------------
-def scrape_properati(zona: str = "", dormitorios: str = "0", banos: str = "0",
-                       price_min: Optional[int] = None, price_max: Optional[int] = None,
-                       palabras_clave: str = ""):
+# Parseo acotado a las cards del listado
+PROPERATI_ONLY = SoupStrainer("article")
+# Páginas del listado (parámetro page= o link "siguiente") a recorrer como máximo
+PROPERATI_MAX_PAGES = int(os.getenv("PROPERATI_MAX_PAGES", "3"))
+
+# Filtros que ya aplica el sitio (ver planner.py): bedrooms/bathrooms exactos y las palabras
+# clave como amenities (piscina, jardín) o keyword
+PROPERATI_SERVER_FILTERS = {"dormitorios": "exact", "banos": "exact", "precio": "range", "palabras_clave": "amenities"}
+
+def build_properati_url(zona: str = "", dormitorios: str = "0", banos: str = "0",
+                        price_min: Optional[int] = None, price_max: Optional[int] = None,
+                        palabras_clave: str = "") -> str:
     if zona and zona.strip():
-        # Mapeo específico para Properati
-        ZONA_MAPEO_PROPERATI = {
-            "ancón": "ancon",
-            "ate": "ate",
-            "barranco": "barranco",
-            "breña": "brena",
-            "carabayllo": "carabayllo",
-            "chaclacayo": "chaclacayo",
-            "chorrillos": "chorrillos",
-            "cieneguilla": "cieneguilla",
-            "comas": "comas",
-            "el agustino": "el-agustino",
-            "independencia": "independencia",
-            "jesús maría": "jesus-maria",
-            "la molina": "la-molina",
-            "la victoria": "la-victoria",
-            "lima": "lima",
-            "lince": "lince",
-            "los olivos": "los-olivos",
-            "lurigancho": "lurigancho",
-            "lurín": "lurin",
-            "magdalena del mar": "magdalena-del-mar",
-            "miraflores": "miraflores",
-            "pachacámac": "pachacamac",
-            "pucusana": "pucusana",
-            "pueblo libre": "pueblo-libre",
-            "puente piedra": "puente-piedra",
-            "punta hermosa": "punta-hermosa",
-            "punta negra": "punta-negra",
-            "rímac": "rimac",
-            "san bartolo": "san-bartolo",
-            "san borja": "san-borja",
-            "san isidro": "san-isidro",
-            "san juan de lurigancho": "san-juan-de-lurigancho",
-            "san juan de miraflores": "san-juan-de-miraflores",
-            "san luis": "san-luis",
-            "san martín de porres": "san-martin-de-porres",
-            "san miguel": "san-miguel",
-            "santa anita": "santa-anita",
-            "santa maría del mar": "santa-maria-del-mar",
-            "santa rosa": "santa-rosa",
-            "santiago de surco": "santiago-de-surco",
-            "surquillo": "surquillo",
-            "villa el salvador": "villa-el-salvador",
-            "villa maría del triunfo": "villa-maria-del-triunfo",
-            # Nuevas entradas para manejar "cercado de lima"
-            "cercado de lima": "lima-cercado",
-            "cercado lima": "lima-cercado",
-            "lima cercado": "lima-cercado",
-        }
-        zona_lower = zona.strip().lower()
-        zone_slug = ZONA_MAPEO_PROPERATI.get(zona_lower, slugify_zone(zona))
+        zone = resolve_zone(zona)
+        zone_slug = zone.properati if zone is not None else slugify_zone(zona)
         base = f"https://www.properati.com.pe/s/{zone_slug}/alquiler?propertyType=apartment%2Chouse"
     else:
         base = "https://www.properati.com.pe/s/alquiler?propertyType=apartment%2Chouse"
@@ -101,16 +66,17 @@ def scrape_properati(zona: str = "", dormitorios: str = "0", banos: str = "0",
     # Construir URL final
     if params:
         base += "&" + "&".join(params)
-    print(f"URL de Properati: {base}")  # Mostrar URL usada
-    try:
-        r = requests.get(base, headers={"User-Agent": COMMON_UA}, timeout=15)
-        r.raise_for_status()
-    except:
-        return pd.DataFrame()
-    soup = BeautifulSoup(r.text, "html.parser")
-    cards = soup.select("article") or soup.select("div.posting-card") or soup.select("a[href]")
-    results = []
+    return base
+
+def parse_properati_html(html: str, results: Optional[list] = None) -> list:
+    """Parsea el listado de Properati y agrega los anuncios a `results`."""
+    if results is None:
+        results = []
+    page = as_page(html, only=PROPERATI_ONLY)
+    cards = page.select("article") or page.select("div.posting-card") or page.select("a[href]")
     for c in cards:
+        if getattr(results, "cancelled", False):
+            break
         try:
             a = c.select_one("a[href]") or c.select_one("a.title")
             href = a.get("href") if a else ""
@@ -125,26 +91,17 @@ def scrape_properati(zona: str = "", dormitorios: str = "0", banos: str = "0",
             dormitorios_text = ""
             dorm_elem = c.select_one(".properties__bedrooms")
             if dorm_elem:
-                dorm_text = dorm_elem.get_text(" ", strip=True)
-                dorm_match = re.search(r'(\d+)', dorm_text)
-                if dorm_match:
-                    dormitorios_text = dorm_match.group(1)
+                dormitorios_text = first_int(dorm_elem.get_text(" ", strip=True))
             # EXTRAER BAÑOS
             banos_text = ""
             banos_elem = c.select_one(".properties__bathrooms")
             if banos_elem:
-                banos_text_full = banos_elem.get_text(" ", strip=True)
-                banos_match = re.search(r'(\d+)', banos_text_full)
-                if banos_match:
-                    banos_text = banos_match.group(1)
+                banos_text = first_int(banos_elem.get_text(" ", strip=True))
             # EXTRAER METROS CUADRADOS
             m2_text = ""
             m2_elem = c.select_one(".properties__area")
             if m2_elem:
-                m2_text_full = m2_elem.get_text(" ", strip=True)
-                m2_match = re.search(r'(\d+)', m2_text_full)
-                if m2_match:
-                    m2_text = m2_match.group(1)
+                m2_text = first_int(m2_elem.get_text(" ", strip=True))
             img = ""
             img_tag = c.select_one("img")
             if img_tag:
@@ -161,17 +118,36 @@ def scrape_properati(zona: str = "", dormitorios: str = "0", banos: str = "0",
                 else:
                     img = ""  # Rechazar si no cumple con el criterio
             # AHORA INCLUIMOS LOS VALORES EXTRAÍDOS
-            results.append({
-                "titulo": title,
-                "precio": price,
-                "m2": m2_text,
-                "dormitorios": dormitorios_text,
-                "baños": banos_text,
-                "descripcion": title,
-                "link": href or "",
-                "imagen_url": img
-            })
+            results.append(Listing(
+                titulo=title,
+                precio=price,
+                m2=m2_text,
+                dormitorios=dormitorios_text,
+                banos=banos_text,
+                descripcion=title,
+                link=href or "",
+                imagen_url=img
+            ))
         except Exception as e:
             print(f"Error en Properati al procesar un anuncio: {e}")
             continue
-    return pd.DataFrame(results)
\ No newline at end of file
+    return results
+
+def scrape_properati(zona: str = "", dormitorios: str = "0", banos: str = "0",
+                       price_min: Optional[int] = None, price_max: Optional[int] = None,
+                       palabras_clave: str = "", max_pages: int = PROPERATI_MAX_PAGES,
+                       max_results: Optional[int] = None):
+    base = build_properati_url(zona, dormitorios, banos, price_min, price_max, palabras_clave)
+    print(f"URL de Properati: {base}")  # Mostrar URL usada
+    results = results_buffer()
+    results.metrics["engine"] = "http"
+    page = fetch_page(base, "properati", only=PROPERATI_ONLY, metrics=results.metrics)
+    if page is None:
+        results.metrics["error"] = "sin respuesta HTTP"
+        return pd.DataFrame()
+    seen = set()
+    if merge_new(parse_properati_html(page), seen, results, max_results):
+        # siguientes páginas en paralelo con la misma sesión
+        http_pages(base, page, "page", parse_properati_html, "properati", seen, results, max_pages,
+                   max_results, only=PROPERATI_ONLY)
+    return listings_frame(results)
@@ -0,0 +1,225 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlsplit
+
+# Imports locales desde el módulo 'common'
+from .common import DATA_DIR
+
+# -------------------- Rate limit por host (compartido entre workers) --------------------
+# Token bucket por host guardado en SQLite: todos los workers de gunicorn (y todos sus hilos)
+# sacan turno del mismo balde. Los turnos se atienden en orden de llegada (FIFO por host) y
+# un 429/403 deja al host en backoff exponencial (o lo que diga Retry-After).
+# Configuración (se puede sobreescribir por variables de entorno)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") not in ("0", "false", "False")
+RATE_LIMIT_PATH = os.getenv("RATE_LIMIT_PATH", os.path.join(DATA_DIR, "ratelimit.sqlite"))
+RATE_LIMIT_RPS = float(os.getenv("RATE_LIMIT_RPS", "1.0"))               # requests por segundo por host
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "4"))             # ráfaga permitida con el balde lleno
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "30"))      # espera máxima por un turno
+RATE_LIMIT_BACKOFF = float(os.getenv("RATE_LIMIT_BACKOFF", "30"))        # primer backoff tras un 429/403
+RATE_LIMIT_MAX_BACKOFF = float(os.getenv("RATE_LIMIT_MAX_BACKOFF", "900"))
+# Páginas de detalle (p.ej. las imágenes de Nestoria): balde aparte "<host>/detalle" con su ritmo,
+# para que un lote de detalles no haga esperar (ni quede esperando detrás de) el listado
+RATE_LIMIT_DETAIL_RPS = float(os.getenv("RATE_LIMIT_DETAIL_RPS", "8"))
+RATE_LIMIT_DETAIL_BURST = float(os.getenv("RATE_LIMIT_DETAIL_BURST", "8"))
+
+# Ritmo por host (requests/s, ráfaga); el resto usa RATE_LIMIT_RPS / RATE_LIMIT_BURST
+HOST_RATES = {
+    "urbania.pe": (0.5, 3),
+    "infocasas.com.pe": (0.5, 3),
+}
+
+BLOCKED_STATUSES = (403, 429)
+_POLL = 0.25  # cada cuánto revisa su turno quien está en la cola
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS baldes (host TEXT PRIMARY KEY, tokens REAL, updated REAL,
+                                   blocked_until REAL DEFAULT 0, strikes INTEGER DEFAULT 0);
+CREATE TABLE IF NOT EXISTS turnos (ticket INTEGER PRIMARY KEY AUTOINCREMENT, host TEXT, ts REAL);
+CREATE INDEX IF NOT EXISTS idx_turnos_host ON turnos(host, ticket);
+"""
+
+class RateLimited(Exception):
+    """El host está en backoff (o la cola es más larga que RATE_LIMIT_MAX_WAIT): no se lo llama."""
+
+def host_of(url: str) -> str:
+    host = (urlsplit(url or "").hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+def detail_bucket(url: str) -> str:
+    """Balde de las páginas de detalle del host de `url`."""
+    return host_of(url) + "/detalle"
+
+def _retry_after(value) -> Optional[float]:
+    """Segundos de un header Retry-After (número o fecha HTTP)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+class HostRateLimiter:
+    """Turnos por host: acquire(url) antes de cada request, report(url, status) después."""
+    def __init__(self, path: str = RATE_LIMIT_PATH, rates: dict = None, max_wait: float = RATE_LIMIT_MAX_WAIT):
+        self.path = path
+        self.rates = HOST_RATES if rates is None else rates
+        self.max_wait = max_wait
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Transacción con lock de escritura tomado desde el principio (lee y actualiza el balde sin carreras)."""
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _rate(self, host: str):
+        default = (RATE_LIMIT_DETAIL_RPS, RATE_LIMIT_DETAIL_BURST) if host.endswith("/detalle") else (RATE_LIMIT_RPS, RATE_LIMIT_BURST)
+        rps, burst = self.rates.get(host, default)
+        return max(rps, 1e-3), max(burst, 1.0)
+
+    def _try_take(self, host: str, ticket: int, now: float) -> float:
+        """Saca un token si es el turno de `ticket`. Devuelve 0 si lo sacó, o cuánto falta esperar."""
+        rps, burst = self._rate(host)
+        with self._transaction() as conn:
+            # turnos abandonados (proceso muerto a mitad de la espera)
+            conn.execute("DELETE FROM turnos WHERE ts < ?", (now - 2 * self.max_wait - 60,))
+            row = conn.execute("SELECT tokens, updated, blocked_until FROM baldes WHERE host = ?", (host,)).fetchone()
+            tokens, updated, blocked_until = row if row else (burst, now, 0.0)
+            if blocked_until > now:
+                return blocked_until - now
+            head = conn.execute("SELECT MIN(ticket) FROM turnos WHERE host = ?", (host,)).fetchone()[0]
+            tokens = min(burst, tokens + (now - updated) * rps)
+            if head == ticket and tokens >= 1:
+                conn.execute("INSERT OR REPLACE INTO baldes (host, tokens, updated, blocked_until, strikes) "
+                             "VALUES (?, ?, ?, ?, COALESCE((SELECT strikes FROM baldes WHERE host = ?), 0))",
+                             (host, tokens - 1, now, blocked_until, host))
+                conn.execute("DELETE FROM turnos WHERE ticket = ?", (ticket,))
+                return 0.0
+            return max(1 - tokens, 0.0) / rps if head == ticket else _POLL
+
+    def acquire(self, url: str, max_wait: Optional[float] = None, bucket: Optional[str] = None) -> float:
+        """
+        Espera el turno del host de `url` (o del balde `bucket`; FIFO entre todos los workers).
+        Devuelve los segundos esperados; lanza RateLimited si el host está en backoff o la
+        espera supera max_wait (el del limiter, o uno menor que se pase acá).
+        """
+        host = bucket or host_of(url)
+        if not RATE_LIMIT_ENABLED or not host:
+            return 0.0
+        max_wait = self.max_wait if max_wait is None else min(max_wait, self.max_wait)
+        t0 = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT blocked_until FROM baldes WHERE host = ?", (host,)).fetchone()
+            if row and row[0] - t0 > max_wait:
+                raise RateLimited(f"{host} en backoff por {row[0] - t0:.0f}s")
+            ticket = conn.execute("INSERT INTO turnos (host, ts) VALUES (?, ?)", (host, t0)).lastrowid
+        try:
+            while True:
+                now = time.time()
+                wait_for = self._try_take(host, ticket, now)
+                if wait_for <= 0:
+                    return now - t0
+                if now + wait_for - t0 > max_wait:
+                    raise RateLimited(f"{host}: sin turno en {max_wait:.0f}s")
+                time.sleep(min(wait_for, _POLL))
+        except BaseException:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM turnos WHERE ticket = ?", (ticket,))
+            raise
+
+    def report(self, url: str, status: Optional[int], retry_after=None, blocked=BLOCKED_STATUSES,
+               bucket: Optional[str] = None):
+        """Resultado del request: un status de `blocked` pone al host (o al balde) en backoff (se duplica en cada strike), 2xx lo limpia."""
+        host = bucket or host_of(url)
+        if not RATE_LIMIT_ENABLED or not host or not status:
+            return
+        now = time.time()
+        if status in blocked:
+            with self._transaction() as conn:
+                row = conn.execute("SELECT strikes FROM baldes WHERE host = ?", (host,)).fetchone()
+                strikes = (row[0] if row else 0) + 1
+                backoff = _retry_after(retry_after)
+                if backoff is None:
+                    backoff = min(RATE_LIMIT_BACKOFF * 2 ** (strikes - 1), RATE_LIMIT_MAX_BACKOFF)
+                # el balde queda vacío: al salir del backoff se vuelve de a poco
+                conn.execute("INSERT OR REPLACE INTO baldes VALUES (?, ?, ?, ?, ?)",
+                             (host, 0.0, now + backoff, now + backoff, strikes))
+            print(f"🚦 {host}: HTTP {status}, backoff de {backoff:.0f}s (strike {strikes})")
+        elif 200 <= status < 400:
+            with self._transaction() as conn:
+                conn.execute("UPDATE baldes SET strikes = 0 WHERE host = ? AND strikes > 0", (host,))
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        with self._transaction() as conn:
+            baldes = conn.execute("SELECT host, tokens, updated, blocked_until, strikes FROM baldes").fetchall()
+            cola = dict(conn.execute("SELECT host, COUNT(*) FROM turnos GROUP BY host").fetchall())
+        out = {}
+        for host, tokens, updated, blocked_until, strikes in baldes:
+            rps, burst = self._rate(host)
+            out[host] = {
+                "tokens": round(min(burst, tokens + max(0.0, now - updated) * rps), 2),
+                "backoff_seconds": round(max(0.0, blocked_until - now), 1),
+                "strikes": strikes,
+                "waiting": cola.get(host, 0),
+            }
+        return out
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> HostRateLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = HostRateLimiter()
+        return _limiter
+
+def wait_turn(url: str, max_wait: Optional[float] = None, bucket: Optional[str] = None) -> float:
+    """acquire() que nunca rompe el scrape por un problema del propio limiter (sí por RateLimited)."""
+    try:
+        return get_rate_limiter().acquire(url, max_wait, bucket)
+    except RateLimited:
+        raise
+    except Exception as e:
+        print(f"Error en el rate limiter ({host_of(url)}): {e}")
+        return 0.0
+
+def report_status(url: str, status: Optional[int], retry_after=None, blocked=BLOCKED_STATUSES,
+                  bucket: Optional[str] = None):
+    try:
+        get_rate_limiter().report(url, status, retry_after, blocked, bucket)
+    except Exception as e:
+        print(f"Error en el rate limiter ({host_of(url)}): {e}")
+
+def polite_get(session, url: str, blocked=BLOCKED_STATUSES, max_wait: Optional[float] = None,
+               bucket: Optional[str] = None, **kwargs):
+    """session.get(url) con turno del host (o de `bucket`) y backoff si responde con un status de `blocked` (429/403)."""
+    wait_turn(url, max_wait, bucket)
+    r = session.get(url, **kwargs)
+    report_status(url, r.status_code, r.headers.get("Retry-After"), blocked, bucket)
+    return r
@@ -1,23 +1,42 @@
+import os
 import re
-import time
 import requests
 from typing import Optional
-import pandas as pd
-from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
 
 # Imports locales desde el módulo 'common'
 from .common import (
-    create_driver,
+    load_page,
+    as_page,
     slugify_zone,
-    WebDriverWait,
-    By,
-    EC
+    results_buffer,
+    wait_for_selector,
+    scroll_until_stable
 )
+from .driver_pool import acquire_driver, release_driver
+from .extract import extract_cards, append_rows
+from .features import label_features
+from .fetch import fetch_listing
+from .listing import Listing, listings_frame
+from .paginate import (
+    PAGE_WORKERS, set_query_param, page_plan, merge_new, fetch_pages, http_pages, driver_fanout
+)
+from .zones import resolve_zone
 
 # -------------------- Urbania --------------------
-def scrape_urbania(zona: str = "", dormitorios: str = "0", banos: str = "0",
-                     price_min: Optional[int] = None, price_max: Optional[int] = None,
-                     palabras_clave: str = "", max_pages: int = 6, wait_time: float = 1.5):
+# Condición de "página lista": cualquiera de los contenedores de card conocidos
+URBANIA_CARDS = ("div[data-qa='posting PROPERTY'], article, div.postingCard-module__posting, "
+                 "div.postingCard, div.posting-card, div[class*='postingCard']")
+# Parseo acotado a las cards del listado
+URBANIA_ONLY = SoupStrainer("div", attrs={"data-qa": "posting PROPERTY"})
+
+# Filtros que ya aplica el sitio (ver planner.py): bedroomMin/bathroomMin son mínimos y el
+# keyword busca en el texto del aviso
+URBANIA_SERVER_FILTERS = {"dormitorios": "min", "banos": "min", "precio": "range", "palabras_clave": "text"}
+
+def build_urbania_url(zona: str = "", dormitorios: str = "0", banos: str = "0",
+                      price_min: Optional[int] = None, price_max: Optional[int] = None,
+                      palabras_clave: str = "") -> str:
     zona = (zona or "").strip()
     # construir keyword combinando filtros (si el usuario solo pone keyword, la usamos)
     kw_parts = []
@@ -30,54 +49,8 @@ def scrape_urbania(zona: str = "", dormitorios: str = "0", banos: str = "0",
     keyword_value = " ".join(kw_parts).strip()
     # CAMBIO CLAVE: Siempre usar la zona si está especificada, independientemente de las keywords
     if zona:
-        # Mapeo específico para Urbania
-        ZONA_MAPEO_URBANIA = {
-            "ancón": "ancon",
-            "ate": "ate-vitarte",  # Usar ate-vitarte como fallback
-            "barranco": "barranco",
-            "breña": "brena",
-            "carabayllo": "carabayllo",
-            "chaclacayo": "chaclacayo",
-            "chorrillos": "chorrillos",
-            "cieneguilla": "cieneguilla",
-            "comas": "comas",
-            "el agustino": "el-agustino",
-            "independencia": "independencia",
-            "jesús maría": "jesus-maria",
-            "la molina": "la-molina",
-            "la victoria": "la-victoria",
-            "lima": "lima-cercado",
-            "lince": "lince",
-            "los olivos": "los-olivos",
-            "lurigancho": "lurigancho",
-            "lurín": "lurin",
-            "magdalena del mar": "magdalena-del-mar",
-            "miraflores": "miraflores",
-            "pachacámac": "pachacamac",
-            "pucusana": "pucusana",
-            "pueblo libre": "pueblo-libre",
-            "puente piedra": "puente-piedra",
-            "punta hermosa": "punta-hermosa",
-            "punta negra": "punta-negra",
-            "rímac": "rimac",
-            "san bartolo": "san-bartolo",
-            "san borja": "san-borja",
-            "san isidro": "san-isidro",
-            "san juan de lurigancho": "san-juan-de-lurigancho",
-            "san juan de miraflores": "san-juan-de-miraflores",
-            "san luis": "san-luis",
-            "san martín de porres": "san-martin-de-porres",
-            "san miguel": "san-miguel",
-            "santa anita": "santa-anita",
-            "santa maría del mar": "santa-maria-del-mar",
-            "santa rosa": "santa-rosa",
-            "santiago de surco": "santiago-de-surco",
-            "surquillo": "surquillo",
-            "villa el salvador": "villa-el-salvador",
-            "villa maría del triunfo": "villa-maria-del-triunfo"
-        }
-        zona_lower = zona.strip().lower()
-        zone_slug = ZONA_MAPEO_URBANIA.get(zona_lower, slugify_zone(zona))
+        zone = resolve_zone(zona)
+        zone_slug = zone.urbania if zone is not None else slugify_zone(zona)
         base = f"https://urbania.pe/buscar/alquiler-de-departamentos-en-{zone_slug}--lima--lima"
     else:
         base = "https://urbania.pe/buscar/alquiler-de-departamentos"
@@ -95,156 +68,166 @@ def scrape_urbania(zona: str = "", dormitorios: str = "0", banos: str = "0",
     if price_min is not None or price_max is not None:
         params.append("currencyId=6")  # Soles
     url = base + ("?" + "&".join(params) if params else "")
+    return url
+
+# Selectores de card (en orden de preferencia) y de las características de cada card
+URBANIA_CARD_SELECTORS = [
+    "div[data-qa='posting PROPERTY']",
+    "article",
+    "div.postingCard-module__posting",
+    "div.postingCard",
+    "div.posting-card",
+    "div[class*='postingCard']",
+]
+URBANIA_FEATURE = ".postingMainFeatures-module__posting-main-features-span"
+# Título con el total de resultados ("1.234 departamentos en alquiler en ...")
+URBANIA_TOTAL = "h1[data-qa='title-result'], [data-qa='result-total'], h1"
+_RE_URBANIA_TOTAL = re.compile(r"(\d[\d\.,]*)\s+(?:avisos|inmuebles|propiedades|departamentos|casas|resultados)", re.I)
+URBANIA_PAGE_WORKERS = int(os.getenv("URBANIA_PAGE_WORKERS", str(PAGE_WORKERS)))   # páginas descargadas a la vez
+_JS_TEXT = "const e = document.querySelector(arguments[0]); return e ? e.textContent : '';"
+
+# Extracción en el navegador (mismos selectores que el parseo con BeautifulSoup)
+URBANIA_JS_SPEC = {
+    "cards": URBANIA_CARD_SELECTORS,
+    "text": 400,
+    "fields": {
+        "link": {"sel": ["a[href]", "h2 a", "h3 a"], "attr": ["href"]},
+        "link_text": {"sel": ["a[href]", "h2 a", "h3 a"]},
+        "price": {"sel": ["div.postingPrices-module__price", ".first-price", ".price"]},
+        "img": {"sel": ["img"], "attr": ["src", "data-src"]},
+        "features": {"sel": [URBANIA_FEATURE], "all": True},
+    },
+}
+
+def _urbania_row(raw: dict, seen: set) -> Optional[Listing]:
+    """Arma el anuncio con los campos crudos de una card (vengan de BeautifulSoup o del JS)."""
+    link = raw.get("link") or ""
+    if link and link.startswith("/"):
+        link = "https://urbania.pe" + link
+    if not link or link in seen:
+        return None
+    seen.add(link)
+    text = raw.get("text") or ""
+    title = raw.get("link_text") or text[:140]
+    img = raw.get("img") or ""
+    if img and img.startswith("//"): img = "https:" + img
+    feats = label_features(raw.get("features"))
+    return Listing(
+        titulo=title,
+        precio=raw.get("price") or "",
+        m2=feats.m2,
+        dormitorios=feats.dormitorios,
+        banos=feats.banos,
+        descripcion=text[:400],
+        link=link,
+        imagen_url=img.strip()
+    )
+
+def parse_urbania_html(html: str, seen: Optional[set] = None, results: Optional[list] = None) -> list:
+    """
+    Parsea una página de resultados de Urbania (sin navegador) y agrega a `results`
+    los anuncios cuyo link no esté en `seen`.
+    """
+    if seen is None:
+        seen = set()
+    if results is None:
+        results = []
+    page = as_page(html, only=URBANIA_ONLY)
+    # intentar varios selectores
+    cards = []
+    for sel in URBANIA_CARD_SELECTORS:
+        found = page.select(sel)
+        if found:
+            cards = found
+            break
+    for c in cards:
+        if getattr(results, "cancelled", False):
+            break
+        try:
+            a_tag = c.select_one("a[href]") or c.select_one("h2 a") or c.select_one("h3 a")
+            price_el = c.select_one("div.postingPrices-module__price") or c.select_one(".first-price") or c.select_one(".price")
+            img_tag = c.select_one("img")
+            row = _urbania_row({
+                "link": a_tag.get("href") if a_tag else "",
+                "link_text": a_tag.get_text(" ", strip=True) if a_tag else "",
+                "text": c.get_text(" ", strip=True)[:400],
+                "price": price_el.get_text(" ", strip=True) if price_el else "",
+                "img": (img_tag.get("src") or img_tag.get("data-src") or "") if img_tag else "",
+                "features": [f.get_text(" ", strip=True) for f in c.select(URBANIA_FEATURE)],
+            }, seen)
+            if row:
+                results.append(row)
+        except Exception:
+            continue
+    return results
+
+def urbania_page_url(url: str, n: int) -> str:
+    """URL de la página `n` del listado (parámetro page=)."""
+    return set_query_param(url, "page", n if n > 1 else None)
+
+def urbania_result_count(text: str) -> Optional[int]:
+    """Total de resultados a partir del texto del título, o None si no se reconoce."""
+    m = _RE_URBANIA_TOTAL.search(text or "")
+    if not m:
+        return None
+    digits = re.sub(r"\D", "", m.group(1))
+    return int(digits) if digits else None
+
+def _page_rows_driver(driver, url: str, metrics: dict, wait_time: float) -> list:
+    load_page(driver, url, metrics, "urbania")
+    if not wait_for_selector(driver, URBANIA_CARDS, timeout=12):
+        return []
+    # scroll mientras la página siga creciendo (como máximo wait_time por scroll)
+    scroll_until_stable(driver, URBANIA_CARDS, max_scrolls=8, settle=wait_time)
+    items = extract_cards(driver, URBANIA_JS_SPEC, "Urbania")
+    if items:
+        page_seen = set()
+        return append_rows([], items, lambda raw: _urbania_row(raw, page_seen))
+    return parse_urbania_html(driver.page_source)
+
+def scrape_urbania(zona: str = "", dormitorios: str = "0", banos: str = "0",
+                     price_min: Optional[int] = None, price_max: Optional[int] = None,
+                     palabras_clave: str = "", max_pages: int = 6, wait_time: float = 1.5,
+                     max_results: Optional[int] = None):
+    url = build_urbania_url(zona, dormitorios, banos, price_min, price_max, palabras_clave)
     print(f"URL de Urbania: {url}")  # Mostrar URL usada
-    driver = create_driver(headless=True)
-    results = []
+    results = results_buffer()
     seen = set()
+    # Primero HTTP plano: si el HTML del servidor ya trae las cards no hace falta navegador
+    page = fetch_listing(url, URBANIA_CARDS, "urbania", only=URBANIA_ONLY, metrics=results.metrics)
+    if page is not None:
+        results.metrics["engine"] = "http"
+        first = parse_urbania_html(page)
+        merge_new(first, seen, results, max_results)
+        if first:
+            # con el total del título las páginas restantes se conocen de antemano: pedirlas en paralelo
+            title = page.full.select_one(URBANIA_TOTAL)
+            total = urbania_result_count(title.get_text(" ", strip=True) if title else "")
+            http_pages(url, page, "page", parse_urbania_html, "urbania", seen, results, max_pages,
+                       max_results, total=total, per_page=len(first), only=URBANIA_ONLY,
+                       workers=URBANIA_PAGE_WORKERS)
+        return listings_frame(results)
+
+    results.metrics["engine"] = "selenium"
+    driver = acquire_driver()
     try:
-        driver.get(url)
-        # esperar unos segundos por elementos representativos (no bloquear si timeout)
+        first = _page_rows_driver(driver, url, results.metrics, wait_time)
+        merge_new(first, seen, results, max_results)
         try:
-            WebDriverWait(driver, 12).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "article, div[data-qa='posting PROPERTY'], div.postingCard"))
-            )
-        except:
-            pass
-        page_count = 0
-        while page_count < max_pages:
-            page_count += 1
-            last_h = driver.execute_script("return document.body.scrollHeight")
-            for _ in range(8):
-                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(wait_time)
-                new_h = driver.execute_script("return document.body.scrollHeight")
-                if new_h == last_h:
-                    break
-                last_h = new_h
-            soup = BeautifulSoup(driver.page_source, "html.parser")
-            # intentar varios selectores
-            card_selectors = [
-                "div[data-qa='posting PROPERTY']",
-                "article",
-                "div.postingCard-module__posting",
-                "div.postingCard",
-                "div.posting-card",
-                "div[class*='postingCard']",
-            ]
-            cards = []
-            for sel in card_selectors:
-                found = soup.select(sel)
-                if found and len(found) > 0:
-                    cards = found
-                    break
-            if not cards:
-                cards = soup.select("a[href]")[:0]  # vacío
-            prev_len = len(results)
-            for c in cards:
-                try:
-                    a_tag = c.select_one("a[href]") or c.select_one("h2 a") or c.select_one("h3 a")
-                    link = a_tag.get("href") if a_tag else ""
-                    if link and link.startswith("/"):
-                        link = "https://urbania.pe" + link
-                    if not link:
-                        continue
-                    if link in seen:
-                        continue
-                    seen.add(link)
-                    title = a_tag.get_text(" ", strip=True) if a_tag and a_tag.get_text(strip=True) else (c.get_text(" ", strip=True)[:140])
-                    price_el = c.select_one("div.postingPrices-module__price") or c.select_one(".first-price") or c.select_one(".price")
-                    price = price_el.get_text(" ", strip=True) if price_el else ""
-                    desc = c.get_text(" ", strip=True)[:400]
-                    img = ""
-                    img_tag = c.select_one("img")
-                    if img_tag:
-                        img = img_tag.get("src") or img_tag.get("data-src") or ""
-                        if img and img.startswith("//"): img = "https:" + img
-                        # Limpiar espacios al final
-                        img = img.strip()
-                    # EXTRAER DORMITORIOS
-                    dormitorios_text = ""
-                    dorm_elem = c.select_one(".postingMainFeatures-module__posting-main-features-span:-soup-contains('dorm.')")
-                    if dorm_elem:
-                        dorm_text = dorm_elem.get_text(" ", strip=True)
-                        dorm_match = re.search(r'(\d+)', dorm_text)
-                        if dorm_match:
-                            dormitorios_text = dorm_match.group(1)
-                    # EXTRAER BAÑOS
-                    banos_text = ""
-                    banos_elem = c.select_one(".postingMainFeatures-module__posting-main-features-span:contains('baño')")
-                    if banos_elem:
-                        banos_text_full = banos_elem.get_text(" ", strip=True)
-                        banos_match = re.search(r'(\d+)', banos_text_full)
-                        if banos_match:
-                            banos_text = banos_match.group(1)
-                    # EXTRAER METROS CUADRADOS
-                    m2_text = ""
-                    m2_elem = c.select_one(".postingMainFeatures-module__posting-main-features-span:contains('m²')")
-                    if m2_elem:
-                        m2_text_full = m2_elem.get_text(" ", strip=True)
-                        m2_match = re.search(r'(\d+)', m2_text_full)
-                        if m2_match:
-                            m2_text = m2_match.group(1)
-                    # AHORA INCLUIMOS LOS VALORES EXTRAÍDOS
-                    results.append({
-                        "titulo": title,
-                        "precio": price,
-                        "m2": m2_text,
-                        "dormitorios": dormitorios_text,
-                        "baños": banos_text,
-                        "descripcion": desc,
-                        "link": link,
-                        "imagen_url": img
-                    })
-                except Exception:
-                    continue
-            # si no hay nuevos resultados intentar paginar/click "cargar más"
-            if len(results) == prev_len:
-                clicked = False
-                try:
-                    # probar varios selectores para "cargar más" / siguiente
-                    next_selectors = [
-                        "a[rel='next']", "a[aria-label='Siguiente']", "a[data-qa='pagination-next']",
-                        "button[data-qa='pagination-next']", "a.pagination__next", "a.next", "button.load-more", "a.load-more"
-                    ]
-                    for sel in next_selectors:
-                        elems = driver.find_elements(By.CSS_SELECTOR, sel)
-                        for e in elems:
-                            try:
-                                if e.is_displayed():
-                                    driver.execute_script("arguments[0].scrollIntoView(true);", e)
-                                    time.sleep(0.2)
-                                    e.click()
-                                    time.sleep(wait_time + 0.5)
-                                    clicked = True
-                                    break
-                            except:
-                                continue
-                        if clicked:
-                            break
-                except:
-                    clicked = False
-                if not clicked:
-                    # intentar incrementar page= en URL
-                    cur = driver.current_url
-                    m = re.search(r"([?&]page=)(\d+)", cur)
-                    if m:
-                        cur_page = int(m.group(2))
-                        next_page = cur_page + 1
-                        new_url = re.sub(r"([?&]page=)\d+", r"\1{}".format(next_page), cur)
-                        try:
-                            driver.get(new_url)
-                            time.sleep(wait_time + 0.8)
-                            clicked = True
-                        except:
-                            clicked = False
-                if not clicked:
-                    break
-            time.sleep(0.4)
-        return pd.DataFrame(results)
-    except Exception:
-        return pd.DataFrame()
+            title = driver.execute_script(_JS_TEXT, URBANIA_TOTAL) or ""
+        except Exception:
+            title = ""
+        plan = page_plan(urbania_result_count(title), len(first), max_pages)
+        if not first or not plan or results.cancelled:
+            return listings_frame(results)
+        urls = [urbania_page_url(url, n) for n in plan]
+        page_rows = lambda d, u: _page_rows_driver(d, u, results.metrics, wait_time)
+        with driver_fanout(driver, min(URBANIA_PAGE_WORKERS, len(plan)), page_rows) as fetch_one:
+            fetch_pages(urls, fetch_one, seen, results, fetch_one.workers, max_results)
+        return listings_frame(results)
+    except Exception as e:
+        print(f"Error en Urbania scraper: {e}")
+        results.metrics["error"] = str(e)
+        return listings_frame(results)
     finally:
-        try:
-            driver.quit()
-        except:
-            pass
\ No newline at end of file
+        release_driver(driver)
@@ -0,0 +1,195 @@
+import os
+from collections import defaultdict
+from typing import Optional
+
+# Imports locales desde el módulo 'common'
+from .common import normalize_text, slugify_zone
+
+# -------------------- Registro de zonas --------------------
+# Un solo registro, armado al importar: distritos canónicos, alias sin acentos y el slug / ID
+# de cada fuente ya calculados. La zona que escribe el usuario se resuelve una vez (exacta,
+# por alias o, si tiene un error de tipeo, por el índice de trigramas).
+# Configuración (se puede sobreescribir por variables de entorno)
+ZONE_MATCH_THRESHOLD = float(os.getenv("ZONE_MATCH_THRESHOLD", "0.6"))  # similitud (Dice de trigramas) mínima
+# con otra cantidad de palabras ("lima norte" -> lima, "barranco centro") hace falta mucho más
+ZONE_PARTIAL_THRESHOLD = float(os.getenv("ZONE_PARTIAL_THRESHOLD", "0.8"))
+
+# Distritos de Lima (nombre canónico, con acentos)
+ZONAS_LIMA = [
+    "ancón", "ate", "barranco", "breña", "carabayllo", "chaclacayo", "chorrillos",
+    "cieneguilla", "comas", "el agustino", "independencia", "jesús maría", "la molina",
+    "la victoria", "lima", "lince", "los olivos", "lurigancho", "lurín", "magdalena del mar",
+    "miraflores", "pachacámac", "pucusana", "pueblo libre", "puente piedra", "punta hermosa",
+    "punta negra", "rímac", "san bartolo", "san borja", "san isidro", "san juan de lurigancho",
+    "san juan de miraflores", "san luis", "san martín de porres", "san miguel", "santa anita",
+    "santa maría del mar", "santa rosa", "santiago de surco", "surquillo", "villa el salvador",
+    "villa maría del triunfo",
+]
+
+# Otros nombres con los que se busca un distrito (sin acentos: se comparan ya normalizados)
+ALIASES = {
+    "cercado": "lima", "cercado de lima": "lima", "cercado lima": "lima", "lima cercado": "lima",
+    "ate vitarte": "ate", "vitarte": "ate",
+    "magdalena": "magdalena del mar",
+    "surco": "santiago de surco",
+    "sjl": "san juan de lurigancho",
+    "sjm": "san juan de miraflores",
+    "smp": "san martín de porres",
+    "ves": "villa el salvador",
+    "vmt": "villa maría del triunfo",
+    "lurigancho chosica": "lurigancho", "chosica": "lurigancho",
+}
+
+# Slugs que no salen de slugify_zone(distrito) en cada fuente
+SLUG_EXCEPTIONS = {
+    "urbania": {"ate": "ate-vitarte", "lima": "lima-cercado"},
+    "infocasas": {"breña": "breña", "lima": "lima-cercado"},
+    "properati": {"lima": "lima-cercado"},
+}
+
+# Nestoria antepone "lima_" a los nombres que se repiten en otras regiones
+NESTORIA_EXCEPCIONES = ["miraflores", "tarapoto", "la molina", "magdalena", "lambayeque", "ventanilla", "la victoria"]
+
+# Doomos busca por ID de localidad (loc_id); los distritos sin ID van solo por nombre
+DOOMOS_LOC_IDS = {
+    "ancón": "-336912",
+    "ate": "-337679",
+    "breña": "65645345",
+    "carabayllo": "-339907",
+    "chaclacayo": "-341190",
+    "chorrillos": "-342811",
+    "cieneguilla": "-343329",
+    "comas": "-343903",
+    "el agustino": "-345552",
+    "jesús maría": "348294",
+    "la molina": "-351740",
+    "la victoria": "-352442",
+    "lima": "45343445",  # Cercado de Lima
+    "lince": "-352696",
+    "los olivos": "191126",
+    "lurigancho": "-353648",
+    "lurín": "-353652",
+    "magdalena del mar": "326245",
+    "miraflores": "-354864",
+    "pachacámac": "-356636",
+    "pucusana": "-359672",
+    "pueblo libre": "-359690",
+    "puente piedra": "-359759",
+    "punta hermosa": "-360186",
+    "punta negra": "-360189",
+    "rímac": "-361308",
+    "san bartolo": "-362154",
+    "san borja": "-362170",
+    "san isidro": "-362425",
+    "san luis": "-362738",
+    "san miguel": "-362804",
+    "santiago de surco": "-364705",
+    "surquillo": "-364723",
+}
+
+def zone_key(zona: str) -> str:
+    """Clave de comparación: sin acentos, minúsculas y espacios simples."""
+    return " ".join(normalize_text(zona or "").replace("-", " ").split())
+
+def nestoria_slug(zona: str) -> str:
+    z = zona.strip().lower().replace(" ", "-")
+    return "lima_" + z if zona.strip().lower() in NESTORIA_EXCEPCIONES else z
+
+def _nestoria_zone_slug(name: str, aliases) -> str:
+    """Slug de Nestoria del distrito: si él o un alias está en NESTORIA_EXCEPCIONES, el de la excepción."""
+    for candidate in (name, *aliases):
+        if candidate in NESTORIA_EXCEPCIONES:
+            return nestoria_slug(candidate)
+    return nestoria_slug(zone_key(name))
+
+def _trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class Zone:
+    """Un distrito con su slug (o ID) en cada fuente."""
+    __slots__ = ("name", "key", "urbania", "infocasas", "properati", "nestoria", "doomos_id")
+
+    def __init__(self, name: str, aliases=()):
+        self.name = name
+        self.key = zone_key(name)
+        slug = slugify_zone(name)
+        self.urbania = SLUG_EXCEPTIONS["urbania"].get(name, slug)
+        self.infocasas = SLUG_EXCEPTIONS["infocasas"].get(name, slug)
+        self.properati = SLUG_EXCEPTIONS["properati"].get(name, slug)
+        # "magdalena" (alias de magdalena del mar) es "lima_magdalena" en Nestoria
+        self.nestoria = _nestoria_zone_slug(name, aliases)
+        self.doomos_id = DOOMOS_LOC_IDS.get(name, "")
+
+    def __repr__(self):
+        return f"Zone({self.name!r})"
+
+class ZoneRegistry:
+    """Distritos por clave normalizada (nombre o alias) y un índice de trigramas para los errores de tipeo."""
+    def __init__(self, names=ZONAS_LIMA, aliases=ALIASES, threshold: float = ZONE_MATCH_THRESHOLD,
+                 partial_threshold: float = ZONE_PARTIAL_THRESHOLD):
+        self.threshold = threshold
+        self.partial_threshold = partial_threshold
+        self.zones = [Zone(n, [a for a, target in aliases.items() if target == n]) for n in names]
+        by_name = {z.name: z for z in self.zones}
+        self._by_key = {z.key: z for z in self.zones}
+        for alias, name in aliases.items():
+            self._by_key.setdefault(zone_key(alias), by_name[name])
+        self._keys = list(self._by_key)
+        self._grams = [_trigrams(k) for k in self._keys]
+        self._index = defaultdict(list)  # trigrama -> posiciones en _keys
+        for i, grams in enumerate(self._grams):
+            for g in grams:
+                self._index[g].append(i)
+        self._misses = {}  # clave -> Zone o None (lo ya resuelto por similitud)
+
+    def _closest(self, key: str) -> Optional[Zone]:
+        grams = _trigrams(key)
+        shared = defaultdict(int)
+        for g in grams:
+            for i in self._index.get(g, ()):
+                shared[i] += 1
+        words = len(key.split())
+        scores = {}
+        for i, n in shared.items():
+            score = 2 * n / (len(grams) + len(self._grams[i]))
+            if len(self._keys[i].split()) != words and score < self.partial_threshold:
+                continue  # coincide solo una parte ("lima norte" no es lima)
+            zone = self._by_key[self._keys[i]]
+            scores[zone] = max(scores.get(zone, 0.0), score)
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        if not ranked or ranked[0][1] < self.threshold:
+            return None
+        # ambiguo ("santa" -> santa rosa / santa anita): mejor no adivinar
+        if len(ranked) > 1 and ranked[1][1] > ranked[0][1] - 0.05:
+            return None
+        return ranked[0][0]
+
+    def resolve(self, zona: str) -> Optional[Zone]:
+        """Zone de lo que escribió el usuario, o None si vacío o no se parece a ningún distrito."""
+        key = zone_key(zona)
+        if not key:
+            return None
+        zone = self._by_key.get(key)
+        if zone is not None:
+            return zone
+        if len(key) < 4:
+            return None
+        if key not in self._misses:
+            if len(self._misses) > 10000:
+                self._misses.clear()
+            self._misses[key] = self._closest(key)
+        return self._misses[key]
+
+    def canonical(self, zona: str) -> str:
+        """Nombre canónico del distrito, o la zona tal cual (sin espacios de más) si no se reconoce."""
+        zone = self.resolve(zona)
+        return zone.name if zone is not None else (zona or "").strip()
+
+ZONES = ZoneRegistry()
+
+def resolve_zone(zona: str) -> Optional[Zone]:
+    return ZONES.resolve(zona)
+
+def canonical_zone(zona: str) -> str:
+    return ZONES.canonical(zona)
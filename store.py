@@ -0,0 +1,217 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+from scrapers.common import (
+    DATA_DIR,
+    canonical_link,
+    normalize_text,
+    parse_precio_con_moneda,
+    _extract_int_from_text
+)
+from scrapers.prices import to_soles
+
+# -------------------- Store persistente de anuncios --------------------
+# Configuración (se puede sobreescribir por variables de entorno)
+STORE_ENABLED = os.getenv("STORE_ENABLED", "1") not in ("0", "false", "False")
+STORE_PATH = os.getenv("STORE_PATH", os.path.join(DATA_DIR, "anuncios.sqlite"))
+STORE_MAX_AGE_DAYS = float(os.getenv("STORE_MAX_AGE_DAYS", "14"))  # anuncios no vistos hace más se ignoran al consultar
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS anuncios (
+    link TEXT PRIMARY KEY,          -- link canónico
+    fuente TEXT NOT NULL,
+    zona TEXT NOT NULL DEFAULT '',  -- zona (normalizada) de la búsqueda que lo encontró
+    titulo TEXT,
+    precio TEXT,                    -- texto original del precio
+    moneda TEXT,                    -- "S" / "USD" / NULL
+    precio_valor INTEGER,
+    precio_soles INTEGER,
+    dormitorios INTEGER,
+    banos INTEGER,
+    m2 INTEGER,
+    descripcion TEXT,
+    imagen_url TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_anuncios_zona ON anuncios(zona, last_seen);
+CREATE INDEX IF NOT EXISTS idx_anuncios_precio ON anuncios(precio_soles);
+CREATE INDEX IF NOT EXISTS idx_anuncios_dorms ON anuncios(dormitorios, banos);
+"""
+
+UPSERT_SQL = """
+INSERT INTO anuncios (link, fuente, zona, titulo, precio, moneda, precio_valor, precio_soles,
+                      dormitorios, banos, m2, descripcion, imagen_url, first_seen, last_seen)
+VALUES (:link, :fuente, :zona, :titulo, :precio, :moneda, :precio_valor, :precio_soles,
+        :dormitorios, :banos, :m2, :descripcion, :imagen_url, :now, :now)
+ON CONFLICT(link) DO UPDATE SET
+    fuente = excluded.fuente,
+    zona = CASE WHEN excluded.zona != '' THEN excluded.zona ELSE anuncios.zona END,
+    titulo = excluded.titulo,
+    precio = excluded.precio,
+    moneda = excluded.moneda,
+    precio_valor = excluded.precio_valor,
+    precio_soles = excluded.precio_soles,
+    dormitorios = COALESCE(excluded.dormitorios, anuncios.dormitorios),
+    banos = COALESCE(excluded.banos, anuncios.banos),
+    m2 = COALESCE(excluded.m2, anuncios.m2),
+    descripcion = excluded.descripcion,
+    imagen_url = CASE WHEN excluded.imagen_url != '' THEN excluded.imagen_url ELSE anuncios.imagen_url END,
+    last_seen = excluded.last_seen
+"""
+
+OUTPUT_COLUMNS = ["titulo", "precio", "m2", "dormitorios", "baños", "descripcion", "link", "imagen_url", "fuente"]
+
+def _s(v) -> str:
+    """Valor de celda a string limpio (None / NaN -> "")."""
+    if v is None or (isinstance(v, float) and v != v):
+        return ""
+    return str(v).strip()
+
+def _n(v) -> Optional[int]:
+    """Número ya parseado (float con NaN en los frames de listings_frame) a int o None."""
+    if v is None or v != v or v == "":
+        return None
+    return int(v)
+
+def _typed_row(rec: dict, fuente: str, zona: str, now: float):
+    link = canonical_link(_s(rec.get("link")))
+    if not link or link.startswith("#"):
+        return None
+    precio = _s(rec.get("precio"))
+    if "precio_valor" in rec:
+        # fila de listings_frame: moneda y números ya vienen parseados desde el Listing
+        moneda, valor = rec.get("moneda") or None, _n(rec.get("precio_valor"))
+        soles = _n(rec.get("precio_pen"))
+        dormitorios, banos, m2 = _n(rec.get("dormitorios_num")), _n(rec.get("banos_num")), _n(rec.get("m2_num"))
+    else:
+        moneda, valor = parse_precio_con_moneda(precio)
+        soles = to_soles(moneda, valor)
+        dormitorios = _extract_int_from_text(_s(rec.get("dormitorios")) or None)
+        banos = _extract_int_from_text(_s(rec.get("baños")) or None)
+        m2 = _extract_int_from_text(_s(rec.get("m2")) or None)
+    return {
+        "link": link,
+        "fuente": _s(rec.get("fuente")) or fuente,
+        "zona": zona,
+        "titulo": _s(rec.get("titulo")),
+        "precio": precio,
+        "moneda": moneda,
+        "precio_valor": valor,
+        "precio_soles": soles,  # dólares convertidos con prices.TASAS_A_SOLES
+        "dormitorios": dormitorios,
+        "banos": banos,
+        "m2": m2,
+        "descripcion": _s(rec.get("descripcion")),
+        "imagen_url": _s(rec.get("imagen_url")),
+        "now": now,
+    }
+
+class ListingStore:
+    """Anuncios scrapeados guardados en SQLite, con upsert por link canónico."""
+    def __init__(self, path: str = STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=15)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def upsert(self, records, fuente: str = "", zona: str = "") -> int:
+        """Inserta o actualiza los anuncios (lista de dicts o DataFrame). Devuelve cuántos se guardaron."""
+        if records is None:
+            return 0
+        if hasattr(records, "to_dict"):
+            records = records.to_dict("records")
+        now = time.time()
+        zona_norm = " ".join(normalize_text(zona or "").split())
+        rows = [r for r in (_typed_row(rec, fuente, zona_norm, now) for rec in records) if r]
+        if not rows:
+            return 0
+        with self._lock, self._connect() as conn:
+            conn.executemany(UPSERT_SQL, rows)
+        return len(rows)
+
+    def search(self, zona: str = "", dormitorios: str = "0", banos: str = "0",
+               price_min: Optional[int] = None, price_max: Optional[int] = None,
+               palabras_clave: str = "", fuente: str = "", max_age_days: float = STORE_MAX_AGE_DAYS,
+               limit: int = 500):
+        """Busca en el store con la misma semántica que _filter_df_strict / _filter_by_keywords."""
+        where = []
+        args = []
+        zona_norm = " ".join(normalize_text(zona or "").split())
+        if zona_norm:
+            where.append("zona = ?")
+            args.append(zona_norm)
+        if dormitorios and str(dormitorios).isdigit() and str(dormitorios) != "0":
+            where.append("dormitorios = ?")
+            args.append(int(dormitorios))
+        if banos and str(banos).isdigit() and str(banos) != "0":
+            where.append("banos = ?")
+            args.append(int(banos))
+        if price_min is not None or price_max is not None:
+            where.append("precio_soles IS NOT NULL")
+            if price_min is not None:
+                where.append("precio_soles >= ?")
+                args.append(int(price_min))
+            if price_max is not None:
+                where.append("precio_soles <= ?")
+                args.append(int(price_max))
+        if fuente:
+            where.append("fuente = ?")
+            args.append(fuente)
+        for p in (palabras_clave or "").lower().split():
+            where.append("(LOWER(titulo) LIKE ? OR LOWER(descripcion) LIKE ?)")
+            args += [f"%{p}%", f"%{p}%"]
+        if max_age_days:
+            where.append("last_seen >= ?")
+            args.append(time.time() - max_age_days * 86400)
+        sql = ("SELECT titulo, precio, m2, dormitorios, banos, descripcion, link, imagen_url, fuente "
+               "FROM anuncios")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY last_seen DESC LIMIT ?"
+        args.append(int(limit))
+        with self._connect() as conn:
+            rows = conn.execute(sql, args).fetchall()
+        results = []
+        for row in rows:
+            rec = dict(zip(OUTPUT_COLUMNS, row))
+            # mismo formato que devuelven los scrapers (strings)
+            for col in ("m2", "dormitorios", "baños"):
+                rec[col] = "" if rec[col] is None else str(rec[col])
+            results.append(rec)
+        return results
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store() -> ListingStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ListingStore()
+        return _store
+
+def save_scraped(records, fuente: str = "", zona: str = ""):
+    """Guarda los anuncios de un scrape si el store está activado (nunca rompe el scrape)."""
+    if not STORE_ENABLED:
+        return 0
+    try:
+        return get_store().upsert(records, fuente=fuente, zona=zona)
+    except Exception as e:
+        print(f"Error guardando anuncios en el store: {e}")
+        return 0